@@ -2,11 +2,14 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete
 from app.db.session import get_db
-from app.core.deps_api import get_current_user_api, require_admin_api
+from app.core.deps_api import require_admin_api
 from app.db.models.user import User, Role
 from app.db.models.wa_number import WhatsAppNumber
 from app.db.models.assignment import Assignment
-from app.core.security import hash_password
+from app.core.security import hash_password_async
+from app.services.workers import queue_stats
+from app.services.metrics import metrics
+from app.services.refcache import refcache
 
 router = APIRouter(prefix="/admin")
 
@@ -23,9 +26,10 @@ async def create_user(payload: dict, db: AsyncSession = Depends(get_db), admin:
     role = payload.get("role") or "employee"
     if not username or not password:
         raise HTTPException(400, "username/password required")
-    u = User(username=username, name=name, password_hash=hash_password(password), role=Role(role))
+    u = User(username=username, name=name, password_hash=await hash_password_async(password), role=Role(role))
     db.add(u)
     await db.commit()
+    await refcache.invalidate("users")
     return {"ok": True, "id": u.id}
 
 @router.get("/numbers")
@@ -42,6 +46,7 @@ async def create_number(payload: dict, db: AsyncSession = Depends(get_db), admin
     n = WhatsAppNumber(display_name=display_name, phone_number_id=phone_number_id, is_active=True)
     db.add(n)
     await db.commit()
+    await refcache.invalidate("numbers")
     return {"ok": True, "id": n.id}
 
 @router.post("/assign")
@@ -53,4 +58,17 @@ async def assign(payload: dict, db: AsyncSession = Depends(get_db), admin: User
     for nid in number_ids:
         db.add(Assignment(user_id=user_id, wa_number_id=int(nid)))
     await db.commit()
+    await refcache.invalidate("assignments")
     return {"ok": True}
+
+@router.get("/queues")
+async def queues(admin: User = Depends(require_admin_api)):
+    return await queue_stats()
+
+@router.get("/ingest")
+async def ingest_stats(admin: User = Depends(require_admin_api)):
+    return {
+        "duplicates_dropped": {
+            stage: metrics.value("webhook_duplicates_dropped_total", stage=stage) for stage in ("batch", "cache", "db", "archive")
+        },
+    }
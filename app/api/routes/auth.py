@@ -1,18 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.db.session import get_db
 from app.db.models.user import User
-from app.core.security import verify_password, create_access_token
+from app.core.security import verify_password_async, create_access_token, PasswordHasherBusy
+from app.services import login_throttle
 
 router = APIRouter(prefix="/auth")
 
 @router.post("/login")
-async def login(form: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+async def login(request: Request, form: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    ip = request.client.host if request.client else "-"
+    if await login_throttle.is_throttled(form.username, ip):
+        raise HTTPException(status_code=429, detail="Too many failed attempts, try again later")
+
     q = await db.execute(select(User).where(User.username == form.username))
     user = q.scalar_one_or_none()
-    if not user or not user.is_active or not verify_password(form.password, user.password_hash):
+    try:
+        ok = bool(user and user.is_active and await verify_password_async(form.password, user.password_hash))
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Busy, try again")
+    if not ok:
+        await login_throttle.record_failure(form.username, ip)
         raise HTTPException(status_code=400, detail="Invalid credentials")
+    await login_throttle.record_success(form.username)
     token = create_access_token(sub=user.username)
     return {"access_token": token, "token_type": "bearer"}
@@ -1,40 +1,153 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
+from sqlalchemy import select
 from datetime import datetime, timedelta, timezone
 
 from app.db.session import get_db
 from app.core.deps_api import get_current_user_api
-from app.db.models.user import User, Role
-from app.db.models.assignment import Assignment
-from app.db.models.wa_number import WhatsAppNumber
-from app.db.models.conversation import Conversation
-from app.db.models.message import Message, Direction
-from app.services.locks import acquire_lock, get_lock_owner, refresh_lock
-from app.services.whatsapp_cloud import send_text_message
+from app.db.models.user import User
+from app.db.models.conversation import Conversation, ConversationStatus
+from app.db.models.message import Message
+from app.services.locks import acquire_lock, touch_lock, release_lock, lock_owners, LOCK_TTL
+from app.services.broadcaster import broadcaster
+from app.services.outbox import queue_reply
+from app.services.media import media_response
+from app.services import counters, read_state
+from app.services.refcache import refcache
+from app.services.events import aware, message_json, conversation_json, conversation_status, conversation_lock, search_hit_json
+from app.services.timeline import conversation_page, message_page, clamp_limit, CONVERSATIONS_PAGE, MESSAGES_PAGE
+from app.services.search import search_messages, search_customers, SEARCH_PAGE, MAX_SEARCH_PAGE
 
 router = APIRouter(prefix="/inbox")
 
 async def allowed_number_ids(db: AsyncSession, user: User) -> list[int]:
-    if user.role == Role.admin:
-        q = await db.execute(select(WhatsAppNumber.id))
-        return [x[0] for x in q.all()]
-    q = await db.execute(select(Assignment.wa_number_id).where(Assignment.user_id == user.id))
-    return [x[0] for x in q.all()]
+    return await refcache.visible_number_ids(db, user)
 
 @router.get("/numbers")
 async def list_numbers(user: User = Depends(get_current_user_api), db: AsyncSession = Depends(get_db)):
+    ids = set(await allowed_number_ids(db, user))
+    return [n for n in await refcache.numbers(db) if n.id in ids]
+
+@router.get("/numbers/{number_id}/conversations")
+async def list_conversations(
+    number_id: int,
+    cursor: str | None = None,
+    limit: int = CONVERSATIONS_PAGE,
+    user: User = Depends(get_current_user_api),
+    db: AsyncSession = Depends(get_db),
+):
+    if number_id not in await allowed_number_ids(db, user):
+        raise HTTPException(403, "Not allowed")
+    try:
+        rows, next_cursor = await conversation_page(db, number_id, cursor, clamp_limit(limit, CONVERSATIONS_PAGE))
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+    owners = await lock_owners([c.id for c in rows])
+    unread = await read_state.unread_counts(user.id, rows)
+    return {
+        "items": [{**conversation_json(c), "locked_by": owners[c.id], "unread": unread[c.id]} for c in rows],
+        "next_cursor": next_cursor,
+    }
+
+@router.get("/search")
+async def search(
+    q: str,
+    number_id: int | None = None,
+    offset: int = 0,
+    limit: int = SEARCH_PAGE,
+    user: User = Depends(get_current_user_api),
+    db: AsyncSession = Depends(get_db),
+):
     ids = await allowed_number_ids(db, user)
-    q = await db.execute(select(WhatsAppNumber).where(WhatsAppNumber.id.in_(ids)).order_by(WhatsAppNumber.id))
-    return q.scalars().all()
+    if number_id is not None:
+        if number_id not in ids:
+            raise HTTPException(403, "Not allowed")
+        ids = [number_id]
+    rows, next_offset = await search_messages(db, ids, q, max(0, offset), max(1, min(limit, MAX_SEARCH_PAGE)))
+    customers = await search_customers(db, ids, q) if offset <= 0 else []
+    return {
+        "customers": [conversation_json(c) for c in customers],
+        "items": [search_hit_json(*row) for row in rows],
+        "next_offset": next_offset,
+    }
+
+@router.get("/conversations/{conversation_id}/messages")
+async def list_messages(
+    conversation_id: int,
+    before: str | None = None,
+    limit: int = MESSAGES_PAGE,
+    user: User = Depends(get_current_user_api),
+    db: AsyncSession = Depends(get_db),
+):
+    conv = (await db.execute(select(Conversation).where(Conversation.id == conversation_id))).scalar_one_or_none()
+    if not conv:
+        raise HTTPException(404, "Not found")
+    if conv.wa_number_id not in await allowed_number_ids(db, user):
+        raise HTTPException(403, "Not allowed")
+    try:
+        rows, older = await message_page(db, conv.id, before, clamp_limit(limit, MESSAGES_PAGE), archived=conv.archived_until is not None)
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+    if not before:
+        # the latest page: the client opened the thread
+        await read_state.mark_read(user.id, conv)
+    return {"items": [message_json(m) for m in rows], "older_cursor": older}
+
+@router.get("/messages/{message_id}/media")
+async def get_media(message_id: int, request: Request, user: User = Depends(get_current_user_api), db: AsyncSession = Depends(get_db)):
+    row = (await db.execute(
+        select(Message, Conversation.wa_number_id)
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .where(Message.id == message_id)
+    )).one_or_none()
+    if not row:
+        raise HTTPException(404, "Not found")
+    if row[1] not in await allowed_number_ids(db, user):
+        raise HTTPException(403, "Not allowed")
+    return await media_response(request, row[0])
+
+async def visible_conversation(db: AsyncSession, user: User, conversation_id: int) -> Conversation:
+    conv = (await db.execute(select(Conversation).where(Conversation.id == conversation_id))).scalar_one_or_none()
+    if not conv:
+        raise HTTPException(404, "Not found")
+    if conv.wa_number_id not in await allowed_number_ids(db, user):
+        raise HTTPException(403, "Not allowed")
+    return conv
 
 @router.post("/conversations/{conversation_id}/lock")
-async def lock_conversation(conversation_id: int, user: User = Depends(get_current_user_api)):
-    ok = await acquire_lock(conversation_id, user.id, ttl_seconds=600)
-    if not ok:
-        owner = await get_lock_owner(conversation_id)
+async def lock_conversation(conversation_id: int, user: User = Depends(get_current_user_api), db: AsyncSession = Depends(get_db)):
+    conv = await visible_conversation(db, user, conversation_id)
+    owner = await acquire_lock(conv.id, user.id, LOCK_TTL)
+    if owner != user.id:
         raise HTTPException(409, detail={"locked_by": owner})
-    return {"ok": True, "locked_by": user.id, "ttl": 600}
+    await broadcaster.broadcast(*conversation_lock(conv.wa_number_id, conv.id, user.id, LOCK_TTL))
+    return {"ok": True, "locked_by": user.id, "ttl": LOCK_TTL}
+
+@router.delete("/conversations/{conversation_id}/lock")
+async def unlock_conversation(conversation_id: int, user: User = Depends(get_current_user_api), db: AsyncSession = Depends(get_db)):
+    conv = await visible_conversation(db, user, conversation_id)
+    if not await release_lock(conv.id, user.id):
+        raise HTTPException(409, "Not the lock holder")
+    await broadcaster.broadcast(*conversation_lock(conv.wa_number_id, conv.id, None))
+    return {"ok": True}
+
+@router.post("/conversations/{conversation_id}/status")
+async def set_status(conversation_id: int, payload: dict, user: User = Depends(get_current_user_api), db: AsyncSession = Depends(get_db)):
+    try:
+        status = ConversationStatus(payload.get("status"))
+    except ValueError:
+        raise HTTPException(400, "status must be one of: open, pending, done")
+
+    conv = (await db.execute(select(Conversation).where(Conversation.id == conversation_id))).scalar_one_or_none()
+    if not conv:
+        raise HTTPException(404, "Not found")
+    if conv.wa_number_id not in await allowed_number_ids(db, user):
+        raise HTTPException(403, "Not allowed")
+
+    if await counters.change_status(db, conv, status):
+        await db.commit()
+        await broadcaster.broadcast(*conversation_status(conv))
+    return {"ok": True, "status": conv.status.value}
 
 @router.post("/conversations/{conversation_id}/reply")
 async def reply(conversation_id: int, payload: dict, user: User = Depends(get_current_user_api), db: AsyncSession = Depends(get_db)):
@@ -50,26 +163,12 @@ async def reply(conversation_id: int, payload: dict, user: User = Depends(get_cu
     if conv.wa_number_id not in ids:
         raise HTTPException(403, "Not allowed")
 
-    owner = await get_lock_owner(conversation_id)
+    owner = await touch_lock(conversation_id, user.id, LOCK_TTL)
     if owner is not None and owner != user.id:
         raise HTTPException(409, detail={"locked_by": owner})
-    if owner == user.id:
-        await refresh_lock(conversation_id, user.id, ttl_seconds=600)
 
-    if conv.last_inbound_at and conv.last_inbound_at < datetime.now(timezone.utc) - timedelta(hours=24):
+    if conv.last_inbound_at and aware(conv.last_inbound_at) < datetime.now(timezone.utc) - timedelta(hours=24):
         raise HTTPException(400, "Outside 24-hour window (template required)")
 
-    wa_num = (await db.execute(select(WhatsAppNumber).where(WhatsAppNumber.id == conv.wa_number_id))).scalar_one()
-    res = await send_text_message(wa_num.phone_number_id, conv.customer_wa_id, text)
-
-    meta_id = None
-    try:
-        meta_id = res.get("messages", [{}])[0].get("id")
-    except Exception:
-        pass
-
-    msg = Message(conversation_id=conv.id, direction=Direction.OUT, body=text, meta_message_id=meta_id)
-    db.add(msg)
-    conv.last_message_at = datetime.now(timezone.utc)
-    await db.commit()
-    return {"ok": True, "meta": res}
+    msg = await queue_reply(db, conv, text)
+    return {"ok": True, "message_id": msg.id, "status": msg.status.value}
@@ -1,13 +1,138 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+"""One authenticated WebSocket per session, multiplexing every number its user can see.
+
+Authenticated by the web session cookie (same-origin only) or a bearer token (`?token=` or an
+Authorization header, for API clients). On connect the socket joins the rooms of all visible numbers
+(or only those of `?numbers=1,2`, as a page showing one number asks for) and the user's own room, and
+receives {"event": "ws:ready", "numbers": [...]}. Clients may narrow or
+widen that with {"op": "unsubscribe" | "subscribe", "numbers": [ids]} (subscribe without numbers = all
+visible); requests for numbers the user cannot see are ignored. The server sends {"event": "ping"}
+every WS_HEARTBEAT_SECONDS, answer with "pong" (any message counts); silent sockets are closed after
+WS_IDLE_TIMEOUT_SECONDS. Assignment changes are applied at the next heartbeat.
+"""
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+
+from app.core.config import settings
+from app.core.security import decode_token
+from app.db.models.user import User
+from app.db.session import AsyncSessionLocal
 from app.services.broadcaster import broadcaster
+from app.services.events import number_room, user_room
+from app.services.metrics import metrics
+from app.services.refcache import refcache
+from app.web.routes import get_web_user
 
 router = APIRouter(prefix="/ws")
 
+IDLE_CLOSE_CODE = 1001  # "going away"; the browser reconnects
+
+def same_origin(ws: WebSocket) -> bool:
+    origin = ws.headers.get("origin")
+    return origin is None or urlsplit(origin).netloc == ws.headers.get("host")
+
+async def authenticate(ws: WebSocket) -> User | None:
+    async with AsyncSessionLocal() as db:
+        token = ws.query_params.get("token") or ws.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not token:
+            # cookies ride along on cross-site handshakes too: only trust them from our own pages
+            return await get_web_user(ws, db) if same_origin(ws) else None
+        try:
+            username = decode_token(token).get("sub")
+        except Exception:
+            return None
+        user = await refcache.get_user(db, username)
+        return user if user and user.is_active else None
+
+async def visible(user: User) -> set[int]:
+    async with AsyncSessionLocal() as db:
+        return set(await refcache.visible_number_ids(db, user))
+
+class Subscriptions:
+    """The numbers one socket follows, kept within what its user may see."""
+
+    def __init__(self, ws: WebSocket, user: User):
+        self.ws = ws
+        self.user = user
+        self.numbers: set[int] = set()
+
+    async def subscribe(self, wanted: set[int] | None = None):
+        allowed = await visible(self.user)
+        for nid in (allowed if wanted is None else wanted & allowed) - self.numbers:
+            await broadcaster.join(number_room(nid), self.ws)
+            self.numbers.add(nid)
+
+    async def unsubscribe(self, wanted: set[int]):
+        for nid in wanted & self.numbers:
+            await broadcaster.leave(number_room(nid), self.ws)
+            self.numbers.discard(nid)
+
+    async def revalidate(self):
+        await self.unsubscribe(self.numbers - await visible(self.user))
+
+    def ack(self, event: str):
+        broadcaster.send(self.ws, {"event": event, "numbers": sorted(self.numbers)})
+
+async def heartbeats(ws: WebSocket, subs: Subscriptions, last_seen: list[float]):
+    while True:
+        await asyncio.sleep(settings.WS_HEARTBEAT_SECONDS)
+        if time.monotonic() - last_seen[0] > settings.WS_IDLE_TIMEOUT_SECONDS:
+            metrics.inc("ws_dropped_connections_total", reason="idle")
+            await ws.close(code=IDLE_CLOSE_CODE)
+            return
+        await subs.revalidate()
+        broadcaster.send(ws, {"event": "ping"})
+
+def requested_numbers(ws: WebSocket) -> set[int] | None:
+    raw = ws.query_params.get("numbers")
+    if raw is None:
+        return None
+    return {int(n) for n in raw.split(",") if n.strip().isdigit()}
+
+async def handle(subs: Subscriptions, raw: str):
+    try:
+        msg = json.loads(raw)
+    except ValueError:
+        return  # "pong" and other keep-alives
+    if not isinstance(msg, dict):
+        return
+    op = msg.get("op")
+    numbers = msg.get("numbers")
+    try:
+        wanted = None if numbers is None else {int(n) for n in numbers}
+    except (TypeError, ValueError):
+        return
+    if op == "subscribe":
+        await subs.subscribe(wanted)
+        subs.ack("ws:subscribed")
+    elif op == "unsubscribe" and wanted is not None:
+        await subs.unsubscribe(wanted)
+        subs.ack("ws:subscribed")
+
 @router.websocket("")
-async def ws_endpoint(ws: WebSocket, room: str = Query(...)):
-    await broadcaster.join(room, ws)
+async def ws_endpoint(ws: WebSocket):
+    user = await authenticate(ws)
+    if user is None:
+        await ws.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await broadcaster.connect(ws)
+    subs = Subscriptions(ws, user)
+    last_seen = [time.monotonic()]
+    heartbeat = None
     try:
+        await broadcaster.join(user_room(user.id), ws)
+        await subs.subscribe(requested_numbers(ws))
+        broadcaster.send(ws, {"event": "ws:ready", "user_id": user.id, "numbers": sorted(subs.numbers), "heartbeat": settings.WS_HEARTBEAT_SECONDS})
+        heartbeat = asyncio.create_task(heartbeats(ws, subs, last_seen))
         while True:
-            await ws.receive_text()
+            raw = await ws.receive_text()
+            last_seen[0] = time.monotonic()
+            await handle(subs, raw)
     except WebSocketDisconnect:
-        broadcaster.leave(room, ws)
+        pass
+    finally:
+        if heartbeat is not None:
+            heartbeat.cancel()
+        await broadcaster.disconnect(ws)
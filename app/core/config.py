@@ -9,11 +9,88 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7
 
     DATABASE_URL: str
+    # apply pending migrations on startup (app/db/migrations); off = run scripts/migrate.py yourself
+    AUTO_MIGRATE: bool = True
     REDIS_URL: str
 
     META_APP_SECRET: str
     WHATSAPP_VERIFY_TOKEN: str
     WHATSAPP_ACCESS_TOKEN: str
     GRAPH_API_VERSION: str = "v21.0"
+    GRAPH_BASE: str = "https://graph.facebook.com"
+    GRAPH_HTTP2: bool = False  # needs `pip install httpx[http2]`
+    GRAPH_MAX_CONNECTIONS: int = 50
+    GRAPH_KEEPALIVE_SECONDS: float = 60.0
+    GRAPH_TIMEOUT_SECONDS: float = 20.0
+    GRAPH_MAX_RETRIES: int = 3
+    GRAPH_BACKOFF_BASE_SECONDS: float = 0.5
+    GRAPH_BACKOFF_MAX_SECONDS: float = 30.0
+
+    # bcrypt runs in a bounded thread pool; logins are throttled per username/IP before any hashing
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE_LIMIT: int = 64
+    LOGIN_FAIL_WINDOW_SECONDS: int = 15 * 60
+    LOGIN_MAX_FAILS_PER_USER: int = 5
+    LOGIN_MAX_FAILS_PER_IP: int = 30
+
+    # Background queues: "redis" (Redis Streams) or "memory" (single process / tests)
+    QUEUE_BACKEND: str = "redis"
+    RUN_WORKERS: bool = True
+    WEBHOOK_WORKERS: int = 2
+    QUEUE_BATCH_SIZE: int = 50
+    QUEUE_BLOCK_MS: int = 2000
+    QUEUE_CLAIM_IDLE_MS: int = 60000
+    QUEUE_MAX_DELIVERIES: int = 5
+    QUEUE_MAXLEN: int = 100000
+
+    # Outbound replies: sender workers per process and a token bucket per phone_number_id
+    # (per process: divide Meta's per-number limit by the number of processes)
+    OUTBOX_WORKERS: int = 4
+    OUTBOX_RATE_PER_SECOND: float = 20.0
+    OUTBOX_BURST: int = 20
+
+    # Delivery/read statuses are coalesced per message and written in one UPDATE per window; a status
+    # for a message not stored yet is retried for STATUS_RETRY_SECONDS (keep it below QUEUE_CLAIM_IDLE_MS)
+    STATUS_FLUSH_SECONDS: float = 1.0
+    STATUS_MAX_PENDING: int = 5000
+    STATUS_RETRY_SECONDS: float = 30.0
+
+    # Media files are downloaded by workers into a content-addressed store
+    MEDIA_ROOT: str = "media_store"
+    MEDIA_WORKERS: int = 2
+    MEDIA_CHUNK_BYTES: int = 64 * 1024
+    MEDIA_MAX_BYTES: int = 100 * 1024 * 1024
+
+    # Message history (app.services.archive): messages older than a number's retention_days (else
+    # MESSAGE_RETENTION_DAYS; 0 = keep everything) move to compressed segment files under ARCHIVE_ROOT
+    ARCHIVE_ROOT: str = "archive_store"
+    MESSAGE_RETENTION_DAYS: int = 0
+    MESSAGE_PARTITIONS_AHEAD: int = 3  # Postgres: monthly partitions created this many months ahead
+
+    # WebSocket fan-out: "memory" (single process) or "redis" (pub/sub across workers/hosts)
+    BROADCAST_BACKEND: str = "memory"
+    WS_SEND_QUEUE_SIZE: int = 100
+    WS_SEND_TIMEOUT_SECONDS: float = 10.0
+    WS_HEARTBEAT_SECONDS: float = 25.0  # server pings; sockets silent for WS_IDLE_TIMEOUT_SECONDS are closed
+    WS_IDLE_TIMEOUT_SECONDS: float = 75.0
+
+    # /metrics (Prometheus text format): "memory" (the scraped process) or "redis" (summed over all processes)
+    METRICS_BACKEND: str = "memory"
+    METRICS_PUSH_SECONDS: float = 10.0
+    METRICS_TOKEN: str = ""  # when set, scrapes must send "Authorization: Bearer <token>"
+
+    # SQL profiling (app.db.profiling): slow statements are logged always (0 = off); per-request
+    # profiles with N+1 warnings and a Server-Timing header are for development only
+    SLOW_QUERY_MS: float = 500.0
+    SQL_PROFILING: bool = False
+    SQL_N_PLUS_ONE_THRESHOLD: int = 5
+
+    # Users / assignments / number registry cached per process, invalidated on admin writes
+    REFCACHE_TTL_SECONDS: int = 60
+
+    # Recently ingested Meta message ids: "memory" (per process) or "redis" (shared, TTL)
+    DEDUPE_BACKEND: str = "memory"
+    DEDUPE_MAX_IDS: int = 100000
+    DEDUPE_TTL_SECONDS: int = 60 * 60 * 24
 
 settings = Settings()
@@ -1,10 +1,10 @@
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 from app.db.session import get_db
 from app.core.security import decode_token
 from app.db.models.user import User, Role
+from app.services.refcache import refcache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
@@ -15,8 +15,7 @@ async def get_current_user_api(token: str = Depends(oauth2_scheme), db: AsyncSes
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    q = await db.execute(select(User).where(User.username == username))
-    user = q.scalar_one_or_none()
+    user = await refcache.get_user(db, username)
     if not user or not user.is_active:
         raise HTTPException(status_code=401, detail="User inactive")
     return user
@@ -0,0 +1,135 @@
+"""Hot-path timing hooks feeding app.services.metrics.
+
+Requests get a RequestStats in a context variable; the database, Redis and template hooks
+add to it, and MetricsMiddleware turns it into per-route histograms when the response is done.
+"""
+import functools
+import time
+from collections.abc import Callable
+from contextvars import ContextVar
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.services.metrics import metrics
+
+class RequestStats:
+    __slots__ = ("db_queries", "db_seconds", "redis_seconds", "render_seconds")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.redis_seconds = 0.0
+        self.render_seconds = 0.0
+
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+def route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if scope.get("endpoint") is not None:
+        # a mount (static files): one series for all of it
+        return scope.get("root_path", "") + "/*"
+    return "unmatched"
+
+class MetricsMiddleware:
+    """Per-route latency, plus the database, Redis and template time spent inside each request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            route = route_label(scope)
+            metrics.observe("http_request_seconds", elapsed, route=route, method=scope["method"], status=status)
+            metrics.observe("http_request_db_queries", stats.db_queries, route=route)
+            metrics.observe("http_request_db_seconds", stats.db_seconds, route=route)
+            if stats.redis_seconds:
+                metrics.observe("http_request_redis_seconds", stats.redis_seconds, route=route)
+            if stats.render_seconds:
+                metrics.observe("http_request_render_seconds", stats.render_seconds, route=route)
+
+# further consumers of the statement timings (app.db.profiling), called with (statement, seconds)
+query_observers: list[Callable[[str, float], None]] = []
+_instrumented: set[int] = set()
+
+def instrument_engine(engine: AsyncEngine):
+    """Time every statement the engine sends; counted into the current request as well.
+
+    The one pair of cursor listeners on the engine: other timing consumers go in query_observers.
+    """
+    sync_engine = engine.sync_engine
+    if id(sync_engine) in _instrumented:
+        return
+    _instrumented.add(id(sync_engine))
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        metrics.observe("db_query_seconds", elapsed, op=statement.lstrip()[:6].upper())
+        stats = current_request.get()
+        if stats is not None:
+            stats.db_queries += 1
+            stats.db_seconds += elapsed
+        for observe in query_observers:
+            observe(statement, elapsed)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def failed(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+        metrics.inc("db_errors_total")
+
+def timed_redis(op: str):
+    """Decorator for coroutines doing one Redis round trip."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        async def inner(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.observe("redis_command_seconds", elapsed, op=op)
+                stats = current_request.get()
+                if stats is not None:
+                    stats.redis_seconds += elapsed
+        return inner
+    return wrap
+
+class TimedTemplate(Template):
+    """Jinja2 template class recording render time per template (set as environment.template_class)."""
+
+    def render(self, *args, **kwargs) -> str:
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe("template_render_seconds", elapsed, template=self.name)
+            stats = current_request.get()
+            if stats is not None:
+                stats.render_seconds += elapsed
@@ -1,17 +1,53 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from jose import jwt
 from passlib.context import CryptContext
 from app.core.config import settings
+from app.services.metrics import metrics
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 ALGORITHM = "HS256"
 
+# bcrypt costs 100-300 ms of CPU; never run it on the event loop
+_hash_pool = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_waiting = 0
+
+class PasswordHasherBusy(Exception):
+    """More password operations are queued than PASSWORD_HASH_QUEUE_LIMIT allows."""
+
 def hash_password(p: str) -> str:
     return pwd_context.hash(p)
 
 def verify_password(p: str, hashed: str) -> bool:
     return pwd_context.verify(p, hashed)
 
+async def _in_hash_pool(fn, *args):
+    global _hash_waiting
+    if _hash_waiting >= settings.PASSWORD_HASH_QUEUE_LIMIT:
+        metrics.inc("password_hash_rejected_total")
+        raise PasswordHasherBusy()
+    submitted = time.perf_counter()
+
+    def job():
+        return time.perf_counter(), fn(*args)
+
+    _hash_waiting += 1
+    try:
+        started, result = await asyncio.get_running_loop().run_in_executor(_hash_pool, job)
+    finally:
+        _hash_waiting -= 1
+    metrics.observe("password_hash_queue_wait_seconds", started - submitted)
+    metrics.observe("password_hash_seconds", time.perf_counter() - started)
+    return result
+
+async def hash_password_async(p: str) -> str:
+    return await _in_hash_pool(hash_password, p)
+
+async def verify_password_async(p: str, hashed: str) -> bool:
+    return await _in_hash_pool(verify_password, p, hashed)
+
 def create_access_token(sub: str, minutes: int | None = None) -> str:
     expire = datetime.now(timezone.utc) + timedelta(minutes=minutes or settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     payload = {"sub": sub, "exp": expire}
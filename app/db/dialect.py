@@ -0,0 +1,8 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+def dialect_insert(db: AsyncSession, entity):
+    """INSERT construct with ON CONFLICT support for the session's backend (Postgres or SQLite)."""
+    if db.bind.dialect.name == "postgresql":
+        return postgresql.insert(entity)
+    return sqlite.insert(entity)
@@ -0,0 +1,110 @@
+"""Versioned schema migrations.
+
+Each module in app.db.migrations is named vNNNN_<name>.py and defines upgrade(conn) taking a sync
+Connection. Applied versions are recorded in schema_migrations; every migration runs in its own
+transaction and is recorded in the same one. On Postgres an advisory lock serialises workers that
+start at the same time.
+"""
+import importlib
+import logging
+import pkgutil
+import re
+from datetime import datetime, timezone
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, Index, inspect, select, text
+from sqlalchemy.engine import Connection
+
+from app.db import migrations
+
+log = logging.getLogger(__name__)
+
+ADVISORY_LOCK_KEY = 4_242_001
+
+versions = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(200), nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+_module = re.compile(r"^v(\d{4})_(\w+)$")
+
+def discover() -> list[tuple[int, str]]:
+    found = []
+    for info in pkgutil.iter_modules(migrations.__path__):
+        m = _module.match(info.name)
+        if m:
+            found.append((int(m.group(1)), info.name))
+    found.sort()
+    numbers = [v for v, _ in found]
+    if len(numbers) != len(set(numbers)):
+        raise RuntimeError(f"duplicate migration versions: {numbers}")
+    return found
+
+def applied_versions(conn: Connection) -> set[int]:
+    return set(conn.execute(select(versions.c.version)).scalars())
+
+def migrate(conn: Connection) -> list[str]:
+    """Apply pending migrations in order. Returns the names of the ones applied."""
+    postgres = conn.dialect.name == "postgresql"
+    if postgres:
+        conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": ADVISORY_LOCK_KEY})
+        conn.commit()
+    try:
+        versions.create(conn, checkfirst=True)
+        conn.commit()
+        done = applied_versions(conn)
+        conn.commit()
+        applied = []
+        for version, name in discover():
+            if version in done:
+                continue
+            log.info("applying migration %s", name)
+            importlib.import_module(f"{migrations.__name__}.{name}").upgrade(conn)
+            conn.execute(versions.insert().values(version=version, name=name, applied_at=datetime.now(timezone.utc)))
+            conn.commit()
+            applied.append(name)
+        return applied
+    finally:
+        if postgres:
+            conn.rollback()
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": ADVISORY_LOCK_KEY})
+            conn.commit()
+
+def pending(conn: Connection) -> list[str]:
+    if not inspect(conn).has_table(versions.name):
+        return [name for _, name in discover()]
+    done = applied_versions(conn)
+    return [name for version, name in discover() if version not in done]
+
+# --- helpers for migration modules ---
+
+def has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+def has_index(conn: Connection, table: str, name: str) -> bool:
+    insp = inspect(conn)
+    return any(i["name"] == name for i in insp.get_indexes(table)) or any(
+        u["name"] == name for u in insp.get_unique_constraints(table)
+    )
+
+def add_column(conn: Connection, table: str, column: Column):
+    """ALTER TABLE ... ADD COLUMN unless it exists (creating a Postgres enum type first if needed)."""
+    if has_column(conn, table, column.name):
+        return
+    if conn.dialect.name == "postgresql" and hasattr(column.type, "create"):
+        column.type.create(conn, checkfirst=True)
+    ddl = f"ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    conn.execute(text(ddl))
+
+def create_index(conn: Connection, index: Index):
+    if not has_index(conn, index.table.name, index.name):
+        index.create(conn)
+
+def drop_index(conn: Connection, table: str, name: str):
+    if has_index(conn, table, name):
+        conn.execute(text(f"DROP INDEX {name}"))
@@ -0,0 +1,62 @@
+"""The original schema, frozen as it was before versioned migrations.
+
+Databases created by the old startup create_all already have these tables and only get the version recorded.
+"""
+from datetime import datetime
+from sqlalchemy import (
+    MetaData, Table, Column, Integer, String, Boolean, Enum, DateTime, Text, ForeignKey, UniqueConstraint,
+)
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("username", String(120), nullable=False, unique=True, index=True),
+    Column("name", String(200), nullable=False),
+    Column("password_hash", String(255), nullable=False),
+    Column("role", Enum("admin", "employee", name="role"), nullable=False),
+    Column("is_active", Boolean, nullable=False),
+)
+
+Table(
+    "wa_numbers", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("display_name", String(200), nullable=False),
+    Column("phone_number_id", String(64), nullable=False, unique=True, index=True),
+    Column("is_active", Boolean, nullable=False),
+)
+
+Table(
+    "assignments", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("wa_number_id", Integer, ForeignKey("wa_numbers.id", ondelete="CASCADE"), nullable=False, index=True),
+    UniqueConstraint("user_id", "wa_number_id", name="uq_user_number"),
+)
+
+Table(
+    "conversations", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("wa_number_id", Integer, ForeignKey("wa_numbers.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("customer_wa_id", String(64), nullable=False, index=True),
+    Column("status", Enum("open", "pending", "done", name="conversationstatus"), nullable=False),
+    Column("last_inbound_at", DateTime(timezone=True), nullable=True),
+    Column("last_message_at", DateTime(timezone=True), nullable=True),
+    Column("locked_by_user_id", Integer, nullable=True),
+    Column("lock_expires_at", DateTime(timezone=True), nullable=True),
+)
+
+Table(
+    "messages", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("conversation_id", Integer, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("direction", Enum("IN", "OUT", name="direction"), nullable=False),
+    Column("body", Text, nullable=True),
+    Column("meta_message_id", String(128), nullable=True, unique=True, index=True),
+    Column("sent_at", DateTime(timezone=True), nullable=False, default=datetime.utcnow),
+)
+
+def upgrade(conn: Connection):
+    metadata.create_all(conn, checkfirst=True)
@@ -0,0 +1,44 @@
+"""Columns and tables added since the baseline: conversation summaries, per-number counters,
+outbound delivery state and media.
+
+Existing rows get zero counters; run scripts/rebuild_summaries.py and scripts/reconcile_counters.py once afterwards.
+"""
+from sqlalchemy import MetaData, Table, Column, Integer, BigInteger, String, Enum, DateTime, ForeignKey, Index
+from sqlalchemy.engine import Connection
+
+from app.db.migrate import add_column, create_index
+
+def upgrade(conn: Connection):
+    for column in (
+        Column("last_message_preview", String(200), nullable=True),
+        Column("last_direction", Enum("IN", "OUT", name="direction"), nullable=True),
+        Column("message_count", Integer, nullable=False, server_default="0"),
+        Column("unread_count", Integer, nullable=False, server_default="0"),
+    ):
+        add_column(conn, "conversations", column)
+
+    for column in (
+        Column("status", Enum("queued", "sending", "sent", "delivered", "read", "failed", name="messagestatus"), nullable=True),
+        Column("error", String(255), nullable=True),
+        Column("status_at", DateTime(timezone=True), nullable=True),
+        Column("media_type", String(16), nullable=True),
+        Column("media_id", String(128), nullable=True),
+        Column("media_mime", String(100), nullable=True),
+        Column("media_filename", String(255), nullable=True),
+        Column("media_sha256", String(64), nullable=True),
+        Column("media_size", BigInteger, nullable=True),
+    ):
+        add_column(conn, "messages", column)
+
+    metadata = MetaData()
+    messages = Table("messages", metadata, Column("id", Integer, primary_key=True), Column("media_sha256", String(64)))
+    create_index(conn, Index("ix_messages_media_sha256", messages.c.media_sha256))
+
+    Table("wa_numbers", metadata, Column("id", Integer, primary_key=True))
+    Table(
+        "number_stats", metadata,
+        Column("wa_number_id", Integer, ForeignKey("wa_numbers.id", ondelete="CASCADE"), primary_key=True),
+        Column("conversations", Integer, nullable=False, server_default="0"),
+        Column("open_conversations", Integer, nullable=False, server_default="0"),
+        Column("inbound_messages", BigInteger, nullable=False, server_default="0"),
+    ).create(conn, checkfirst=True)
@@ -0,0 +1,7 @@
+"""Full-text search: FTS5 table and triggers on SQLite, tsvector/GIN and trigram indexes on Postgres."""
+from sqlalchemy.engine import Connection
+
+from app.db.search_index import ensure_search_index
+
+def upgrade(conn: Connection):
+    ensure_search_index(conn)
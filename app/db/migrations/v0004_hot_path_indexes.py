@@ -0,0 +1,52 @@
+"""Composite indexes for the hot queries and a unique conversation key.
+
+- conversations (wa_number_id, last_message_at DESC, id DESC): the inbox list, keyset-paginated
+- conversations (wa_number_id, customer_wa_id) UNIQUE: webhook lookups and race-free upserts
+- messages (conversation_id, sent_at, id): the timeline, keyset-paginated
+The single-column indexes they make redundant are dropped. Duplicate conversations left by the
+old check-then-insert ingest are merged into the oldest one first.
+"""
+import logging
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.db.migrate import has_index, drop_index
+
+log = logging.getLogger(__name__)
+
+def merge_duplicate_conversations(conn: Connection) -> int:
+    dupes = conn.execute(text("""
+        SELECT c.id, k.keep_id FROM conversations c
+        JOIN (
+            SELECT wa_number_id, customer_wa_id, MIN(id) AS keep_id FROM conversations
+            GROUP BY wa_number_id, customer_wa_id HAVING COUNT(*) > 1
+        ) k ON k.wa_number_id = c.wa_number_id AND k.customer_wa_id = c.customer_wa_id
+        WHERE c.id <> k.keep_id
+    """)).all()
+    for dupe_id, keep_id in dupes:
+        conn.execute(text("UPDATE messages SET conversation_id = :keep WHERE conversation_id = :dupe"), {"keep": keep_id, "dupe": dupe_id})
+        conn.execute(text("DELETE FROM conversations WHERE id = :dupe"), {"dupe": dupe_id})
+    return len(dupes)
+
+def upgrade(conn: Connection):
+    merged = merge_duplicate_conversations(conn)
+    if merged:
+        log.warning("merged %d duplicate conversations; run scripts/rebuild_summaries.py and scripts/reconcile_counters.py", merged)
+
+    # SQLite keeps NULLs last in DESC order already and has no NULLS clause in CREATE INDEX
+    nulls_last = " NULLS LAST" if conn.dialect.name == "postgresql" else ""
+    statements = {
+        ("conversations", "uq_conversations_number_customer"):
+            "CREATE UNIQUE INDEX uq_conversations_number_customer ON conversations (wa_number_id, customer_wa_id)",
+        ("conversations", "ix_conversations_number_recent"):
+            f"CREATE INDEX ix_conversations_number_recent ON conversations (wa_number_id, last_message_at DESC{nulls_last}, id DESC)",
+        ("messages", "ix_messages_conversation_sent"):
+            "CREATE INDEX ix_messages_conversation_sent ON messages (conversation_id, sent_at, id)",
+    }
+    for (table, name), ddl in statements.items():
+        if not has_index(conn, table, name):
+            conn.execute(text(ddl))
+
+    drop_index(conn, "conversations", "ix_conversations_wa_number_id")
+    drop_index(conn, "conversations", "ix_conversations_customer_wa_id")
+    drop_index(conn, "messages", "ix_messages_conversation_id")
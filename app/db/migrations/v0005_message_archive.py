@@ -0,0 +1,72 @@
+"""Month-partitioned messages on Postgres and the cold-history archive (app.services.archive).
+
+- wa_numbers.retention_days, conversations.archived_until
+- archive_segments and archive_conversations, the index of the segment files
+- messages.meta_message_id is unique together with sent_at (a unique index on a partitioned table must
+  include the partition key; redeliveries carry the same timestamp), with a plain index for status lookups
+- Postgres: messages is rebuilt as a table partitioned by month on sent_at. The rows are copied, which
+  takes the time and disk space of a full copy of the table and locks it meanwhile; plan a window for it.
+"""
+from sqlalchemy import MetaData, Table, Column, Integer, BigInteger, String, DateTime, ForeignKey, Index
+from sqlalchemy.engine import Connection
+
+from app.core.config import settings
+from app.db.migrate import add_column, create_index, drop_index, has_index
+from app.db.partitions import partition_messages
+from app.db.search_index import ensure_search_index
+
+def upgrade(conn: Connection):
+    add_column(conn, "wa_numbers", Column("retention_days", Integer, nullable=True))
+    add_column(conn, "conversations", Column("archived_until", DateTime(timezone=True), nullable=True))
+
+    metadata = MetaData()
+    Table("wa_numbers", metadata, Column("id", Integer, primary_key=True))
+    Table("conversations", metadata, Column("id", Integer, primary_key=True))
+    Table(
+        "archive_segments", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("wa_number_id", Integer, ForeignKey("wa_numbers.id", ondelete="CASCADE"), nullable=False, index=True),
+        Column("month", String(7), nullable=False),
+        Column("path", String(255), nullable=False),
+        Column("message_count", Integer, nullable=False),
+        Column("size", BigInteger, nullable=False),
+        Column("sha256", String(64), nullable=True),
+        Column("first_sent_at", DateTime(timezone=True), nullable=True),
+        Column("last_sent_at", DateTime(timezone=True), nullable=True),
+        Column("created_at", DateTime(timezone=True), nullable=False),
+        Column("rehydrated_at", DateTime(timezone=True), nullable=True),
+    ).create(conn, checkfirst=True)
+    archived = Table(
+        "archive_conversations", metadata,
+        Column("segment_id", Integer, ForeignKey("archive_segments.id", ondelete="CASCADE"), primary_key=True),
+        Column("conversation_id", Integer, ForeignKey("conversations.id", ondelete="CASCADE"), primary_key=True),
+        Column("member_offset", BigInteger, nullable=False),
+        Column("member_size", BigInteger, nullable=False),
+        Column("message_count", Integer, nullable=False),
+        Column("first_sent_at", DateTime(timezone=True), nullable=False),
+        Column("last_sent_at", DateTime(timezone=True), nullable=False),
+    )
+    archived.create(conn, checkfirst=True)
+    create_index(conn, Index("ix_archive_conversations_conversation", archived.c.conversation_id, archived.c.last_sent_at))
+
+    partition_messages(conn, settings.MESSAGE_PARTITIONS_AHEAD)
+
+    messages = Table(
+        "messages", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("conversation_id", Integer),
+        Column("meta_message_id", String(128)),
+        Column("sent_at", DateTime(timezone=True)),
+        Column("media_sha256", String(64)),
+    )
+    if not has_index(conn, "messages", "uq_messages_meta_sent"):
+        # the old single-column index is unique; it comes back as a plain one
+        drop_index(conn, "messages", "ix_messages_meta_message_id")
+    for index in (
+        Index("uq_messages_meta_sent", messages.c.meta_message_id, messages.c.sent_at, unique=True),
+        Index("ix_messages_meta_message_id", messages.c.meta_message_id),
+        Index("ix_messages_conversation_sent", messages.c.conversation_id, messages.c.sent_at, messages.c.id),
+        Index("ix_messages_media_sha256", messages.c.media_sha256),
+    ):
+        create_index(conn, index)
+    ensure_search_index(conn)
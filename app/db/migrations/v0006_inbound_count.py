@@ -0,0 +1,18 @@
+"""conversations.inbound_count, the counter per-agent read cursors are kept against (app.services.read_state).
+
+Backfilled from the inbound messages still in the database.
+"""
+from sqlalchemy import Column, Integer, text
+from sqlalchemy.engine import Connection
+
+from app.db.migrate import add_column, has_column
+
+def upgrade(conn: Connection):
+    if has_column(conn, "conversations", "inbound_count"):
+        return
+    add_column(conn, "conversations", Column("inbound_count", Integer, nullable=False, server_default="0"))
+    conn.execute(text("""
+        UPDATE conversations SET inbound_count = (
+            SELECT count(*) FROM messages WHERE messages.conversation_id = conversations.id AND messages.direction = 'IN'
+        )
+    """))
@@ -0,0 +1,88 @@
+"""Inbound counts and last message times of every archived member (archive_conversations), so the
+repair tools count archived history too, and conversations.inbound_count recomputed with it.
+
+Backfilled from the segment files under ARCHIVE_ROOT; a member whose file cannot be read keeps NULLs
+(logged) and counts as holding no inbound messages.
+"""
+import gzip
+import json
+import logging
+import os
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, DateTime, select, update, text
+from sqlalchemy.engine import Connection
+
+from app.core.config import settings
+from app.db.migrate import add_column
+
+log = logging.getLogger(__name__)
+
+# the segment format as it was when this migration was written: gzip members of one JSON message per line,
+# enums by value ("in"/"out") and datetimes in ISO format
+def read_member(path: str, offset: int, size: int) -> list[dict]:
+    with open(os.path.join(settings.ARCHIVE_ROOT, path), "rb") as f:
+        f.seek(offset)
+        raw = f.read(size)
+    return [json.loads(line) for line in gzip.decompress(raw).splitlines()]
+
+def member_stats(rows: list[dict]) -> dict:
+    stats = {"inbound_count": 0, "unanswered_count": 0, "last_inbound_at": None, "last_outbound_at": None}
+    for row in rows:
+        sent_at = datetime.fromisoformat(row["sent_at"])
+        if row["direction"] == "out":
+            stats["unanswered_count"] = 0
+            stats["last_outbound_at"] = sent_at
+        else:
+            stats["inbound_count"] += 1
+            stats["unanswered_count"] += 1
+            stats["last_inbound_at"] = sent_at
+    return stats
+
+def stats_columns() -> list[Column]:
+    return [
+        Column("inbound_count", Integer, nullable=True),
+        Column("unanswered_count", Integer, nullable=True),
+        Column("last_inbound_at", DateTime(timezone=True), nullable=True),
+        Column("last_outbound_at", DateTime(timezone=True), nullable=True),
+    ]
+
+def upgrade(conn: Connection):
+    for column in stats_columns():
+        add_column(conn, "archive_conversations", column)
+
+    metadata = MetaData()
+    segments = Table("archive_segments", metadata, Column("id", Integer, primary_key=True), Column("path"))
+    members = Table(
+        "archive_conversations", metadata,
+        Column("segment_id", Integer, primary_key=True),
+        Column("conversation_id", Integer, primary_key=True),
+        Column("member_offset", Integer),
+        Column("member_size", Integer),
+        *stats_columns(),
+    )
+    todo = conn.execute(
+        select(members.c.segment_id, members.c.conversation_id, members.c.member_offset, members.c.member_size, segments.c.path)
+        .join(segments, segments.c.id == members.c.segment_id)
+        .where(members.c.inbound_count.is_(None))
+    ).all()
+    for segment_id, conversation_id, offset, size, path in todo:
+        try:
+            rows = read_member(path, offset, size)
+        except (OSError, ValueError):
+            log.warning("archive segment %s (%s): member of conversation %s unreadable, left uncounted", segment_id, path, conversation_id)
+            continue
+        conn.execute(
+            update(members)
+            .where(members.c.segment_id == segment_id, members.c.conversation_id == conversation_id)
+            .values(**member_stats(rows))
+        )
+
+    conn.execute(text("""
+        UPDATE conversations SET inbound_count = (
+            SELECT count(*) FROM messages WHERE messages.conversation_id = conversations.id AND messages.direction = 'IN'
+        ) + coalesce((
+            SELECT sum(ac.inbound_count) FROM archive_conversations ac JOIN archive_segments s ON s.id = ac.segment_id
+            WHERE ac.conversation_id = conversations.id AND s.rehydrated_at IS NULL
+        ), 0)
+        WHERE archived_until IS NOT NULL
+    """))
@@ -2,4 +2,6 @@ from app.db.models.user import User, Role
 from app.db.models.wa_number import WhatsAppNumber
 from app.db.models.assignment import Assignment
 from app.db.models.conversation import Conversation, ConversationStatus
-from app.db.models.message import Message, Direction
+from app.db.models.message import Message, Direction, MessageStatus
+from app.db.models.number_stats import NumberStats
+from app.db.models.archive import ArchiveSegment, ArchiveConversation
@@ -0,0 +1,39 @@
+from datetime import datetime
+from sqlalchemy import ForeignKey, String, Integer, BigInteger, DateTime, Index
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.base import Base
+
+class ArchiveSegment(Base):
+    """One append-only file of archived messages of a number and month (see app.services.archive)."""
+    __tablename__ = "archive_segments"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    wa_number_id: Mapped[int] = mapped_column(ForeignKey("wa_numbers.id", ondelete="CASCADE"), index=True)
+    month: Mapped[str] = mapped_column(String(7))  # YYYY-MM
+    path: Mapped[str] = mapped_column(String(255), default="")  # relative to ARCHIVE_ROOT
+    message_count: Mapped[int] = mapped_column(Integer, default=0)
+    size: Mapped[int] = mapped_column(BigInteger, default=0)
+    sha256: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    first_sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    # set when the rows were copied back into messages; readers skip the segment from then on
+    rehydrated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+class ArchiveConversation(Base):
+    """Where a conversation's gzip member starts in a segment file."""
+    __tablename__ = "archive_conversations"
+    __table_args__ = (Index("ix_archive_conversations_conversation", "conversation_id", "last_sent_at"),)
+
+    segment_id: Mapped[int] = mapped_column(ForeignKey("archive_segments.id", ondelete="CASCADE"), primary_key=True)
+    conversation_id: Mapped[int] = mapped_column(ForeignKey("conversations.id", ondelete="CASCADE"), primary_key=True)
+    member_offset: Mapped[int] = mapped_column(BigInteger)
+    member_size: Mapped[int] = mapped_column(BigInteger)
+    message_count: Mapped[int] = mapped_column(Integer)
+    first_sent_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    last_sent_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    # what the repair tools (counters.reconcile, summaries.rebuild_summaries) need of the archived messages
+    inbound_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    unanswered_count: Mapped[int | None] = mapped_column(Integer, nullable=True)  # inbound after the member's last reply
+    last_inbound_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_outbound_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -1,8 +1,9 @@
 import enum
 from datetime import datetime
-from sqlalchemy import ForeignKey, String, Enum, DateTime, Integer
+from sqlalchemy import ForeignKey, String, Enum, DateTime, Integer, Index, text
 from sqlalchemy.orm import Mapped, mapped_column
 from app.db.base import Base
+from app.db.models.message import Direction
 
 class ConversationStatus(str, enum.Enum):
     open = "open"
@@ -11,14 +12,29 @@ class ConversationStatus(str, enum.Enum):
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        Index("uq_conversations_number_customer", "wa_number_id", "customer_wa_id", unique=True),
+        Index("ix_conversations_number_recent", "wa_number_id", text("last_message_at DESC"), text("id DESC")),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    wa_number_id: Mapped[int] = mapped_column(ForeignKey("wa_numbers.id", ondelete="CASCADE"), index=True)
-    customer_wa_id: Mapped[str] = mapped_column(String(64), index=True)
+    wa_number_id: Mapped[int] = mapped_column(ForeignKey("wa_numbers.id", ondelete="CASCADE"))
+    customer_wa_id: Mapped[str] = mapped_column(String(64))
     status: Mapped[ConversationStatus] = mapped_column(Enum(ConversationStatus), default=ConversationStatus.open)
 
     last_inbound_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     last_message_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
+    # Summary of the thread, maintained on ingest/reply (see app.services.summaries)
+    last_message_preview: Mapped[str | None] = mapped_column(String(200), nullable=True)
+    last_direction: Mapped[Direction | None] = mapped_column(Enum(Direction), nullable=True)
+    message_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    unread_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    # inbound messages ever received (never lowered); per-agent read cursors count against it (app.services.read_state)
+    inbound_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+
+    # newest archived message, None when the whole history is still in messages
+    archived_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
     locked_by_user_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
     lock_expires_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
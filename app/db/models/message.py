@@ -1,6 +1,6 @@
 import enum
 from datetime import datetime
-from sqlalchemy import ForeignKey, Text, Enum, String, DateTime
+from sqlalchemy import ForeignKey, Text, Enum, String, DateTime, BigInteger, Index
 from sqlalchemy.orm import Mapped, mapped_column
 from app.db.base import Base
 
@@ -8,12 +8,38 @@ class Direction(str, enum.Enum):
     IN = "in"
     OUT = "out"
 
+class MessageStatus(str, enum.Enum):
+    queued = "queued"
+    sending = "sending"
+    sent = "sent"
+    delivered = "delivered"
+    read = "read"
+    failed = "failed"
+
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_conversation_sent", "conversation_id", "sent_at", "id"),
+        # with sent_at so Postgres accepts it on the month-partitioned table (app.db.partitions)
+        Index("uq_messages_meta_sent", "meta_message_id", "sent_at", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    conversation_id: Mapped[int] = mapped_column(ForeignKey("conversations.id", ondelete="CASCADE"), index=True)
+    conversation_id: Mapped[int] = mapped_column(ForeignKey("conversations.id", ondelete="CASCADE"))
     direction: Mapped[Direction] = mapped_column(Enum(Direction))
     body: Mapped[str | None] = mapped_column(Text, nullable=True)
-    meta_message_id: Mapped[str | None] = mapped_column(String(128), unique=True, nullable=True, index=True)
+    meta_message_id: Mapped[str | None] = mapped_column(String(128), nullable=True, index=True)
     sent_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+
+    # Outbound delivery state; None for inbound messages
+    status: Mapped[MessageStatus | None] = mapped_column(Enum(MessageStatus), nullable=True)
+    error: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    status_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    # Media messages: body holds the caption; the file is stored by sha256 once downloaded
+    media_type: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    media_id: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    media_mime: Mapped[str | None] = mapped_column(String(100), nullable=True)
+    media_filename: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    media_sha256: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
+    media_size: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
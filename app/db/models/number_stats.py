@@ -0,0 +1,12 @@
+from sqlalchemy import ForeignKey, Integer, BigInteger
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.base import Base
+
+class NumberStats(Base):
+    """Per-number dashboard counters, maintained incrementally (see app.services.counters)."""
+    __tablename__ = "number_stats"
+
+    wa_number_id: Mapped[int] = mapped_column(ForeignKey("wa_numbers.id", ondelete="CASCADE"), primary_key=True)
+    conversations: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    open_conversations: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    inbound_messages: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0")
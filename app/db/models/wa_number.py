@@ -1,4 +1,4 @@
-from sqlalchemy import String, Boolean
+from sqlalchemy import String, Boolean, Integer
 from sqlalchemy.orm import Mapped, mapped_column
 from app.db.base import Base
 
@@ -9,3 +9,5 @@ class WhatsAppNumber(Base):
     display_name: Mapped[str] = mapped_column(String(200))
     phone_number_id: Mapped[str] = mapped_column(String(64), unique=True, index=True)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+    # days of message history kept in the database; None = MESSAGE_RETENTION_DAYS (app.services.archive)
+    retention_days: Mapped[int | None] = mapped_column(Integer, nullable=True)
@@ -0,0 +1,116 @@
+"""Monthly range partitions of messages on Postgres (PARTITION BY RANGE (sent_at)).
+
+messages_pYYYYMM holds one calendar month (UTC) and messages_default catches rows outside the
+months created so far; ensure_month() moves those out when their month gets a partition. Old
+months leave through drop_month() once app.services.archive has copied them out.
+Functions take a sync Connection (AsyncConnection.run_sync) and do nothing on other backends.
+"""
+import re
+from datetime import datetime, timezone
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+DEFAULT = "messages_default"
+LOCK_KEY = 4_242_002
+
+_name = re.compile(r"^messages_p(\d{4})(\d{2})$")
+
+def month_start(at: datetime) -> datetime:
+    return datetime(at.year, at.month, 1, tzinfo=timezone.utc)
+
+def add_months(month: datetime, n: int) -> datetime:
+    i = month.year * 12 + month.month - 1 + n
+    return datetime(i // 12, i % 12 + 1, 1, tzinfo=timezone.utc)
+
+def partition_name(month: datetime) -> str:
+    return f"messages_p{month:%Y%m}"
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    found = conn.execute(text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('messages')")).first()
+    return found is not None
+
+def months(conn: Connection) -> list[datetime]:
+    """The months that have a partition, oldest first."""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'messages'::regclass"
+    )).scalars()
+    found = []
+    for name in names:
+        m = _name.match(name)
+        if m:
+            found.append(datetime(int(m.group(1)), int(m.group(2)), 1, tzinfo=timezone.utc))
+    return sorted(found)
+
+def stored_columns(conn: Connection, table: str = "messages") -> list[str]:
+    """Columns that can be inserted (generated ones such as search_tsv excluded)."""
+    return list(conn.execute(text(
+        "SELECT column_name FROM information_schema.columns"
+        " WHERE table_schema = current_schema() AND table_name = :t AND is_generated = 'NEVER' ORDER BY ordinal_position"
+    ), {"t": table}).scalars())
+
+def ensure_month(conn: Connection, month: datetime) -> bool:
+    """Create the partition of `month` unless it exists. Returns whether it was created."""
+    if month in months(conn):
+        return False
+    lo, hi = month, add_months(month, 1)
+    bounds = {"lo": lo, "hi": hi}
+    create = f"CREATE TABLE {partition_name(month)} PARTITION OF messages FOR VALUES FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+    in_range = "sent_at >= :lo AND sent_at < :hi"
+    stray = conn.execute(text(f"SELECT 1 FROM {DEFAULT} WHERE {in_range} LIMIT 1"), bounds).first()
+    if stray is None:
+        conn.execute(text(create))
+        return True
+    # Postgres refuses a partition whose rows sit in the default one: move them across while it is detached
+    cols = ", ".join(stored_columns(conn))
+    conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {DEFAULT}"))
+    conn.execute(text(create))
+    conn.execute(text(f"INSERT INTO messages ({cols}) SELECT {cols} FROM {DEFAULT} WHERE {in_range}"), bounds)
+    conn.execute(text(f"DELETE FROM {DEFAULT} WHERE {in_range}"), bounds)
+    conn.execute(text(f"ALTER TABLE messages ATTACH PARTITION {DEFAULT} DEFAULT"))
+    return True
+
+def ensure_partitions(conn: Connection, ahead: int, start: datetime | None = None) -> list[str]:
+    """Partitions from `start` (default: this month) to `ahead` months from now. Returns the ones created."""
+    if not is_partitioned(conn):
+        return []
+    # serialises app servers starting together; released with the caller's transaction
+    conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": LOCK_KEY})
+    now = month_start(datetime.now(timezone.utc))
+    month = month_start(start) if start else now
+    created = []
+    while month <= add_months(now, ahead):
+        if ensure_month(conn, month):
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+def drop_month(conn: Connection, month: datetime):
+    name = partition_name(month)
+    conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+    conn.execute(text(f"DROP TABLE {name}"))
+
+def partition_messages(conn: Connection, ahead: int):
+    """Rebuild an ordinary messages table as a partitioned one, copying its rows."""
+    if conn.dialect.name != "postgresql" or is_partitioned(conn):
+        return
+    old = "messages_unpartitioned"
+    conn.execute(text(f"ALTER TABLE messages RENAME TO {old}"))
+    conn.execute(text(f"CREATE TABLE messages (LIKE {old} INCLUDING DEFAULTS INCLUDING GENERATED) PARTITION BY RANGE (sent_at)"))
+    conn.execute(text(f"CREATE TABLE {DEFAULT} PARTITION OF messages DEFAULT"))
+    sequence = conn.execute(text(f"SELECT pg_get_serial_sequence('{old}', 'id')")).scalar()
+    if sequence:
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY messages.id"))
+    oldest = conn.execute(text(f"SELECT min(sent_at) FROM {old}")).scalar()
+    ensure_partitions(conn, ahead, start=oldest)
+    cols = ", ".join(stored_columns(conn, old))
+    conn.execute(text(f"INSERT INTO messages ({cols}) SELECT {cols} FROM {old}"))
+    # its indexes and constraints go with it, freeing their names for the new table
+    conn.execute(text(f"DROP TABLE {old}"))
+    # a unique index on a partitioned table has to include the partition key
+    conn.execute(text("ALTER TABLE messages ADD CONSTRAINT messages_pkey PRIMARY KEY (id, sent_at)"))
+    conn.execute(text(
+        "ALTER TABLE messages ADD CONSTRAINT messages_conversation_id_fkey"
+        " FOREIGN KEY (conversation_id) REFERENCES conversations (id) ON DELETE CASCADE"
+    ))
@@ -0,0 +1,144 @@
+"""SQL profiling for development and tests.
+
+install(engine) takes the statement timings of the engine's cursor listeners
+(app.core.observability.instrument_engine). Statements are then
+- logged when slower than SLOW_QUERY_MS (always, once installed),
+- recorded per request when SQL_PROFILING is on (ProfilingMiddleware): a summary is logged,
+  repeated statements that look like N+1 are flagged, and the response carries a Server-Timing header,
+- recorded engine-wide inside capture_queries() / query_budget(), the helpers for tests and scripts:
+
+    with query_budget(6, route="POST /inbox/reply"):
+        client.post("/inbox/reply", data={...})
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.core.observability import route_label, instrument_engine, query_observers
+from app.services.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+_literals = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\$\d+|%\(\w+\)s|(?<![:\w]):\w+|\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?)"),
+    # multi-row VALUES and IN lists of any length look the same
+    (re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+"), "(?)"),
+    (re.compile(r"\s+"), " "),
+]
+
+def normalize(statement: str) -> str:
+    """The statement with literals, bound parameters and list lengths replaced, for grouping."""
+    for pattern, repl in _literals:
+        statement = pattern.sub(repl, statement)
+    return statement.strip()
+
+class QueryProfile:
+    __slots__ = ("queries",)
+
+    def __init__(self):
+        self.queries: list[tuple[str, float]] = []
+
+    def add(self, statement: str, seconds: float):
+        self.queries.append((statement, seconds))
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    @property
+    def seconds(self) -> float:
+        return sum(s for _, s in self.queries)
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """Normalized statements run at least `threshold` times: the shape of an N+1."""
+        counts = Counter(normalize(q) for q, _ in self.queries)
+        return [(q, n) for q, n in counts.most_common() if n >= threshold]
+
+    def report(self) -> str:
+        lines = [f"{len(self)} queries, {self.seconds * 1000:.1f} ms"]
+        lines += [f"  {s * 1000:7.1f} ms  {normalize(q)[:300]}" for q, s in self.queries]
+        return "\n".join(lines)
+
+current_profile: ContextVar[QueryProfile | None] = ContextVar("current_profile", default=None)
+# engine-wide captures opened by capture_queries(), whatever context the statements run in
+_captures: list[QueryProfile] = []
+
+def observe(statement: str, elapsed: float):
+    if settings.SLOW_QUERY_MS and elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        metrics.inc("db_slow_queries_total")
+        log.warning("slow query (%.1f ms): %s", elapsed * 1000, normalize(statement)[:1000])
+    profile = current_profile.get()
+    if profile is not None:
+        profile.add(statement, elapsed)
+    for capture in _captures:
+        capture.add(statement, elapsed)
+
+def install(engine: AsyncEngine):
+    """Feed the engine's statement timings (app.core.observability) into the profiles."""
+    instrument_engine(engine)
+    if observe not in query_observers:
+        query_observers.append(observe)
+
+class ProfilingMiddleware:
+    """Per-request SQL profile (SQL_PROFILING): a log line per request, N+1 warnings, Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        profile = QueryProfile()
+        token = current_profile.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                timing = f'db;dur={profile.seconds * 1000:.1f};desc="{len(profile)} queries"'
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            route = f"{scope['method']} {route_label(scope)}"
+            log.info("%s: %d queries, %.1f ms", route, len(profile), profile.seconds * 1000)
+            for statement, n in profile.repeated(settings.SQL_N_PLUS_ONE_THRESHOLD):
+                metrics.inc("db_n_plus_one_total", route=route)
+                log.warning("possible N+1 in %s: %d x %s", route, n, statement[:300])
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+@contextmanager
+def capture_queries(engine: AsyncEngine | None = None) -> Iterator[QueryProfile]:
+    """Record every statement the engine runs while the block is active (any task or thread)."""
+    if engine is None:
+        from app.db.session import engine
+    install(engine)
+    profile = QueryProfile()
+    _captures.append(profile)
+    try:
+        yield profile
+    finally:
+        _captures.remove(profile)
+
+@contextmanager
+def query_budget(max_queries: int, route: str = "block", repeats: int | None = None, engine: AsyncEngine | None = None) -> Iterator[QueryProfile]:
+    """Fail (QueryBudgetExceeded, an AssertionError) when the block runs more than max_queries statements
+    or one normalized statement at least `repeats` times (default SQL_N_PLUS_ONE_THRESHOLD)."""
+    with capture_queries(engine) as profile:
+        yield profile
+    problems = []
+    if len(profile) > max_queries:
+        problems.append(f"{route} ran {len(profile)} queries, budget {max_queries}")
+    for statement, n in profile.repeated(repeats or settings.SQL_N_PLUS_ONE_THRESHOLD):
+        problems.append(f"{route} repeated {n} x {statement[:300]}")
+    if problems:
+        raise QueryBudgetExceeded("\n".join(problems) + "\n" + profile.report())
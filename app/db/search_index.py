@@ -0,0 +1,43 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# SQLite: an external-content FTS5 table kept in sync by triggers, so every insert path
+# (bulk ingest, replies, scripts) maintains the index without application code.
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        body, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages WHEN new.body IS NOT NULL BEGIN
+        INSERT INTO messages_fts(rowid, body) VALUES (new.id, new.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages WHEN old.body IS NOT NULL BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, body) VALUES ('delete', old.id, old.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF body ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, body) SELECT 'delete', old.id, old.body WHERE old.body IS NOT NULL;
+        INSERT INTO messages_fts(rowid, body) SELECT new.id, new.body WHERE new.body IS NOT NULL;
+    END""",
+]
+
+# Postgres: a stored generated tsvector ('simple' config: no stemming, works for Arabic and English alike)
+# with a GIN index, and a trigram index for substring search on customer numbers.
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', coalesce(body, ''))) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_messages_search_tsv ON messages USING gin (search_tsv)",
+    "CREATE INDEX IF NOT EXISTS ix_conversations_customer_trgm ON conversations USING gin (customer_wa_id gin_trgm_ops)",
+]
+
+def ensure_search_index(conn: Connection):
+    """Create the search index objects if missing (idempotent). Use with AsyncConnection.run_sync."""
+    if conn.dialect.name == "sqlite":
+        existed = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'")).first() is not None
+        for ddl in SQLITE_DDL:
+            conn.execute(text(ddl))
+        if not existed:
+            # index messages stored before the table existed
+            conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+    elif conn.dialect.name == "postgresql":
+        for ddl in POSTGRES_DDL:
+            conn.execute(text(ddl))
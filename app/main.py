@@ -1,22 +1,51 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy import text
 from app.core.config import settings
 from app.api.router import api
 from app.web.routes import web_router
 from app.db.session import engine
-from app.db.base import Base
+from app.db.migrate import migrate
+from app.db.partitions import ensure_partitions
+from app.core.observability import MetricsMiddleware, instrument_engine
+from app.db import profiling
+from app.services.metrics_export import metrics_publisher
+from app.services.workers import start_workers, stop_workers
+from app.services.broadcaster import broadcaster
+from app.services.refcache import refcache
+from app.services.whatsapp_cloud import graph
 
 # Import models so Base knows them
 from app.db import models  # noqa: F401
 
 app = FastAPI(title=settings.APP_NAME)
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+profiling.install(engine)
+if settings.SQL_PROFILING:
+    app.add_middleware(profiling.ProfilingMiddleware)
 
 @app.on_event("startup")
 async def startup():
-    # Create tables automatically (simple start). For production, replace with migrations.
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # With several app servers, turn AUTO_MIGRATE off and run scripts/migrate.py before deploying.
+    if settings.AUTO_MIGRATE:
+        async with engine.connect() as conn:
+            await conn.run_sync(migrate)
+            await conn.run_sync(ensure_partitions, settings.MESSAGE_PARTITIONS_AHEAD)
+            await conn.commit()
+    metrics_publisher.start()
+    await refcache.start()
+    await graph.start()
+    await start_workers()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_workers()
+    await metrics_publisher.stop()
+    await broadcaster.close()
+    await refcache.close()
+    await graph.aclose()
 
 app.include_router(api)
 app.include_router(web_router)
@@ -25,3 +54,9 @@ app.mount("/static", StaticFiles(directory="app/web/static"), name="static")
 @app.get("/health")
 def health():
     return {"ok": True}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    if settings.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        raise HTTPException(401, "Unauthorized")
+    return PlainTextResponse(await metrics_publisher.exposition(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,257 @@
+"""Cold message history in archive segment files.
+
+Messages older than their number's retention (wa_numbers.retention_days, else MESSAGE_RETENTION_DAYS;
+0 keeps everything) leave the database month by month into append-only segments under
+ARCHIVE_ROOT/<number id>/<YYYY-MM>/<segment id>.jsonl.gz. A segment is a run of gzip members, one per
+conversation: the file is an ordinary .gz of JSON lines, while archive_conversations records where each
+conversation's member starts, so scrolling a timeline past the hot window decompresses only that member.
+A later run for the same month writes another segment; segments are never rewritten.
+
+On Postgres, a month partition past the retention of every number is copied out and then detached and
+dropped (app.db.partitions) instead of deleted row by row.
+"""
+import enum
+import gzip
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+import aiofiles
+import aiofiles.os
+from sqlalchemy import select, delete, update, func, case, or_, bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.dialect import dialect_insert
+from app.db.models.archive import ArchiveSegment, ArchiveConversation
+from app.db.models.conversation import Conversation
+from app.db.models.message import Message, Direction, MessageStatus
+from app.db.models.wa_number import WhatsAppNumber
+from app.db import partitions
+from app.services.events import aware, isoformat
+from app.services.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+messages = Message.__table__
+conversations = Conversation.__table__
+
+_enums = {"direction": Direction, "status": MessageStatus}
+_datetimes = ("sent_at", "status_at")
+
+_mark_archived = (
+    update(conversations)
+    .where(conversations.c.id == bindparam("cid"))
+    .values(archived_until=case(
+        (or_(conversations.c.archived_until.is_(None), conversations.c.archived_until < bindparam("at")), bindparam("at")),
+        else_=conversations.c.archived_until,
+    ))
+)
+
+def dump(row) -> dict:
+    out = {}
+    for name in messages.c.keys():
+        value = row[name]
+        if isinstance(value, enum.Enum):
+            value = value.value
+        elif isinstance(value, datetime):
+            value = isoformat(value)
+        out[name] = value
+    return out
+
+def load(data: dict) -> dict:
+    """Column values of an archived message, as the ORM takes them."""
+    values = dict(data)
+    for name in _datetimes:
+        if values.get(name):
+            values[name] = datetime.fromisoformat(values[name])
+    for name, kind in _enums.items():
+        if values.get(name) is not None:
+            values[name] = kind(values[name])
+    return values
+
+def member_stats(rows) -> dict:
+    """The ArchiveConversation counters of a member's messages (oldest first)."""
+    stats = {"inbound_count": 0, "unanswered_count": 0, "last_inbound_at": None, "last_outbound_at": None}
+    for row in rows:
+        if row["direction"] == Direction.OUT:
+            stats["unanswered_count"] = 0
+            stats["last_outbound_at"] = row["sent_at"]
+        else:
+            stats["inbound_count"] += 1
+            stats["unanswered_count"] += 1
+            stats["last_inbound_at"] = row["sent_at"]
+    return stats
+
+def full_path(segment_path: str) -> str:
+    return os.path.join(settings.ARCHIVE_ROOT, segment_path)
+
+def retention_cutoff(number: WhatsAppNumber, now: datetime) -> datetime | None:
+    days = number.retention_days if number.retention_days is not None else settings.MESSAGE_RETENTION_DAYS
+    return now - timedelta(days=days) if days else None
+
+async def is_partitioned(db: AsyncSession) -> bool:
+    return await db.run_sync(lambda s: partitions.is_partitioned(s.connection()))
+
+async def archive_range(db: AsyncSession, wa_number_id: int, lo: datetime, hi: datetime, remove: bool = True) -> ArchiveSegment | None:
+    """Write the number's messages with lo <= sent_at < hi to a new segment and, with `remove`, delete
+    them in the same statement (DELETE ... RETURNING, so a row is only gone once it is in the file).
+    The caller commits; until then the segment is not referenced and its file is harmless."""
+    conv_ids = list((await db.execute(
+        select(messages.c.conversation_id).distinct()
+        .join(conversations, conversations.c.id == messages.c.conversation_id)
+        .where(conversations.c.wa_number_id == wa_number_id, messages.c.sent_at >= lo, messages.c.sent_at < hi)
+        .order_by(messages.c.conversation_id)
+    )).scalars())
+    if not conv_ids:
+        return None
+    segment = ArchiveSegment(wa_number_id=wa_number_id, month=f"{lo:%Y-%m}", created_at=datetime.now(timezone.utc))
+    db.add(segment)
+    await db.flush()
+    segment.path = os.path.join(str(wa_number_id), segment.month, f"{segment.id}.jsonl.gz")
+    dest = full_path(segment.path)
+    await aiofiles.os.makedirs(os.path.dirname(dest), exist_ok=True)
+
+    digest = hashlib.sha256()
+    index, marks = [], []
+    async with aiofiles.open(dest + ".part", "wb") as f:
+        for cid in conv_ids:
+            where = (messages.c.conversation_id == cid, messages.c.sent_at >= lo, messages.c.sent_at < hi)
+            stmt = delete(messages).where(*where).returning(*messages.c) if remove else select(messages).where(*where)
+            rows = sorted((await db.execute(stmt)).mappings().all(), key=lambda r: (r["sent_at"], r["id"]))
+            if not rows:
+                continue
+            member = gzip.compress(b"".join(json.dumps(dump(r), ensure_ascii=False).encode() + b"\n" for r in rows))
+            await f.write(member)
+            digest.update(member)
+            index.append(ArchiveConversation(
+                segment_id=segment.id, conversation_id=cid, member_offset=segment.size, member_size=len(member),
+                message_count=len(rows), first_sent_at=rows[0]["sent_at"], last_sent_at=rows[-1]["sent_at"],
+                **member_stats(rows),
+            ))
+            marks.append({"cid": cid, "at": rows[-1]["sent_at"]})
+            segment.size += len(member)
+            segment.message_count += len(rows)
+        await f.flush()
+        await aiofiles.os.wrap(os.fsync)(f.fileno())
+    await aiofiles.os.replace(dest + ".part", dest)
+
+    segment.sha256 = digest.hexdigest()
+    segment.first_sent_at = min(a.first_sent_at for a in index)
+    segment.last_sent_at = max(a.last_sent_at for a in index)
+    db.add_all(index)
+    await db.execute(_mark_archived, marks)
+    metrics.inc("archive_messages_total", segment.message_count)
+    return segment
+
+async def archive_number(db: AsyncSession, number: WhatsAppNumber, now: datetime) -> list[ArchiveSegment]:
+    """Archive what is past the number's retention, one segment and one commit per month."""
+    cutoff = retention_cutoff(number, now)
+    if cutoff is None:
+        return []
+    oldest = (await db.execute(
+        select(func.min(messages.c.sent_at))
+        .join(conversations, conversations.c.id == messages.c.conversation_id)
+        .where(conversations.c.wa_number_id == number.id, messages.c.sent_at < cutoff)
+    )).scalar()
+    segments = []
+    month = partitions.month_start(aware(oldest)) if oldest else None
+    while month is not None and month < cutoff:
+        segment = await archive_range(db, number.id, month, min(partitions.add_months(month, 1), cutoff))
+        await db.commit()
+        if segment:
+            segments.append(segment)
+        month = partitions.add_months(month, 1)
+    return segments
+
+async def drop_expired_partitions(db: AsyncSession, numbers: list[WhatsAppNumber], now: datetime) -> list[ArchiveSegment]:
+    """Postgres: copy out and drop the month partitions that are past every number's retention."""
+    cutoffs = [retention_cutoff(n, now) for n in numbers]
+    if not cutoffs or None in cutoffs or not await is_partitioned(db):
+        return []
+    horizon = min(cutoffs)
+    segments = []
+    for month in await db.run_sync(lambda s: partitions.months(s.connection())):
+        if partitions.add_months(month, 1) > horizon:
+            break
+        # no writes into the month while it is copied out
+        await db.execute(text(f"LOCK TABLE {partitions.partition_name(month)} IN SHARE MODE"))
+        for number in numbers:
+            segment = await archive_range(db, number.id, month, partitions.add_months(month, 1), remove=False)
+            if segment:
+                segments.append(segment)
+        await db.run_sync(lambda s: partitions.drop_month(s.connection(), month))
+        await db.commit()
+        log.info("archived and dropped partition %s", partitions.partition_name(month))
+    return segments
+
+async def run(db: AsyncSession, wa_number_ids: list[int] | None = None, now: datetime | None = None) -> list[ArchiveSegment]:
+    """One archive pass over the given numbers (default: all of them)."""
+    now = now or datetime.now(timezone.utc)
+    q = select(WhatsAppNumber).order_by(WhatsAppNumber.id)
+    if wa_number_ids:
+        q = q.where(WhatsAppNumber.id.in_(wa_number_ids))
+    numbers = list((await db.execute(q)).scalars().all())
+    segments = [] if wa_number_ids else await drop_expired_partitions(db, numbers, now)
+    for number in numbers:
+        segments += await archive_number(db, number, now)
+    return segments
+
+async def read_member(segment_path: str, offset: int, size: int) -> list[Message]:
+    async with aiofiles.open(full_path(segment_path), "rb") as f:
+        await f.seek(offset)
+        raw = await f.read(size)
+    return [Message(**load(json.loads(line))) for line in gzip.decompress(raw).splitlines()]
+
+async def read_conversation(db: AsyncSession, conversation_id: int, before: tuple[datetime, int] | None, limit: int) -> list[Message]:
+    """Up to `limit` archived messages of a conversation older than `before` (sent_at, id), newest first."""
+    q = (
+        select(ArchiveConversation.member_offset, ArchiveConversation.member_size, ArchiveConversation.last_sent_at, ArchiveSegment.path)
+        .join(ArchiveSegment, ArchiveSegment.id == ArchiveConversation.segment_id)
+        .where(ArchiveConversation.conversation_id == conversation_id, ArchiveSegment.rehydrated_at.is_(None))
+    )
+    if before:
+        q = q.where(ArchiveConversation.first_sent_at <= before[0])
+    q = q.order_by(ArchiveConversation.last_sent_at.desc())
+    found: list[Message] = []
+    for offset, size, last_sent_at, path in (await db.execute(q)).all():
+        # segments of one month can overlap (late arrivals): stop only when the next one is entirely older
+        if len(found) >= limit and aware(last_sent_at) < found[limit - 1].sent_at:
+            break
+        rows = await read_member(path, offset, size)
+        found += [m for m in rows if before is None or (m.sent_at, m.id) < before]
+        found.sort(key=lambda m: (m.sent_at, m.id), reverse=True)
+    metrics.inc("archive_reads_total")
+    return found[:limit]
+
+async def archived_meta_ids(db: AsyncSession, candidates: dict[int, list[tuple[str, datetime]]]) -> set[str]:
+    """Which of the {conversation_id: [(meta_message_id, sent_at)]} messages are in the archive: the unique
+    index no longer sees them, so a late redelivery of one would be stored again."""
+    q = (
+        select(ArchiveConversation.conversation_id, ArchiveConversation.member_offset, ArchiveConversation.member_size,
+               ArchiveConversation.first_sent_at, ArchiveConversation.last_sent_at, ArchiveSegment.path)
+        .join(ArchiveSegment, ArchiveSegment.id == ArchiveConversation.segment_id)
+        .where(ArchiveConversation.conversation_id.in_(candidates), ArchiveSegment.rehydrated_at.is_(None))
+    )
+    found = set()
+    for cid, offset, size, first, last, path in (await db.execute(q)).all():
+        wanted = {mid for mid, sent_at in candidates[cid] if aware(first) <= sent_at <= aware(last)} - found
+        if wanted:
+            found |= wanted & {m.meta_message_id for m in await read_member(path, offset, size)}
+    return found
+
+async def rehydrate(db: AsyncSession, segment: ArchiveSegment) -> int:
+    """Copy a segment's messages back into the database (rows still there are kept). The caller commits.
+
+    Raise the number's retention first, or the next archive run moves them out again."""
+    async with aiofiles.open(full_path(segment.path), "rb") as f:
+        raw = await f.read()
+    rows = [load(json.loads(line)) for line in gzip.decompress(raw).splitlines()]
+    if await is_partitioned(db):
+        month = datetime.strptime(segment.month, "%Y-%m").replace(tzinfo=timezone.utc)
+        await db.run_sync(lambda s: partitions.ensure_month(s.connection(), month))
+    if rows:
+        await db.execute(dialect_insert(db, Message).on_conflict_do_nothing(), rows)
+    segment.rehydrated_at = datetime.now(timezone.utc)
+    return len(rows)
@@ -1,26 +1,157 @@
+import asyncio
+import json
+import time
 from typing import Dict, Set
 from fastapi import WebSocket
+from app.core.config import settings
+from app.services.metrics import metrics
+from app.services.pubsub import make_pubsub
+
+CHANNEL_PREFIX = "ws:"
+SLOW_CONSUMER_CLOSE_CODE = 1013  # "try again later"; the browser reconnects
+
+def dumps(payload: dict) -> str:
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+class Connection:
+    """A socket's bounded outbound queue, drained by its own sender task."""
+
+    def __init__(self, ws: WebSocket, on_failed, maxsize: int, send_timeout: float):
+        self.ws = ws
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.on_failed = on_failed
+        self.send_timeout = send_timeout
+        self.closed = False
+        self.task = asyncio.create_task(self.run())
+
+    def offer(self, room: str, data: str) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait((room, data, time.perf_counter()))
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def run(self):
+        while True:
+            room, data, queued_at = await self.queue.get()
+            try:
+                await asyncio.wait_for(self.ws.send_text(data), self.send_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.on_failed(self.ws, "send_error")
+                return
+            metrics.observe("ws_send_latency_seconds", time.perf_counter() - queued_at, room=room)
+
+    def stop(self):
+        self.closed = True
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
 
 class Broadcaster:
-    def __init__(self):
+    """Room fan-out to WebSockets.
+
+    A socket is connect()ed once and then joins any number of rooms (one socket per browser session,
+    multiplexing all the numbers its user can see). Without a pubsub backend rooms are process-local.
+    With one, broadcast() publishes to the room channel and every process subscribed to it (one
+    subscription per room that has local sockets) relays the message to its own sockets.
+
+    Payloads are serialized once per broadcast. Each socket gets a bounded queue; sockets
+    that overflow it or fail a send are evicted and closed so one stalled browser never
+    delays the rest of the room.
+    """
+
+    def __init__(self, pubsub=None):
         self.rooms: Dict[str, Set[WebSocket]] = {}
+        self.conns: Dict[WebSocket, Connection] = {}
+        self.memberships: Dict[WebSocket, Set[str]] = {}
+        self.pubsub = pubsub
 
-    async def join(self, room: str, ws: WebSocket):
+    async def connect(self, ws: WebSocket):
         await ws.accept()
+        self.conns[ws] = Connection(ws, self.evict, settings.WS_SEND_QUEUE_SIZE, settings.WS_SEND_TIMEOUT_SECONDS)
+        self.memberships[ws] = set()
+        metrics.set("ws_connections", len(self.conns))
+
+    async def join(self, room: str, ws: WebSocket):
+        if ws not in self.conns or room in self.memberships[ws]:
+            return
+        self.memberships[ws].add(room)
+        first = room not in self.rooms
         self.rooms.setdefault(room, set()).add(ws)
+        metrics.set("ws_room_connections", len(self.rooms[room]), room=room)
+        if first and self.pubsub is not None:
+            await self.pubsub.subscribe(CHANNEL_PREFIX + room, self.on_message)
 
-    def leave(self, room: str, ws: WebSocket):
+    async def leave(self, room: str, ws: WebSocket):
+        self.memberships.get(ws, set()).discard(room)
         if room in self.rooms:
             self.rooms[room].discard(ws)
+            metrics.set("ws_room_connections", len(self.rooms[room]), room=room)
             if not self.rooms[room]:
                 self.rooms.pop(room, None)
+                if self.pubsub is not None:
+                    await self.pubsub.unsubscribe(CHANNEL_PREFIX + room, self.on_message)
+
+    def joined(self, ws: WebSocket) -> Set[str]:
+        return set(self.memberships.get(ws, ()))
+
+    async def disconnect(self, ws: WebSocket):
+        for room in self.joined(ws):
+            await self.leave(room, ws)
+        self.memberships.pop(ws, None)
+        conn = self.conns.pop(ws, None)
+        if conn is not None:
+            conn.stop()
+        metrics.set("ws_connections", len(self.conns))
+
+    def send(self, ws: WebSocket, payload: dict):
+        """Queue a message for one socket only (acks, heartbeats)."""
+        conn = self.conns.get(ws)
+        if conn is not None and not conn.offer("direct", dumps(payload)):
+            self.evict(ws, "overflow")
+
+    def evict(self, ws: WebSocket, reason: str):
+        conn = self.conns.get(ws)
+        if conn is None or conn.closed:
+            return
+        conn.closed = True
+        metrics.inc("ws_dropped_connections_total", reason=reason)
+        asyncio.create_task(self._drop(ws))
+
+    async def _drop(self, ws: WebSocket):
+        await self.disconnect(ws)
+        try:
+            await ws.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:
+            pass
 
     async def broadcast(self, room: str, payload: dict):
-        conns = list(self.rooms.get(room, []))
-        for ws in conns:
-            try:
-                await ws.send_json(payload)
-            except Exception:
-                pass
+        data = dumps(payload)
+        if self.pubsub is not None:
+            await self.pubsub.publish(CHANNEL_PREFIX + room, data)
+        else:
+            await self.deliver(room, data)
+
+    async def on_message(self, channel: str, data: str):
+        await self.deliver(channel[len(CHANNEL_PREFIX):], data)
+
+    async def deliver(self, room: str, data: str):
+        started = time.perf_counter()
+        for ws in list(self.rooms.get(room, ())):
+            conn = self.conns.get(ws)
+            if conn is not None and not conn.offer(room, data):
+                self.evict(ws, "overflow")
+        metrics.observe("ws_fanout_seconds", time.perf_counter() - started, room=room)
+
+    async def close(self):
+        for conn in self.conns.values():
+            conn.stop()
+        self.conns.clear()
+        self.memberships.clear()
+        if self.pubsub is not None:
+            await self.pubsub.close()
 
-broadcaster = Broadcaster()
+broadcaster = Broadcaster(make_pubsub())
@@ -0,0 +1,95 @@
+from sqlalchemy import select, update, func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.db.dialect import dialect_insert
+from app.db.models.number_stats import NumberStats
+from app.db.models.wa_number import WhatsAppNumber
+from app.db.models.conversation import Conversation, ConversationStatus
+from app.db.models.message import Message, Direction
+from app.db.models.archive import ArchiveSegment, ArchiveConversation
+
+FIELDS = ("conversations", "open_conversations", "inbound_messages")
+
+async def bump(db: AsyncSession, deltas: dict[int, dict[str, int]]):
+    """Add {wa_number_id: {field: delta}} to the counters in one upsert, inside the caller's transaction."""
+    rows = [
+        {"wa_number_id": nid, **{f: d.get(f, 0) for f in FIELDS}}
+        for nid, d in deltas.items() if any(d.values())
+    ]
+    if not rows:
+        return
+    stmt = dialect_insert(db, NumberStats)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[NumberStats.wa_number_id],
+        set_={f: getattr(NumberStats.__table__.c, f) + getattr(stmt.excluded, f) for f in FIELDS},
+    )
+    await db.execute(stmt, rows)
+
+async def change_status(db: AsyncSession, conv: Conversation, new: ConversationStatus) -> bool:
+    """Move a conversation to `new` and adjust the open counter in the same transaction.
+
+    The UPDATE is guarded on the old status so two agents racing on it count the change once.
+    """
+    old = conv.status
+    if old == new:
+        return False
+    res = await db.execute(
+        update(Conversation)
+        .where(Conversation.id == conv.id, Conversation.status == old)
+        .values(status=new)
+        .execution_options(synchronize_session=False)
+    )
+    if res.rowcount != 1:
+        return False
+    set_committed_value(conv, "status", new)
+    delta = int(new == ConversationStatus.open) - int(old == ConversationStatus.open)
+    await bump(db, {conv.wa_number_id: {"open_conversations": delta}})
+    return True
+
+async def totals(db: AsyncSession, number_ids: list[int]) -> dict[str, int]:
+    """Dashboard numbers for a set of visible numbers: a sum over at most one row per number."""
+    row = (await db.execute(
+        select(*[func.coalesce(func.sum(getattr(NumberStats, f)), 0) for f in FIELDS])
+        .where(NumberStats.wa_number_id.in_(number_ids))
+    )).one()
+    return dict(zip(FIELDS, row))
+
+async def reconcile(db: AsyncSession) -> dict[int, dict[str, int]]:
+    """Recompute every number's counters from the source tables (messages and the archive index) and fix drift.
+
+    The counts and the stored counters are read in one statement and each correction is added with
+    bump(), so an ingest that commits meanwhile keeps its increment instead of being overwritten.
+    Returns {wa_number_id: {field: correction}} for the rows that were wrong.
+    """
+    def conv(*where):
+        return select(func.count()).select_from(Conversation).where(Conversation.wa_number_id == WhatsAppNumber.id, *where).scalar_subquery()
+    live_inbound = (
+        select(func.count()).select_from(Message)
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .where(Conversation.wa_number_id == WhatsAppNumber.id, Message.direction == Direction.IN)
+        .scalar_subquery()
+    )
+    # plus what was archived out of messages
+    archived_inbound = (
+        select(func.coalesce(func.sum(ArchiveConversation.inbound_count), 0))
+        .join(ArchiveSegment, ArchiveSegment.id == ArchiveConversation.segment_id)
+        .where(ArchiveSegment.wa_number_id == WhatsAppNumber.id, ArchiveSegment.rehydrated_at.is_(None))
+        .scalar_subquery()
+    )
+    q = await db.execute(
+        select(
+            WhatsAppNumber.id,
+            conv(), conv(Conversation.status == ConversationStatus.open), live_inbound + archived_inbound,
+            *[func.coalesce(getattr(NumberStats, f), 0) for f in FIELDS],
+        ).outerjoin(NumberStats, NumberStats.wa_number_id == WhatsAppNumber.id)
+    )
+    drift = {}
+    for nid, *counts in q.all():
+        actual, seen = counts[:len(FIELDS)], counts[len(FIELDS):]
+        diff = {f: want - got for f, want, got in zip(FIELDS, actual, seen) if want != got}
+        if diff:
+            drift[nid] = diff
+    await bump(db, drift)
+    await db.commit()
+    return drift
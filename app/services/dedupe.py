@@ -0,0 +1,49 @@
+from collections import OrderedDict
+from app.core.config import settings
+
+class RecentIds:
+    """Bounded in-process set of recently ingested Meta message ids (oldest evicted first)."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.ids: OrderedDict[str, None] = OrderedDict()
+
+    async def seen(self, ids: list[str]) -> set[str]:
+        return {i for i in ids if i in self.ids}
+
+    async def add(self, ids: list[str]):
+        for i in ids:
+            self.ids[i] = None
+            self.ids.move_to_end(i)
+        while len(self.ids) > self.maxsize:
+            self.ids.popitem(last=False)
+
+class RedisRecentIds:
+    """Same contract as RecentIds, shared by every worker; entries expire after ttl_seconds."""
+
+    def __init__(self, ttl_seconds: int, prefix: str = "wa_seen:"):
+        self.ttl = ttl_seconds
+        self.prefix = prefix
+
+    async def seen(self, ids: list[str]) -> set[str]:
+        from app.services.redis_client import r
+        if not ids:
+            return set()
+        values = await r.mget([self.prefix + i for i in ids])
+        return {i for i, v in zip(ids, values) if v is not None}
+
+    async def add(self, ids: list[str]):
+        from app.services.redis_client import r
+        if not ids:
+            return
+        async with r.pipeline(transaction=False) as pipe:
+            for i in ids:
+                pipe.set(self.prefix + i, "1", ex=self.ttl)
+            await pipe.execute()
+
+def make_recent_ids():
+    if settings.DEDUPE_BACKEND == "redis":
+        return RedisRecentIds(settings.DEDUPE_TTL_SECONDS)
+    return RecentIds(settings.DEDUPE_MAX_IDS)
+
+recent_message_ids = make_recent_ids()
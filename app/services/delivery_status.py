@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from sqlalchemy import select, update, case, bindparam, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.db.models.conversation import Conversation
+from app.db.models.message import Message, Direction, MessageStatus
+from app.services.broadcaster import broadcaster
+from app.services.events import message_status
+from app.services.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# Statuses only move forward; Meta may deliver them out of order.
+RANK = {
+    MessageStatus.queued: 0,
+    MessageStatus.sending: 1,
+    MessageStatus.sent: 2,
+    MessageStatus.delivered: 3,
+    MessageStatus.read: 4,
+    MessageStatus.failed: 5,
+}
+WEBHOOK_STATUSES = {"sent", "delivered", "read", "failed"}
+
+messages = Message.__table__
+
+_apply = (
+    update(messages)
+    .where(
+        messages.c.meta_message_id == bindparam("mid"),
+        messages.c.direction == Direction.OUT,
+        case(RANK, value=messages.c.status, else_=-1) < bindparam("rank"),
+    )
+    .values(
+        status=bindparam("st", type_=messages.c.status.type),
+        status_at=bindparam("at", type_=messages.c.status_at.type),
+        error=func.coalesce(bindparam("err", type_=messages.c.error.type), messages.c.error),
+    )
+)
+
+def parse_status(s: dict) -> dict | None:
+    """One entry of value.statuses as an update row, or None if it is not one we track."""
+    if s.get("status") not in WEBHOOK_STATUSES or not s.get("id"):
+        return None
+    status = MessageStatus(s["status"])
+    error = None
+    if status == MessageStatus.failed:
+        e = (s.get("errors") or [{}])[0]
+        error = f"{e.get('code', '')} {e.get('title') or e.get('message') or ''}".strip()[:255] or None
+    at = datetime.fromtimestamp(int(s["timestamp"]), tz=timezone.utc) if s.get("timestamp") else datetime.now(timezone.utc)
+    return {"mid": s["id"], "st": status, "rank": RANK[status], "at": at, "err": error}
+
+async def apply_statuses(db: AsyncSession, rows: list[dict]) -> tuple[list[tuple[str, dict]], set[str]]:
+    """Write the rows in one executemany UPDATE.
+
+    Returns message:status events for rows now in that state, and the Meta ids that matched a message.
+    """
+    await db.execute(_apply, rows)
+    wanted = {r["mid"]: r["st"] for r in rows}
+    q = await db.execute(
+        select(Message.id, Message.meta_message_id, Message.status, Message.error, Conversation.id, Conversation.wa_number_id)
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .where(Message.meta_message_id.in_(wanted))
+    )
+    events, matched = [], set()
+    for message_id, mid, status, error, conversation_id, wa_number_id in q.all():
+        matched.add(mid)
+        if status == wanted[mid]:
+            events.append(message_status(wa_number_id, message_id, conversation_id, status, error))
+    await db.commit()
+    return events, matched
+
+class StatusCoalescer:
+    """Buffers status callbacks for a short window, keeping only the most advanced state per message.
+
+    Runs next to the webhook workers. add() returns a future that resolves once its statuses are
+    written (or given up), and the webhook stream entry is only acked then, so statuses buffered
+    when a process dies are redelivered. A status for a Meta id no message carries yet (a send whose
+    outbox commit is still in flight) is kept and retried with each flush for up to retry_seconds.
+    """
+
+    def __init__(self, window: float, max_pending: int, retry_seconds: float):
+        self.window = window
+        self.max_pending = max_pending
+        self.retry_seconds = retry_seconds
+        self.pending: dict[str, dict] = {}
+        self.unmatched: dict[str, tuple[dict, float]] = {}  # mid -> (row, first tried)
+        self.waiters: dict[str, list[asyncio.Future]] = {}
+        self.full = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    def add(self, rows: list[dict]) -> asyncio.Future | None:
+        if not rows:
+            return None
+        loop = asyncio.get_running_loop()
+        futures = []
+        for row in rows:
+            metrics.inc("status_updates_received_total", status=row["st"].value)
+            futures.append(loop.create_future())
+            self.waiters.setdefault(row["mid"], []).append(futures[-1])
+            cur = self.pending.get(row["mid"])
+            if cur is not None:
+                metrics.inc("status_updates_coalesced_total")
+                if (cur["rank"], cur["at"]) >= (row["rank"], row["at"]):
+                    continue
+            self.pending[row["mid"]] = row
+        if len(self.pending) >= self.max_pending:
+            self.full.set()
+        return asyncio.gather(*futures)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.full.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("status flush failed")
+                await asyncio.sleep(1)
+
+    async def flush(self):
+        self.full.clear()
+        batch, self.pending = self.pending, {}
+        for mid, (row, _) in self.unmatched.items():
+            cur = batch.get(mid)
+            if cur is None or (cur["rank"], cur["at"]) < (row["rank"], row["at"]):
+                batch[mid] = row
+        if not batch:
+            return
+        # statuses added while this batch is written wait for the next flush
+        waiting = {mid: self.waiters.pop(mid, []) for mid in batch}
+        rows = list(batch.values())
+        try:
+            async with AsyncSessionLocal() as db:
+                events, matched = await apply_statuses(db, rows)
+        except Exception:
+            # put them back unless newer states arrived meanwhile
+            for row in rows:
+                self.pending.setdefault(row["mid"], row)
+            for mid, futures in waiting.items():
+                self.waiters[mid] = futures + self.waiters.get(mid, [])
+            raise
+        metrics.observe("status_flush_rows", len(rows))
+
+        now = time.monotonic()
+        settled = list(matched)
+        for mid in batch.keys() - matched:
+            first = self.unmatched.get(mid, (None, now))[1]
+            if now - first < self.retry_seconds:
+                self.unmatched[mid] = (batch[mid], first)
+                self.waiters[mid] = waiting.pop(mid) + self.waiters.get(mid, [])
+            else:
+                settled.append(mid)
+                metrics.inc("status_updates_unmatched_total")
+                log.info("%s status for unknown message %s dropped", batch[mid]["st"].value, mid)
+        for mid in settled:
+            self.unmatched.pop(mid, None)
+        while len(self.unmatched) > self.max_pending:
+            mid = next(iter(self.unmatched))
+            del self.unmatched[mid]
+            waiting[mid] = self.waiters.pop(mid, [])
+            metrics.inc("status_updates_unmatched_total")
+        for futures in waiting.values():
+            for future in futures:
+                if not future.done():
+                    future.set_result(None)
+
+        for room, payload in events:
+            await broadcaster.broadcast(room=room, payload=payload)
+
+status_coalescer = StatusCoalescer(settings.STATUS_FLUSH_SECONDS, settings.STATUS_MAX_PENDING, settings.STATUS_RETRY_SECONDS)
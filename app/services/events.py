@@ -0,0 +1,107 @@
+from datetime import datetime, timezone
+
+from app.db.models.conversation import Conversation
+from app.db.models.message import Message, Direction, MessageStatus
+
+def aware(dt: datetime | None) -> datetime | None:
+    # SQLite hands back naive datetimes even for DateTime(timezone=True) columns
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+def isoformat(dt: datetime | None) -> str | None:
+    return aware(dt).isoformat() if dt else None
+
+def number_room(wa_number_id: int) -> str:
+    return f"number:{wa_number_id}"
+
+def user_room(user_id: int) -> str:
+    """Events for one user only; every socket of the user is in it."""
+    return f"user:{user_id}"
+
+def message_json(m: Message) -> dict:
+    return {
+        "id": m.id,
+        "conversation_id": m.conversation_id,
+        "direction": m.direction.value,
+        "text": m.body,
+        "at": isoformat(m.sent_at),
+        "status": m.status.value if m.status else None,
+        "media": media_json(m),
+    }
+
+def media_json(m: Message) -> dict | None:
+    if not m.media_type:
+        return None
+    return {
+        "type": m.media_type,
+        "mime": m.media_mime,
+        "filename": m.media_filename,
+        "ready": m.media_sha256 is not None,
+    }
+
+def search_hit_json(m: Message, wa_number_id: int, customer_wa_id: str) -> dict:
+    return {**message_json(m), "wa_number_id": wa_number_id, "customer_wa_id": customer_wa_id}
+
+def conversation_json(c: Conversation) -> dict:
+    return {
+        "id": c.id,
+        "wa_number_id": c.wa_number_id,
+        "customer_wa_id": c.customer_wa_id,
+        "status": c.status.value,
+        "last_message_at": isoformat(c.last_message_at),
+        "last_inbound_at": isoformat(c.last_inbound_at),
+        "last_message_preview": c.last_message_preview,
+        "last_direction": c.last_direction.value if c.last_direction else None,
+        "message_count": c.message_count,
+        "unread_count": c.unread_count,
+    }
+
+def message_new(wa_number_id: int, customer_wa_id: str, m: Message) -> tuple[str, dict]:
+    """The message:new event carries everything the inbox needs to patch itself without a reload."""
+    payload = {"event": "message:new", **message_json(m), "wa_number_id": wa_number_id, "customer_wa_id": customer_wa_id}
+    if m.direction == Direction.IN:
+        payload["from"] = customer_wa_id
+    return number_room(wa_number_id), payload
+
+def conversation_lock(wa_number_id: int, conversation_id: int, locked_by: int | None, ttl: int | None = None) -> tuple[str, dict]:
+    """locked_by None means released; locks also lapse silently after ttl seconds."""
+    return number_room(wa_number_id), {
+        "event": "conversation:lock",
+        "wa_number_id": wa_number_id,
+        "conversation_id": conversation_id,
+        "locked_by": locked_by,
+        "ttl": ttl,
+    }
+
+def conversation_status(c: Conversation) -> tuple[str, dict]:
+    return number_room(c.wa_number_id), {
+        "event": "conversation:status",
+        "wa_number_id": c.wa_number_id,
+        "conversation_id": c.id,
+        "status": c.status.value,
+    }
+
+def conversation_read(user_id: int, c: Conversation) -> tuple[str, dict]:
+    """The user opened the conversation; their badge for it is cleared."""
+    return user_room(user_id), {"event": "conversation:read", "wa_number_id": c.wa_number_id, "conversation_id": c.id, "unread": 0}
+
+def message_status(wa_number_id: int, message_id: int, conversation_id: int, status: MessageStatus, error: str | None = None) -> tuple[str, dict]:
+    return number_room(wa_number_id), {
+        "event": "message:status",
+        "wa_number_id": wa_number_id,
+        "id": message_id,
+        "conversation_id": conversation_id,
+        "status": status.value,
+        "error": error,
+    }
+
+def message_media(wa_number_id: int, message_id: int, conversation_id: int, mime: str | None) -> tuple[str, dict]:
+    """A media file finished downloading and can be fetched now."""
+    return number_room(wa_number_id), {
+        "event": "message:media",
+        "wa_number_id": wa_number_id,
+        "id": message_id,
+        "conversation_id": conversation_id,
+        "mime": mime,
+    }
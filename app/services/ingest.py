@@ -0,0 +1,216 @@
+import json
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from sqlalchemy import select, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import AsyncSessionLocal
+from app.db.dialect import dialect_insert
+from app.db.models.conversation import Conversation
+from app.db.models.message import Message, Direction
+from app.services.broadcaster import broadcaster
+from app.services.events import aware, message_new
+from app.services.summaries import record_inbound
+from app.services import archive, counters
+from app.services.refcache import refcache
+from app.services.stream_queue import make_queue
+from app.services.dedupe import recent_message_ids
+from app.services.metrics import metrics
+from app.services.delivery_status import parse_status, status_coalescer
+from app.services.media import media_fields, media_queue
+
+webhook_queue = make_queue("wa:webhooks")
+
+# executemany needs the same keys in every row
+MEDIA_NONE = {"media_type": None, "media_id": None, "media_mime": None, "media_filename": None}
+
+def media_label(media: dict | None) -> str | None:
+    return f"[{media['media_type']}]" if media else None
+
+CONV_KEY = (Conversation.wa_number_id, Conversation.customer_wa_id, Conversation.id, Conversation.archived_until)
+
+async def conversation_ids(db: AsyncSession, pairs: set[tuple[int, str]]) -> dict[tuple[int, str], tuple[int, datetime | None]]:
+    """{(wa_number_id, customer_wa_id): (conversation id, archived_until)} for the pairs that exist."""
+    # OR of pairs rather than a row-value IN: SQLite walks the whole index for the latter
+    q = select(*CONV_KEY).where(or_(*[
+        and_(Conversation.wa_number_id == nid, Conversation.customer_wa_id == wa) for nid, wa in pairs
+    ]))
+    return {(nid, wa): (cid, until) for nid, wa, cid, until in (await db.execute(q)).all()}
+
+def parse_timestamp(ts) -> datetime:
+    return datetime.fromtimestamp(int(ts), tz=timezone.utc) if ts else datetime.now(timezone.utc)
+
+def iter_values(data: dict):
+    """Yield (phone_number_id, value) for every change of every entry in a delivery."""
+    for entry in data.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            phone_number_id = (value.get("metadata") or {}).get("phone_number_id")
+            if phone_number_id:
+                yield phone_number_id, value
+
+async def ingest_delivery(db: AsyncSession, data: dict) -> list[tuple[str, dict]]:
+    """Persist every inbound message of one webhook delivery in a single transaction.
+
+    Returns the (room, payload) events to broadcast once the commit succeeded.
+    """
+    inbound = []
+    batch_ids = set()
+    for phone_number_id, value in iter_values(data):
+        for m in value.get("messages") or []:
+            if not m.get("from") or not m.get("id"):
+                continue
+            if m.get("type") != "text" and media_fields(m) is None:
+                continue
+            if m["id"] in batch_ids:
+                metrics.inc("webhook_duplicates_dropped_total", stage="batch")
+                continue
+            batch_ids.add(m["id"])
+            inbound.append((phone_number_id, m))
+    if not inbound:
+        return []
+
+    # Meta retries redeliver whole bodies; drop ids we ingested recently before touching the DB
+    seen = await recent_message_ids.seen(list(batch_ids))
+    if seen:
+        metrics.inc("webhook_duplicates_dropped_total", len(seen), stage="cache")
+        inbound = [(p, m) for p, m in inbound if m["id"] not in seen]
+        if not inbound:
+            return []
+
+    by_phone = await refcache.number_by_phone(db)
+
+    parsed = []
+    for phone_number_id, m in inbound:
+        wa_num = by_phone.get(phone_number_id)
+        if not wa_num:
+            continue
+        wa_number_id = wa_num.id
+        p = {
+            "wa_number_id": wa_number_id,
+            "from": m["from"],
+            "text": (m.get("text") or {}).get("body"),
+            "meta_message_id": m["id"],
+            "sent_at": parse_timestamp(m.get("timestamp")),
+            "media": media_fields(m),
+        }
+        if p["media"]:
+            p["text"] = p["media"].pop("text")
+        parsed.append(p)
+    if not parsed:
+        return []
+
+    pairs = {(p["wa_number_id"], p["from"]) for p in parsed}
+    convs = await conversation_ids(db, pairs)
+
+    created = []
+    missing = [{"wa_number_id": nid, "customer_wa_id": wa} for nid, wa in pairs if (nid, wa) not in convs]
+    if missing:
+        # the unique index settles a concurrent webhook creating the same conversation
+        stmt = (
+            dialect_insert(db, Conversation)
+            .on_conflict_do_nothing(index_elements=["wa_number_id", "customer_wa_id"])
+            .returning(*CONV_KEY)
+        )
+        created = (await db.execute(stmt, missing)).all()
+        convs.update({(nid, wa): (cid, until) for nid, wa, cid, until in created})
+        lost = {pair for pair in pairs if pair not in convs}
+        if lost:
+            convs.update(await conversation_ids(db, lost))
+
+    # an archived message is gone from the unique index: check redeliveries of old ones against the archive
+    old = defaultdict(list)
+    for p in parsed:
+        cid, until = convs[(p["wa_number_id"], p["from"])]
+        if until is not None and p["sent_at"] <= aware(until):
+            old[cid].append((p["meta_message_id"], p["sent_at"]))
+    archived = await archive.archived_meta_ids(db, old) if old else set()
+    if archived:
+        metrics.inc("webhook_duplicates_dropped_total", len(archived), stage="archive")
+        parsed = [p for p in parsed if p["meta_message_id"] not in archived]
+        if not parsed:
+            await db.commit()
+            await recent_message_ids.add(list(archived))
+            return []
+
+    rows = [{
+        "conversation_id": convs[(p["wa_number_id"], p["from"])][0],
+        "direction": Direction.IN,
+        "body": p["text"],
+        "meta_message_id": p["meta_message_id"],
+        "sent_at": p["sent_at"],
+        **(p["media"] or MEDIA_NONE),
+    } for p in parsed]
+    stmt = (
+        dialect_insert(db, Message)
+        .on_conflict_do_nothing(index_elements=["meta_message_id", "sent_at"])
+        .returning(Message.meta_message_id, Message.id)
+    )
+    inserted = dict((await db.execute(stmt, rows)).all())
+    if len(inserted) < len(parsed):
+        metrics.inc("webhook_duplicates_dropped_total", len(parsed) - len(inserted), stage="db")
+    metrics.inc("webhook_messages_ingested_total", len(inserted))
+
+    events = []
+    stored = []
+    for p in parsed:
+        if p["meta_message_id"] not in inserted:
+            continue
+        conv_id = convs[(p["wa_number_id"], p["from"])][0]
+        stored.append((conv_id, p["text"] or media_label(p["media"]), p["sent_at"]))
+        msg = Message(
+            id=inserted[p["meta_message_id"]],
+            conversation_id=conv_id,
+            direction=Direction.IN,
+            body=p["text"],
+            sent_at=p["sent_at"],
+            **(p["media"] or MEDIA_NONE),
+        )
+        events.append(message_new(p["wa_number_id"], p["from"], msg))
+    await record_inbound(db, stored)
+
+    deltas = defaultdict(lambda: {"conversations": 0, "open_conversations": 0, "inbound_messages": 0})
+    for nid, *_ in created:
+        deltas[nid]["conversations"] += 1
+        deltas[nid]["open_conversations"] += 1
+    for p in parsed:
+        if p["meta_message_id"] in inserted:
+            deltas[p["wa_number_id"]]["inbound_messages"] += 1
+    await counters.bump(db, deltas)
+
+    await db.commit()
+    await recent_message_ids.add([p["meta_message_id"] for p in parsed] + list(archived))
+    # downloads run on the media workers, never on the webhook path
+    for p in parsed:
+        if p["media"] and p["meta_message_id"] in inserted:
+            await media_queue.add({"message_id": str(inserted[p["meta_message_id"]])})
+    return events
+
+async def publish(events: list[tuple[str, dict]]):
+    for room, payload in events:
+        await broadcaster.broadcast(room=room, payload=payload)
+
+def iter_statuses(data: dict):
+    for _, value in iter_values(data):
+        for s in value.get("statuses") or []:
+            row = parse_status(s)
+            if row is not None:
+                yield row
+
+async def process_delivery(fields: dict):
+    """Worker handler for one queued webhook body.
+
+    Returns the status coalescer's future when the body carries statuses: the entry is acked once they are written.
+    """
+    try:
+        data = json.loads(fields["body"])
+    except (KeyError, ValueError):
+        return None
+    started = time.perf_counter()
+    statuses_written = status_coalescer.add(list(iter_statuses(data)))
+    async with AsyncSessionLocal() as db:
+        events = await ingest_delivery(db, data)
+    metrics.observe("webhook_ingest_seconds", time.perf_counter() - started)
+    await publish(events)
+    return statuses_written
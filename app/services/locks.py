@@ -1,30 +1,70 @@
-import redis.asyncio as redis
-from app.core.config import settings
+from app.core.observability import timed_redis
+from app.services.redis_client import r
 
-r = redis.from_url(settings.REDIS_URL, decode_responses=True)
+LOCK_TTL = 600
+
+# Each script is one round trip and runs atomically on the Redis server.
+
+# Take the lock if free, extend it if already ours; returns the owner afterwards.
+_acquire = r.register_script("""
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    return ARGV[1]
+end
+local cur = redis.call('GET', KEYS[1])
+if cur == ARGV[1] then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return cur
+""")
+
+# Extend the lock only if we hold it; returns the current owner (nil when unlocked).
+_touch = r.register_script("""
+local cur = redis.call('GET', KEYS[1])
+if cur == ARGV[1] then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return cur
+""")
+
+# Compare-and-delete.
+_release = r.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
 
 def lock_key(conversation_id: int) -> str:
     return f"conv_lock:{conversation_id}"
 
-async def acquire_lock(conversation_id: int, user_id: int, ttl_seconds: int = 600) -> bool:
-    return await r.set(lock_key(conversation_id), str(user_id), nx=True, ex=ttl_seconds) is True
+def _owner(v) -> int | None:
+    return int(v) if v else None
 
-async def refresh_lock(conversation_id: int, user_id: int, ttl_seconds: int = 600) -> bool:
-    k = lock_key(conversation_id)
-    current = await r.get(k)
-    if current != str(user_id):
-        return False
-    await r.expire(k, ttl_seconds)
-    return True
+@timed_redis("lock_acquire")
+async def acquire_lock(conversation_id: int, user_id: int, ttl_seconds: int = LOCK_TTL) -> int | None:
+    """Lock (or re-lock) for user_id. Returns the owner afterwards: user_id on success, else the holder."""
+    return _owner(await _acquire(keys=[lock_key(conversation_id)], args=[user_id, ttl_seconds]))
 
+@timed_redis("lock_touch")
+async def touch_lock(conversation_id: int, user_id: int, ttl_seconds: int = LOCK_TTL) -> int | None:
+    """Owner of the lock (None if unlocked), extending it when user_id holds it."""
+    return _owner(await _touch(keys=[lock_key(conversation_id)], args=[user_id, ttl_seconds]))
+
+async def refresh_lock(conversation_id: int, user_id: int, ttl_seconds: int = LOCK_TTL) -> bool:
+    return await touch_lock(conversation_id, user_id, ttl_seconds) == user_id
+
+@timed_redis("lock_get")
 async def get_lock_owner(conversation_id: int) -> int | None:
-    v = await r.get(lock_key(conversation_id))
-    return int(v) if v else None
+    return _owner(await r.get(lock_key(conversation_id)))
+
+@timed_redis("lock_mget")
+async def lock_owners(conversation_ids: list[int]) -> dict[int, int | None]:
+    """Owners of many locks with one MGET."""
+    if not conversation_ids:
+        return {}
+    values = await r.mget([lock_key(cid) for cid in conversation_ids])
+    return {cid: _owner(v) for cid, v in zip(conversation_ids, values)}
 
+@timed_redis("lock_release")
 async def release_lock(conversation_id: int, user_id: int) -> bool:
-    k = lock_key(conversation_id)
-    current = await r.get(k)
-    if current != str(user_id):
-        return False
-    await r.delete(k)
-    return True
+    return await _release(keys=[lock_key(conversation_id)], args=[user_id]) == 1
@@ -0,0 +1,27 @@
+from app.core.config import settings
+from app.services.redis_client import r
+from app.services.metrics import metrics
+
+def user_key(username: str) -> str:
+    return f"login_fail:u:{username.lower()}"
+
+def ip_key(ip: str) -> str:
+    return f"login_fail:ip:{ip}"
+
+async def is_throttled(username: str, ip: str) -> bool:
+    """Checked before any bcrypt work: too many recent failures for this username or this IP."""
+    by_user, by_ip = await r.mget(user_key(username), ip_key(ip))
+    throttled = int(by_user or 0) >= settings.LOGIN_MAX_FAILS_PER_USER or int(by_ip or 0) >= settings.LOGIN_MAX_FAILS_PER_IP
+    if throttled:
+        metrics.inc("login_throttled_total")
+    return throttled
+
+async def record_failure(username: str, ip: str):
+    async with r.pipeline(transaction=False) as pipe:
+        for k in (user_key(username), ip_key(ip)):
+            pipe.incr(k)
+            pipe.expire(k, settings.LOGIN_FAIL_WINDOW_SECONDS, nx=True)
+        await pipe.execute()
+
+async def record_success(username: str):
+    await r.delete(user_key(username))
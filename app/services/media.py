@@ -0,0 +1,216 @@
+import hashlib
+import logging
+import os
+import re
+import uuid
+from urllib.parse import quote
+import aiofiles
+import aiofiles.os
+import httpx
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import select, update
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.db.models.conversation import Conversation
+from app.db.models.message import Message
+from app.services.broadcaster import broadcaster
+from app.services.events import message_media
+from app.services.stream_queue import make_queue
+from app.services.whatsapp_cloud import graph, get_media_info
+from app.services.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+MEDIA_TYPES = ("image", "audio", "video", "document", "sticker")
+# mimes a browser may render inline from our origin; anything else (html, svg, pdf, ...) is downloaded
+INLINE_MIME_PREFIXES = ("image/", "audio/", "video/")
+SCRIPTABLE_MIMES = ("image/svg+xml",)
+
+media_queue = make_queue("wa:media")
+
+class MediaTooLarge(Exception):
+    pass
+
+class LocalMediaStore:
+    """Content-addressed files under MEDIA_ROOT/ab/cd/<sha256>; identical files are stored once.
+
+    An S3-compatible backend would implement the same save()/exists()/path() surface.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    async def exists(self, sha256: str) -> bool:
+        return await aiofiles.os.path.exists(self.path(sha256))
+
+    async def save(self, chunks) -> tuple[str, int]:
+        """Write an async iterator of bytes while hashing it. Returns (sha256, size)."""
+        tmp_dir = os.path.join(self.root, "tmp")
+        await aiofiles.os.makedirs(tmp_dir, exist_ok=True)
+        tmp = os.path.join(tmp_dir, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(tmp, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > settings.MEDIA_MAX_BYTES:
+                        raise MediaTooLarge(size)
+                    digest.update(chunk)
+                    await f.write(chunk)
+            sha256 = digest.hexdigest()
+            dest = self.path(sha256)
+            if await aiofiles.os.path.exists(dest):
+                metrics.inc("media_deduplicated_total")
+                await aiofiles.os.remove(tmp)
+            else:
+                await aiofiles.os.makedirs(os.path.dirname(dest), exist_ok=True)
+                await aiofiles.os.replace(tmp, dest)
+            return sha256, size
+        except BaseException:
+            if await aiofiles.os.path.exists(tmp):
+                await aiofiles.os.remove(tmp)
+            raise
+
+media_store = LocalMediaStore(settings.MEDIA_ROOT)
+
+def media_fields(m: dict) -> dict | None:
+    """Column values for the media part of an inbound webhook message, or None for text."""
+    kind = m.get("type")
+    if kind not in MEDIA_TYPES:
+        return None
+    media = m.get(kind) or {}
+    if not media.get("id"):
+        return None
+    return {
+        "media_type": kind,
+        "media_id": media["id"],
+        "media_mime": media.get("mime_type"),
+        "media_filename": media.get("filename"),
+        "text": media.get("caption"),
+    }
+
+async def download(message_id: int):
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(Message.media_id, Message.media_sha256, Conversation.id, Conversation.wa_number_id)
+            .join(Conversation, Conversation.id == Message.conversation_id)
+            .where(Message.id == message_id)
+        )).one_or_none()
+    if row is None or row[0] is None or row[1] is not None:
+        return
+    media_id, _, conversation_id, wa_number_id = row
+
+    try:
+        # the download URL is short-lived, so fetch it on every attempt
+        info = await get_media_info(media_id)
+        async with graph.stream("GET", info["url"]) as resp:
+            sha256, size = await media_store.save(resp.aiter_bytes(settings.MEDIA_CHUNK_BYTES))
+            mime = info.get("mime_type") or resp.headers.get("Content-Type")
+    except MediaTooLarge:
+        log.warning("media %s of message %s exceeds MEDIA_MAX_BYTES; skipped", media_id, message_id)
+        metrics.inc("media_skipped_total", reason="too_large")
+        return
+    except httpx.HTTPStatusError as e:
+        if 400 <= e.response.status_code < 500 and e.response.status_code != 429:
+            log.warning("media %s of message %s unavailable (%s)", media_id, message_id, e.response.status_code)
+            metrics.inc("media_skipped_total", reason=str(e.response.status_code))
+            return
+        raise
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Message)
+            .where(Message.id == message_id)
+            .values(media_sha256=sha256, media_size=size, media_mime=mime)
+        )
+        await db.commit()
+    metrics.inc("media_downloaded_total")
+    metrics.observe("media_bytes", size)
+    await broadcaster.broadcast(*message_media(wa_number_id, message_id, conversation_id, mime))
+
+async def process_media(fields: dict):
+    """Worker handler for one queued media download."""
+    try:
+        message_id = int(fields["message_id"])
+    except (KeyError, ValueError):
+        return
+    await download(message_id)
+
+_range = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """The (start, end) inclusive byte range of a single-range header; ValueError if unsatisfiable."""
+    m = _range.match(header.strip())
+    if not m or not (m.group(1) or m.group(2)):
+        return None
+    if m.group(1):
+        start = int(m.group(1))
+        end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+    else:
+        start, end = max(0, size - int(m.group(2))), size - 1
+    if start > end or start >= size:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+async def read_file(path: str, start: int, length: int):
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        while length > 0:
+            chunk = await f.read(min(settings.MEDIA_CHUNK_BYTES, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+def inline_safe(mime: str) -> bool:
+    mime = mime.split(";")[0].strip().lower()
+    return mime.startswith(INLINE_MIME_PREFIXES) and mime not in SCRIPTABLE_MIMES
+
+async def media_response(request: Request, m: Message) -> Response:
+    """Stream a stored media file with ETag/If-None-Match and single-range Range support.
+
+    The mime comes from the customer, so only images, audio and video are served inline, and never
+    with the right to run script: a "document" that is really HTML or SVG is downloaded instead.
+    """
+    if not m.media_sha256 or not await media_store.exists(m.media_sha256):
+        return Response(status_code=404)
+    path = media_store.path(m.media_sha256)
+    size = (await aiofiles.os.stat(path)).st_size
+    etag = f'"{m.media_sha256}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # content-addressed: the bytes behind this ETag never change
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "X-Content-Type-Options": "nosniff",
+        "Content-Security-Policy": "sandbox",
+    }
+    media_type = m.media_mime or "application/octet-stream"
+    disposition = "inline" if inline_safe(media_type) else "attachment"
+    headers["Content-Disposition"] = disposition + (f"; filename*=UTF-8''{quote(m.media_filename)}" if m.media_filename else "")
+
+    inm = request.headers.get("if-none-match")
+    if inm and (inm.strip() == "*" or etag in [t.strip().removeprefix("W/") for t in inm.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    rng = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if rng and (not if_range or if_range.strip() == etag):
+        try:
+            span = parse_range(rng, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if span is not None:
+            start, end = span
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(read_file(path, start, end - start + 1), status_code=206, media_type=media_type, headers=headers)
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(read_file(path, 0, size), media_type=media_type, headers=headers)
@@ -0,0 +1,122 @@
+import bisect
+from collections import defaultdict
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# histograms that do not measure seconds
+BUCKETS = {
+    "media_bytes": (1e4, 1e5, 1e6, 5e6, 1e7, 5e7, 1e8),
+    "status_flush_rows": (1, 5, 10, 50, 100, 500, 1000, 5000),
+    "http_request_db_queries": (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+}
+
+def label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+class Metrics:
+    """Process-local counters, gauges and histograms. Cheap enough to call on hot paths."""
+
+    def __init__(self):
+        self.counters: dict[str, dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+        self.gauges: dict[str, dict[tuple, float]] = defaultdict(dict)
+        self.histograms: dict[str, dict[tuple, Histogram]] = defaultdict(dict)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        self.counters[name][label_key(labels)] += value
+
+    def set(self, name: str, value: float, **labels):
+        self.gauges[name][label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = label_key(labels)
+        h = self.histograms[name].get(key)
+        if h is None:
+            h = self.histograms[name][key] = Histogram(BUCKETS.get(name, DEFAULT_BUCKETS))
+        h.observe(value)
+
+    def value(self, name: str, **labels) -> float:
+        key = label_key(labels)
+        if name in self.counters:
+            return self.counters[name].get(key, 0)
+        return self.gauges.get(name, {}).get(key, 0)
+
+    def snapshot(self) -> dict:
+        """JSON-serialisable copy of every series, for merging across processes."""
+        return {
+            "counters": {n: [[list(k), v] for k, v in series.items()] for n, series in self.counters.items()},
+            "gauges": {n: [[list(k), v] for k, v in series.items()] for n, series in self.gauges.items()},
+            "histograms": {
+                n: [[list(k), list(h.buckets), list(h.counts), h.sum, h.count] for k, h in series.items()]
+                for n, series in self.histograms.items()
+            },
+        }
+
+def merge(snapshots: list[dict]) -> dict:
+    """Sum snapshots of several processes series by series (gauges too: they count things per process)."""
+    out = {"counters": defaultdict(dict), "gauges": defaultdict(dict), "histograms": defaultdict(dict)}
+    for snap in snapshots:
+        for kind in ("counters", "gauges"):
+            for name, series in snap.get(kind, {}).items():
+                for labels, value in series:
+                    key = tuple(map(tuple, labels))
+                    out[kind][name][key] = out[kind][name].get(key, 0) + value
+        for name, series in snap.get("histograms", {}).items():
+            for labels, buckets, counts, total, count in series:
+                key = tuple(map(tuple, labels))
+                cur = out["histograms"][name].get(key)
+                if cur is None or cur[0] != buckets:
+                    out["histograms"][name][key] = [buckets, list(counts), total, count]
+                else:
+                    cur[1] = [a + b for a, b in zip(cur[1], counts)]
+                    cur[2] += total
+                    cur[3] += count
+    return out
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = [*key, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+def _number(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+def render(merged: dict) -> str:
+    """Prometheus text exposition format (version 0.0.4) of a merge() result."""
+    lines = []
+    for kind, type_name in (("counters", "counter"), ("gauges", "gauge")):
+        for name in sorted(merged[kind]):
+            lines.append(f"# TYPE {name} {type_name}")
+            for key, value in sorted(merged[kind][name].items()):
+                lines.append(f"{name}{_labels(key)} {_number(value)}")
+    for name in sorted(merged["histograms"]):
+        lines.append(f"# TYPE {name} histogram")
+        for key, (buckets, counts, total, count) in sorted(merged["histograms"][name].items()):
+            cumulative = 0
+            for le, c in zip(buckets, counts):
+                cumulative += c
+                lines.append(f"{name}_bucket{_labels(key, (('le', _number(le)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(key, (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(key)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(key)} {count}")
+    return "\n".join(lines) + "\n"
+
+metrics = Metrics()
@@ -0,0 +1,61 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+from app.core.config import settings
+from app.services.metrics import metrics, merge, render
+from app.services.redis_client import r
+
+log = logging.getLogger(__name__)
+
+KEY_PREFIX = "metrics:proc:"
+
+class MetricsPublisher:
+    """Makes /metrics cover every worker process.
+
+    With METRICS_BACKEND=redis each process writes its snapshot to Redis every `interval`
+    seconds (expiring after three missed writes) and the process that gets scraped sums
+    them with its own live one. With "memory" /metrics shows the scraped process only.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.key: str | None = None
+        self.task: asyncio.Task | None = None
+
+    def start(self):
+        if self.task is None and settings.METRICS_BACKEND == "redis":
+            # per process, so taken after any fork
+            self.key = f"{KEY_PREFIX}{socket.gethostname()}:{os.getpid()}"
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def run(self):
+        while True:
+            try:
+                await r.set(self.key, json.dumps(metrics.snapshot()), ex=int(self.interval * 3) + 1)
+            except Exception:
+                log.exception("publishing metrics failed")
+            await asyncio.sleep(self.interval)
+
+    async def exposition(self) -> str:
+        snapshots = [metrics.snapshot()]
+        if settings.METRICS_BACKEND == "redis":
+            try:
+                keys = [k async for k in r.scan_iter(match=KEY_PREFIX + "*", count=100) if k != self.key]
+                if keys:
+                    snapshots += [json.loads(v) for v in await r.mget(keys) if v]
+            except Exception:
+                log.exception("collecting metrics of other processes failed")
+        return render(merge(snapshots))
+
+metrics_publisher = MetricsPublisher(settings.METRICS_PUSH_SECONDS)
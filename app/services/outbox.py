@@ -0,0 +1,127 @@
+import logging
+from datetime import datetime, timedelta, timezone
+import httpx
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.db.models.conversation import Conversation
+from app.db.models.message import Message, Direction, MessageStatus
+from app.services.broadcaster import broadcaster
+from app.services.events import message_new, message_status
+from app.services.summaries import record_outbound
+from app.services.refcache import refcache
+from app.services.stream_queue import make_queue
+from app.services.rate_limit import KeyedRateLimiter
+from app.services.whatsapp_cloud import send_text_message
+from app.services.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+outbox_queue = make_queue("wa:outbox")
+limiter = KeyedRateLimiter(settings.OUTBOX_RATE_PER_SECOND, settings.OUTBOX_BURST)
+
+# Rows left in `sending` by a crashed worker may or may not have reached Meta;
+# they are marked failed rather than resent so a customer never gets a reply twice.
+STALE_AFTER = timedelta(minutes=5)
+
+async def queue_reply(db: AsyncSession, conv: Conversation, text: str) -> Message:
+    """Store an agent reply as `queued`, hand it to the sender workers and tell the inbox."""
+    now = datetime.now(timezone.utc)
+    msg = Message(conversation_id=conv.id, direction=Direction.OUT, body=text, sent_at=now, status=MessageStatus.queued)
+    db.add(msg)
+    await record_outbound(db, conv.id, text, now)
+    await db.commit()
+    try:
+        await outbox_queue.add({"message_id": str(msg.id)})
+    except Exception:
+        # the row stays queued; recover_outbox() picks it up
+        log.exception("could not enqueue message %s", msg.id)
+    await broadcaster.broadcast(*message_new(conv.wa_number_id, conv.customer_wa_id, msg))
+    return msg
+
+async def claim(db: AsyncSession, message_id: int) -> bool:
+    res = await db.execute(
+        update(Message)
+        .where(Message.id == message_id, Message.status == MessageStatus.queued)
+        .values(status=MessageStatus.sending)
+    )
+    await db.commit()
+    return res.rowcount == 1
+
+async def finish(db: AsyncSession, msg: Message, conv: Conversation, status: MessageStatus, meta_id=None, error=None):
+    await db.execute(
+        update(Message)
+        .where(Message.id == msg.id, Message.status == MessageStatus.sending)
+        .values(status=status, meta_message_id=meta_id, error=error, status_at=datetime.now(timezone.utc))
+    )
+    await db.commit()
+    metrics.inc("outbox_messages_total", status=status.value)
+    await broadcaster.broadcast(*message_status(conv.wa_number_id, msg.id, conv.id, status, error))
+
+async def send_queued(db: AsyncSession, message_id: int):
+    if not await claim(db, message_id):
+        return
+    msg, conv = (await db.execute(
+        select(Message, Conversation).join(Conversation, Conversation.id == Message.conversation_id).where(Message.id == message_id)
+    )).one()
+    wa_num = await refcache.number(db, conv.wa_number_id)
+    if wa_num is None:
+        await finish(db, msg, conv, MessageStatus.failed, error="unknown number")
+        return
+
+    try:
+        waited = await limiter.acquire(wa_num.phone_number_id)
+        metrics.observe("outbox_throttle_seconds", waited)
+        res = await send_text_message(wa_num.phone_number_id, conv.customer_wa_id, msg.body or "")
+    except httpx.HTTPStatusError as e:
+        await finish(db, msg, conv, MessageStatus.failed, error=f"HTTP {e.response.status_code}: {e.response.text[:200]}")
+        return
+    except httpx.HTTPError as e:
+        await finish(db, msg, conv, MessageStatus.failed, error=(type(e).__name__ + ": " + str(e))[:255])
+        return
+    except Exception as e:
+        # anything else (a non-JSON 200, a limiter error) must not leave the row in `sending`
+        log.exception("sending message %s failed", msg.id)
+        await finish(db, msg, conv, MessageStatus.failed, error=(type(e).__name__ + ": " + str(e))[:255])
+        return
+
+    meta_id = None
+    try:
+        meta_id = res.get("messages", [{}])[0].get("id")
+    except Exception:
+        pass
+    await finish(db, msg, conv, MessageStatus.sent, meta_id=meta_id)
+
+async def process_outbound(fields: dict):
+    """Worker handler for one queued reply."""
+    try:
+        message_id = int(fields["message_id"])
+    except (KeyError, ValueError):
+        return
+    async with AsyncSessionLocal() as db:
+        await send_queued(db, message_id)
+
+async def recover_outbox():
+    """Re-enqueue replies whose enqueue was lost and fail the ones stuck mid-send."""
+    cutoff = datetime.now(timezone.utc) - STALE_AFTER
+    async with AsyncSessionLocal() as db:
+        stuck = (await db.execute(
+            select(Message.id).where(Message.status == MessageStatus.sending, Message.sent_at < cutoff)
+        )).scalars().all()
+        if stuck:
+            await db.execute(
+                update(Message)
+                .where(Message.id.in_(stuck), Message.status == MessageStatus.sending)
+                .values(status=MessageStatus.failed, error="interrupted while sending")
+            )
+            await db.commit()
+        queued = (await db.execute(
+            select(Message.id).where(Message.status == MessageStatus.queued).order_by(Message.id)
+        )).scalars().all()
+    # duplicates are harmless: claim() lets only one worker send a row
+    for message_id in queued:
+        await outbox_queue.add({"message_id": str(message_id)})
+    if stuck or queued:
+        log.info("outbox recovery: %d requeued, %d marked failed", len(queued), len(stuck))
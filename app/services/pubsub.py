@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Set
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+Handler = Callable[[str, str], Awaitable[None]]
+
+class MemoryPubSub:
+    """In-process stand-in for Redis pub/sub.
+
+    Share one instance between several Broadcasters to simulate several workers in tests.
+    """
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set[Handler]] = {}
+
+    async def subscribe(self, channel: str, handler: Handler):
+        self.subscribers.setdefault(channel, set()).add(handler)
+
+    async def unsubscribe(self, channel: str, handler: Handler):
+        handlers = self.subscribers.get(channel)
+        if handlers is not None:
+            handlers.discard(handler)
+            if not handlers:
+                self.subscribers.pop(channel, None)
+
+    async def publish(self, channel: str, data: str):
+        for handler in list(self.subscribers.get(channel, ())):
+            await handler(channel, data)
+
+    async def close(self):
+        self.subscribers.clear()
+
+class RedisPubSub:
+    """One Redis pub/sub connection per process, dispatching each channel to its handler."""
+
+    def __init__(self, client=None):
+        self._r = client
+        self.ps = None
+        self.handlers: Dict[str, Handler] = {}
+        self.task: asyncio.Task | None = None
+
+    @property
+    def r(self):
+        if self._r is None:
+            from app.services.redis_client import r
+            self._r = r
+        return self._r
+
+    async def subscribe(self, channel: str, handler: Handler):
+        if self.ps is None:
+            self.ps = self.r.pubsub(ignore_subscribe_messages=True)
+        self.handlers[channel] = handler
+        await self.ps.subscribe(channel)
+        if self.task is None:
+            self.task = asyncio.create_task(self.listen())
+
+    async def unsubscribe(self, channel: str, handler: Handler):
+        self.handlers.pop(channel, None)
+        if self.ps is not None:
+            await self.ps.unsubscribe(channel)
+
+    async def publish(self, channel: str, data: str):
+        await self.r.publish(channel, data)
+
+    async def listen(self):
+        while True:
+            try:
+                if not self.ps.subscribed:
+                    await asyncio.sleep(0.1)
+                    continue
+                msg = await self.ps.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if not msg or msg["type"] != "message":
+                    continue
+                handler = self.handlers.get(msg["channel"])
+                if handler is not None:
+                    await handler(msg["channel"], msg["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("pubsub listener failed")
+                await asyncio.sleep(1)
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.ps is not None:
+            await self.ps.aclose()
+            self.ps = None
+
+def make_pubsub():
+    """The cross-process backend selected by BROADCAST_BACKEND, or None for a single process."""
+    if settings.BROADCAST_BACKEND == "redis":
+        return RedisPubSub()
+    return None
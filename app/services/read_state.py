@@ -0,0 +1,45 @@
+"""Per-agent read cursors and unread badges.
+
+conversations.inbound_count counts inbound messages; ingest bumps it in the same UPDATE as the summary,
+so an inbound event costs the same whatever the number of agents. Each agent has a Redis hash
+reads:<user id> of conversation id -> the inbound_count they had seen when they last opened it, and
+their unread count is the difference: one HMGET for a whole page of conversations. Browsers add one
+per message:new they receive and clear the badge on conversation:read (sent to the user's room, so
+their other tabs follow).
+"""
+from app.core.observability import timed_redis
+from app.db.models.conversation import Conversation
+from app.services.broadcaster import broadcaster
+from app.services.events import conversation_read
+from app.services.redis_client import r
+
+# Move the cursor forward only, so a slow request never undoes a newer read; returns how far it moved.
+_advance = r.register_script("""
+local cur = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+local new = tonumber(ARGV[2])
+if new <= cur then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], new)
+return new - cur
+""")
+
+def reads_key(user_id: int) -> str:
+    return f"reads:{user_id}"
+
+@timed_redis("reads_advance")
+async def advance(user_id: int, conversation_id: int, inbound_count: int) -> int:
+    return int(await _advance(keys=[reads_key(user_id)], args=[conversation_id, inbound_count]))
+
+@timed_redis("reads_get")
+async def unread_counts(user_id: int, conversations: list[Conversation]) -> dict[int, int]:
+    """conversation id -> unread inbound messages for this user."""
+    if not conversations:
+        return {}
+    cursors = await r.hmget(reads_key(user_id), [c.id for c in conversations])
+    return {c.id: max(0, c.inbound_count - int(cur or 0)) for c, cur in zip(conversations, cursors)}
+
+async def mark_read(user_id: int, conv: Conversation):
+    """The agent opened the thread: everything in it so far counts as read."""
+    if await advance(user_id, conv.id, conv.inbound_count):
+        await broadcaster.broadcast(*conversation_read(user_id, conv))
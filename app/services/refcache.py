@@ -0,0 +1,117 @@
+import json
+import os
+import time
+import uuid
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.models.user import User, Role
+from app.db.models.assignment import Assignment
+from app.db.models.wa_number import WhatsAppNumber
+from app.services.pubsub import make_pubsub
+
+CHANNEL = "refcache:invalidate"
+SCOPES = ("users", "assignments", "numbers")
+
+class TTLCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.data: dict = {}
+
+    def get(self, key):
+        hit = self.data.get(key)
+        if hit is None or hit[0] < time.monotonic():
+            return None
+        return hit[1]
+
+    def set(self, key, value):
+        self.data[key] = (time.monotonic() + self.ttl, value)
+
+    def clear(self):
+        self.data.clear()
+
+class RefCache:
+    """Per-process TTL cache of the reference data every request needs.
+
+    Users (by username), the number ids each user may see, and the WhatsApp number registry.
+    Cached ORM objects are detached from their session; treat them as read-only. Admin writes
+    call invalidate(), which clears this process and tells the others over pub/sub.
+    """
+
+    def __init__(self, ttl: float, pubsub=None):
+        self.users = TTLCache(ttl)
+        self.number_ids = TTLCache(ttl)
+        self.registry = TTLCache(ttl)
+        self.pubsub = pubsub
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    async def start(self):
+        if self.pubsub is not None:
+            await self.pubsub.subscribe(CHANNEL, self.on_message)
+
+    async def close(self):
+        if self.pubsub is not None:
+            await self.pubsub.close()
+
+    async def get_user(self, db: AsyncSession, username: str) -> User | None:
+        user = self.users.get(username)
+        if user is None:
+            user = (await db.execute(select(User).where(User.username == username))).scalar_one_or_none()
+            if user is None:
+                return None
+            db.expunge(user)
+            self.users.set(username, user)
+        return user
+
+    async def _registry(self, db: AsyncSession) -> tuple[list, dict, dict]:
+        reg = self.registry.get("numbers")
+        if reg is None:
+            numbers = list((await db.execute(select(WhatsAppNumber).order_by(WhatsAppNumber.id))).scalars().all())
+            for n in numbers:
+                db.expunge(n)
+            reg = (numbers, {n.phone_number_id: n for n in numbers}, {n.id: n for n in numbers})
+            self.registry.set("numbers", reg)
+        return reg
+
+    async def numbers(self, db: AsyncSession) -> list[WhatsAppNumber]:
+        """Every WhatsApp number, ordered by id."""
+        return (await self._registry(db))[0]
+
+    async def number_by_phone(self, db: AsyncSession) -> dict[str, WhatsAppNumber]:
+        return (await self._registry(db))[1]
+
+    async def number(self, db: AsyncSession, wa_number_id: int) -> WhatsAppNumber | None:
+        return (await self._registry(db))[2].get(wa_number_id)
+
+    async def visible_number_ids(self, db: AsyncSession, user: User) -> list[int]:
+        if user.role == Role.admin:
+            return [n.id for n in await self.numbers(db)]
+        ids = self.number_ids.get(user.id)
+        if ids is None:
+            q = await db.execute(select(Assignment.wa_number_id).where(Assignment.user_id == user.id))
+            ids = [x[0] for x in q.all()]
+            self.number_ids.set(user.id, ids)
+        return ids
+
+    def clear(self, scopes):
+        if "users" in scopes:
+            self.users.clear()
+        if "assignments" in scopes:
+            self.number_ids.clear()
+        if "numbers" in scopes:
+            self.registry.clear()
+
+    async def invalidate(self, *scopes: str):
+        """Drop cached data after an admin write, here and in every other worker."""
+        scopes = scopes or SCOPES
+        self.clear(scopes)
+        if self.pubsub is not None:
+            await self.pubsub.publish(CHANNEL, json.dumps({"origin": self.origin, "scopes": list(scopes)}))
+
+    async def on_message(self, channel: str, data: str):
+        msg = json.loads(data)
+        if msg.get("origin") != self.origin:
+            self.clear(msg.get("scopes") or SCOPES)
+
+refcache = RefCache(settings.REFCACHE_TTL_SECONDS, make_pubsub())
@@ -0,0 +1,96 @@
+import re
+from sqlalchemy import select, func, literal_column, table, column, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models.conversation import Conversation
+from app.db.models.message import Message
+
+SEARCH_PAGE = 20
+MAX_SEARCH_PAGE = 100
+# ranked results are paged by offset; deep pages are not useful to an agent
+MAX_OFFSET = 1000
+CUSTOMERS_LIMIT = 10
+CANDIDATE_POOL = 200
+MAX_TERMS = 8
+
+_word = re.compile(r"\w+")
+
+def terms(q: str) -> list[str]:
+    """Words of the query; everything else (quotes, operators) is dropped."""
+    return _word.findall(q or "")[:MAX_TERMS]
+
+def fts5_query(words: list[str]) -> str:
+    # every word must match, each as a prefix
+    return " ".join(f'"{w}"*' for w in words)
+
+def pg_tsquery(words: list[str]) -> str:
+    return " & ".join(f"{w}:*" for w in words)
+
+def ranked(db: AsyncSession, words: list[str]):
+    """SELECT id, score of matching messages; lower score is better."""
+    if db.bind.dialect.name == "postgresql":
+        query = func.to_tsquery("simple", pg_tsquery(words))
+        tsv = literal_column("messages.search_tsv")
+        return select(Message.id.label("id"), (-func.ts_rank_cd(tsv, query)).label("score")).where(tsv.op("@@")(query))
+    fts = table("messages_fts", column("rowid"))
+    return (
+        select(fts.c.rowid.label("id"), literal_column("bm25(messages_fts)").label("score"))
+        .select_from(fts)
+        .where(text("messages_fts MATCH :fts_query").bindparams(fts_query=fts5_query(words)))
+    )
+
+def hits():
+    return (
+        select(Message, Conversation.wa_number_id, Conversation.customer_wa_id)
+        .join(Conversation, Conversation.id == Message.conversation_id)
+    )
+
+async def search_messages(
+    db: AsyncSession, number_ids: list[int], q: str, offset: int = 0, limit: int = SEARCH_PAGE
+) -> tuple[list[tuple[Message, int, str]], int | None]:
+    """Best-matching messages in the given numbers as (message, wa_number_id, customer_wa_id).
+
+    Returns the page and the offset of the next one (None on the last page).
+    """
+    words = terms(q)
+    if not words or not number_ids or offset > MAX_OFFSET:
+        return [], None
+    need = offset + limit + 1
+    matches = ranked(db, words)
+
+    # Rank inside the index first and only join the best candidates; exact unless the
+    # number filter discards so many that the pool runs dry, then rank every visible match.
+    pool = max(CANDIDATE_POOL, need * 4)
+    candidates = (await db.execute(
+        matches.order_by(literal_column("score"), literal_column("id").desc()).limit(pool)
+    )).all()
+    order = {row.id: i for i, row in enumerate(candidates)}
+    # filtered here: a number filter in SQL makes planners walk every message of those numbers
+    visible = set(number_ids)
+    rows = [tuple(r) for r in (await db.execute(hits().where(Message.id.in_(list(order))))).all() if r[1] in visible]
+    rows.sort(key=lambda r: order[r[0].id])
+    if len(rows) < need and len(candidates) == pool:
+        m = matches.subquery()
+        rows = [tuple(r) for r in (await db.execute(
+            hits().join(m, m.c.id == Message.id)
+            .where(Conversation.wa_number_id.in_(number_ids))
+            .order_by(m.c.score, Message.id.desc()).limit(need)
+        )).all()]
+
+    rows = rows[offset:need]
+    if len(rows) <= limit:
+        return rows, None
+    return rows[:limit], offset + limit
+
+async def search_customers(db: AsyncSession, number_ids: list[int], q: str) -> list[Conversation]:
+    """Conversations whose customer number contains the digits of the query (at least 3)."""
+    digits = "".join(ch for ch in q or "" if ch.isdigit())
+    if len(digits) < 3 or not number_ids:
+        return []
+    q = (
+        select(Conversation)
+        .where(Conversation.wa_number_id.in_(number_ids), Conversation.customer_wa_id.contains(digits))
+        .order_by(Conversation.last_message_at.desc().nulls_last(), Conversation.id.desc())
+        .limit(CUSTOMERS_LIMIT)
+    )
+    return list((await db.execute(q)).scalars().all())
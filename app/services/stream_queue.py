@@ -0,0 +1,242 @@
+import asyncio
+import itertools
+import logging
+import time
+from redis.exceptions import ResponseError
+
+from app.core.config import settings
+from app.services.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+def id_ms(entry_id: str) -> int:
+    return int(entry_id.split("-", 1)[0])
+
+class RedisStreamQueue:
+    """Durable queue on a Redis Stream with one consumer group.
+
+    Acked entries are deleted, so XLEN is the number of entries not yet processed.
+    """
+
+    def __init__(self, stream: str, group: str = "workers", client=None):
+        self.stream = stream
+        self.group = group
+        self._r = client
+        self._ready = False
+
+    @property
+    def r(self):
+        if self._r is None:
+            from app.services.redis_client import r
+            self._r = r
+        return self._r
+
+    async def ensure_group(self):
+        if self._ready:
+            return
+        try:
+            await self.r.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._ready = True
+
+    async def add(self, fields: dict) -> str:
+        return await self.r.xadd(self.stream, fields, maxlen=settings.QUEUE_MAXLEN, approximate=True)
+
+    async def read(self, consumer: str, count: int, block_ms: int) -> list[tuple[str, dict, int]]:
+        await self.ensure_group()
+        res = await self.r.xreadgroup(self.group, consumer, {self.stream: ">"}, count=count, block=block_ms)
+        if not res:
+            return []
+        return [(entry_id, fields, 1) for entry_id, fields in res[0][1]]
+
+    async def claim(self, consumer: str, min_idle_ms: int, count: int) -> list[tuple[str, dict, int]]:
+        """Take over entries left pending by consumers that stopped without acking."""
+        await self.ensure_group()
+        pending = await self.r.xpending_range(self.stream, self.group, min="-", max="+", count=count, idle=min_idle_ms)
+        if not pending:
+            return []
+        deliveries = {p["message_id"]: p["times_delivered"] + 1 for p in pending}
+        claimed = await self.r.xclaim(self.stream, self.group, consumer, min_idle_ms, list(deliveries))
+        return [(entry_id, fields, deliveries.get(entry_id, 1)) for entry_id, fields in claimed if fields is not None]
+
+    async def ack(self, entry_ids: list[str]):
+        if not entry_ids:
+            return
+        async with self.r.pipeline(transaction=False) as pipe:
+            pipe.xack(self.stream, self.group, *entry_ids)
+            pipe.xdel(self.stream, *entry_ids)
+            await pipe.execute()
+
+    async def dead_letter(self, entry_id: str, fields: dict):
+        await self.r.xadd(f"{self.stream}:dead", fields, maxlen=settings.QUEUE_MAXLEN, approximate=True)
+        await self.ack([entry_id])
+
+    async def stats(self) -> dict:
+        await self.ensure_group()
+        async with self.r.pipeline(transaction=False) as pipe:
+            pipe.xlen(self.stream)
+            pipe.xinfo_groups(self.stream)
+            pipe.xrange(self.stream, min="-", max="+", count=1)
+            depth, groups, oldest = await pipe.execute()
+        group = next((g for g in groups if g["name"] == self.group), {})
+        return {
+            "depth": depth,
+            "pending": group.get("pending", 0),
+            "lag": group.get("lag") or 0,
+            "oldest_age_ms": int(time.time() * 1000) - id_ms(oldest[0][0]) if oldest else 0,
+        }
+
+class MemoryStreamQueue:
+    """In-process stand-in for RedisStreamQueue with the same semantics (tests, single-process dev)."""
+
+    def __init__(self, stream: str, group: str = "workers"):
+        self.stream = stream
+        self.group = group
+        self.entries: dict[str, dict] = {}
+        self.undelivered: list[str] = []
+        self.pending: dict[str, list] = {}  # id -> [consumer, delivered_at, times_delivered]
+        self.dead: list[dict] = []
+        self._seq = itertools.count()
+        self._event = asyncio.Event()
+
+    async def add(self, fields: dict) -> str:
+        entry_id = f"{int(time.time() * 1000)}-{next(self._seq)}"
+        self.entries[entry_id] = dict(fields)
+        self.undelivered.append(entry_id)
+        self._event.set()
+        return entry_id
+
+    async def read(self, consumer: str, count: int, block_ms: int) -> list[tuple[str, dict, int]]:
+        if not self.undelivered and block_ms:
+            self._event.clear()
+            try:
+                await asyncio.wait_for(self._event.wait(), block_ms / 1000)
+            except asyncio.TimeoutError:
+                return []
+        batch, self.undelivered = self.undelivered[:count], self.undelivered[count:]
+        now = time.monotonic()
+        for entry_id in batch:
+            self.pending[entry_id] = [consumer, now, 1]
+        return [(entry_id, self.entries[entry_id], 1) for entry_id in batch]
+
+    async def claim(self, consumer: str, min_idle_ms: int, count: int) -> list[tuple[str, dict, int]]:
+        now = time.monotonic()
+        out = []
+        for entry_id, p in self.pending.items():
+            if len(out) >= count:
+                break
+            if (now - p[1]) * 1000 >= min_idle_ms:
+                p[0], p[1], p[2] = consumer, now, p[2] + 1
+                out.append((entry_id, self.entries[entry_id], p[2]))
+        return out
+
+    async def ack(self, entry_ids: list[str]):
+        for entry_id in entry_ids:
+            self.pending.pop(entry_id, None)
+            self.entries.pop(entry_id, None)
+
+    async def dead_letter(self, entry_id: str, fields: dict):
+        self.dead.append(dict(fields))
+        await self.ack([entry_id])
+
+    async def stats(self) -> dict:
+        oldest = next(iter(self.entries), None)
+        return {
+            "depth": len(self.entries),
+            "pending": len(self.pending),
+            "lag": len(self.undelivered),
+            "oldest_age_ms": int(time.time() * 1000) - id_ms(oldest) if oldest else 0,
+        }
+
+def make_queue(stream: str, group: str = "workers"):
+    if settings.QUEUE_BACKEND == "memory":
+        return MemoryStreamQueue(stream, group)
+    return RedisStreamQueue(stream, group)
+
+class StreamWorkerPool:
+    """N async consumers draining a queue in batches; each entry is acked after its handler succeeds.
+
+    A handler that hands part of an entry to a buffer written later (the status coalescer) returns
+    an awaitable; the entry is then acked once that completes, without holding up the consumer.
+    """
+
+    def __init__(self, name: str, queue, handler, workers: int, batch_size: int | None = None):
+        self.name = name
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.batch_size = batch_size or settings.QUEUE_BATCH_SIZE
+        self.tasks: list[asyncio.Task] = []
+        self.deferred: dict[asyncio.Task, asyncio.Future] = {}  # ack task -> what it waits for
+
+    def start(self):
+        prefix = f"{self.name}-{id(self):x}"
+        self.tasks = [asyncio.create_task(self.run(f"{prefix}-{i}")) for i in range(self.workers)]
+
+    async def stop(self):
+        for t in self.tasks:
+            t.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def drain(self):
+        """On shutdown, after the last flush: ack the deferred entries that are settled by now. The
+        others stay pending and another consumer reclaims them."""
+        ready = [task for task, settled in self.deferred.items() if settled.done()]
+        await asyncio.gather(*ready, return_exceptions=True)
+        for task in list(self.deferred):
+            task.cancel()
+
+    async def run(self, consumer: str):
+        next_claim = 0.0
+        while True:
+            try:
+                batch = []
+                if time.monotonic() >= next_claim:
+                    batch = await self.queue.claim(consumer, settings.QUEUE_CLAIM_IDLE_MS, self.batch_size)
+                    next_claim = time.monotonic() + settings.QUEUE_CLAIM_IDLE_MS / 2000
+                    if batch:
+                        metrics.inc("queue_reclaimed_total", len(batch), queue=self.name)
+                if not batch:
+                    batch = await self.queue.read(consumer, self.batch_size, settings.QUEUE_BLOCK_MS)
+                for entry_id, fields, deliveries in batch:
+                    await self.process(entry_id, fields, deliveries)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("queue %s: consumer %s failed", self.name, consumer)
+                await asyncio.sleep(1)
+
+    async def process(self, entry_id: str, fields: dict, deliveries: int):
+        if deliveries > settings.QUEUE_MAX_DELIVERIES:
+            log.error("queue %s: entry %s dead-lettered after %s deliveries", self.name, entry_id, deliveries - 1)
+            await self.queue.dead_letter(entry_id, fields)
+            metrics.inc("queue_dead_lettered_total", queue=self.name)
+            return
+        try:
+            settled = await self.handler(fields)
+        except Exception:
+            # left pending; another consumer reclaims it after QUEUE_CLAIM_IDLE_MS
+            log.exception("queue %s: entry %s failed", self.name, entry_id)
+            metrics.inc("queue_failed_total", queue=self.name)
+            return
+        if settled is not None:
+            task = asyncio.create_task(self.ack_when(entry_id, settled))
+            self.deferred[task] = settled
+            task.add_done_callback(lambda t: self.deferred.pop(t, None))
+            return
+        await self.queue.ack([entry_id])
+        metrics.inc("queue_processed_total", queue=self.name)
+
+    async def ack_when(self, entry_id: str, settled):
+        try:
+            await settled
+        except Exception:
+            # left pending, as if the handler had failed
+            log.exception("queue %s: entry %s failed", self.name, entry_id)
+            metrics.inc("queue_failed_total", queue=self.name)
+            return
+        await self.queue.ack([entry_id])
+        metrics.inc("queue_processed_total", queue=self.name)
@@ -0,0 +1,152 @@
+from datetime import datetime
+from sqlalchemy import select, update, func, case, or_, bindparam, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models.conversation import Conversation
+from app.db.models.message import Message, Direction
+from app.db.models.archive import ArchiveSegment, ArchiveConversation
+
+PREVIEW_LEN = 200
+
+conversations = Conversation.__table__
+
+def preview(text: str | None) -> str:
+    return (text or "")[:PREVIEW_LEN]
+
+def newer(column, at):
+    return or_(column.is_(None), column <= at)
+
+# Counters are incremented in SQL so concurrent ingest workers never lose an update;
+# the preview only moves forward when the message is at least as new as the current one.
+_inbound = (
+    update(conversations)
+    .where(conversations.c.id == bindparam("cid"))
+    .values(
+        message_count=conversations.c.message_count + bindparam("n"),
+        unread_count=conversations.c.unread_count + bindparam("n"),
+        inbound_count=conversations.c.inbound_count + bindparam("n"),
+        last_message_preview=case(
+            (newer(conversations.c.last_message_at, bindparam("at")), bindparam("preview")),
+            else_=conversations.c.last_message_preview,
+        ),
+        last_direction=case(
+            (newer(conversations.c.last_message_at, bindparam("at")), bindparam("direction", type_=conversations.c.last_direction.type)),
+            else_=conversations.c.last_direction,
+        ),
+        last_inbound_at=case(
+            (newer(conversations.c.last_inbound_at, bindparam("at")), bindparam("at")),
+            else_=conversations.c.last_inbound_at,
+        ),
+        last_message_at=case(
+            (newer(conversations.c.last_message_at, bindparam("at")), bindparam("at")),
+            else_=conversations.c.last_message_at,
+        ),
+    )
+)
+
+async def record_inbound(db: AsyncSession, messages: list[tuple[int, str | None, datetime]]):
+    """Fold (conversation_id, text, sent_at) of newly stored inbound messages into the summaries."""
+    per_conv: dict[int, dict] = {}
+    for conversation_id, text, sent_at in messages:
+        row = per_conv.get(conversation_id)
+        if row is None:
+            row = per_conv[conversation_id] = {"cid": conversation_id, "n": 0, "at": sent_at, "preview": preview(text), "direction": Direction.IN}
+        row["n"] += 1
+        if sent_at >= row["at"]:
+            row["at"], row["preview"] = sent_at, preview(text)
+    if per_conv:
+        await db.execute(_inbound, list(per_conv.values()))
+
+async def record_outbound(db: AsyncSession, conversation_id: int, text: str | None, at: datetime):
+    """An agent reply: count it, make it the preview and clear the unread counter."""
+    await db.execute(
+        update(conversations)
+        .where(conversations.c.id == conversation_id)
+        .values(
+            message_count=conversations.c.message_count + 1,
+            unread_count=0,
+            last_message_preview=preview(text),
+            last_direction=Direction.OUT,
+            last_message_at=at,
+        )
+    )
+
+async def rebuild_summaries(db: AsyncSession, batch_size: int = 500) -> int:
+    """Recompute every conversation summary from `messages` and the archive index. Returns the number of
+    conversations updated.
+
+    Archived messages count through their archive_conversations rows; the preview and last direction of a
+    conversation with no message left in `messages` are kept as they are."""
+    m = Message.__table__
+    c = conversations
+    ac = ArchiveConversation.__table__
+    segments = ArchiveSegment.__table__
+
+    def latest(column):
+        return (
+            select(column).where(m.c.conversation_id == c.c.id)
+            .order_by(m.c.sent_at.desc(), m.c.id.desc()).limit(1)
+            .correlate(c).scalar_subquery()
+        )
+
+    def archived(column, *where):
+        return (
+            select(column)
+            .select_from(ac.join(segments, segments.c.id == ac.c.segment_id))
+            .where(ac.c.conversation_id == c.c.id, segments.c.rehydrated_at.is_(None), *where)
+            .correlate(c)
+            .scalar_subquery()
+        )
+
+    def live_max(*where):
+        return select(func.max(m.c.sent_at)).where(m.c.conversation_id == c.c.id, *where).correlate(c).scalar_subquery()
+
+    # archived messages are older than the ones left in `messages`
+    live_last_out = live_max(m.c.direction == Direction.OUT)
+    archived_last_out = archived(func.max(ac.c.last_outbound_at))
+    last_out = func.coalesce(live_last_out, archived_last_out)
+    # inbound since the last reply: in `messages`, and in the archive when no reply is left in `messages`
+    archived_unanswered = archived(
+        func.coalesce(func.sum(ac.c.unanswered_count), 0),
+        or_(archived_last_out.is_(None), ac.c.last_sent_at >= archived_last_out),
+    )
+    values = dict(
+        message_count=(
+            select(func.count()).where(m.c.conversation_id == c.c.id).scalar_subquery()
+            + archived(func.coalesce(func.sum(ac.c.message_count), 0))
+        ),
+        inbound_count=(
+            select(func.count()).where(m.c.conversation_id == c.c.id, m.c.direction == Direction.IN).scalar_subquery()
+            + archived(func.coalesce(func.sum(ac.c.inbound_count), 0))
+        ),
+        unread_count=(
+            select(func.count())
+            .where(
+                m.c.conversation_id == c.c.id,
+                m.c.direction == Direction.IN,
+                or_(last_out.is_(None), m.c.sent_at > last_out),
+            )
+            .scalar_subquery()
+            + case((live_last_out.is_(None), archived_unanswered), else_=0)
+        ),
+        last_message_preview=func.coalesce(
+            latest(func.coalesce(func.substr(m.c.body, 1, PREVIEW_LEN), literal("[") + m.c.media_type + "]")),
+            c.c.last_message_preview,
+        ),
+        last_direction=func.coalesce(latest(m.c.direction), c.c.last_direction),
+        last_message_at=func.coalesce(live_max(), archived(func.max(ac.c.last_sent_at))),
+        last_inbound_at=func.coalesce(live_max(m.c.direction == Direction.IN), archived(func.max(ac.c.last_inbound_at))),
+    )
+
+    total = 0
+    last_id = 0
+    while True:
+        ids = (await db.execute(
+            select(c.c.id).where(c.c.id > last_id).order_by(c.c.id).limit(batch_size)
+        )).scalars().all()
+        if not ids:
+            return total
+        await db.execute(update(c).where(c.c.id.in_(ids)).values(**values))
+        await db.commit()
+        total += len(ids)
+        last_id = ids[-1]
@@ -0,0 +1,88 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import select, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models.conversation import Conversation
+from app.db.models.message import Message
+from app.services import archive
+from app.services.events import aware, isoformat
+
+CONVERSATIONS_PAGE = 50
+MESSAGES_PAGE = 50
+MAX_PAGE = 200
+
+def encode_cursor(at: datetime | None, row_id: int) -> str:
+    raw = json.dumps([isoformat(at), row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime | None, int]:
+    """Raises ValueError on anything that is not a cursor we issued."""
+    try:
+        at, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return (aware(datetime.fromisoformat(at)) if at else None), int(row_id)
+    except Exception as e:
+        raise ValueError("invalid cursor") from e
+
+def clamp_limit(limit: int | None, default: int) -> int:
+    return max(1, min(limit or default, MAX_PAGE))
+
+async def conversation_page(
+    db: AsyncSession, wa_number_id: int, cursor: str | None = None, limit: int = CONVERSATIONS_PAGE
+) -> tuple[list[Conversation], str | None]:
+    """Newest-first conversations of a number, keyset-paginated on (last_message_at, id)."""
+    q = select(Conversation).where(Conversation.wa_number_id == wa_number_id)
+    if cursor:
+        at, row_id = decode_cursor(cursor)
+        if at is None:
+            q = q.where(Conversation.last_message_at.is_(None), Conversation.id < row_id)
+        else:
+            q = q.where(or_(
+                Conversation.last_message_at < at,
+                and_(Conversation.last_message_at == at, Conversation.id < row_id),
+                Conversation.last_message_at.is_(None),
+            ))
+    q = q.order_by(Conversation.last_message_at.desc().nulls_last(), Conversation.id.desc()).limit(limit + 1)
+    rows = list((await db.execute(q)).scalars().all())
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].last_message_at, rows[-1].id)
+
+async def message_page(
+    db: AsyncSession, conversation_id: int, before: str | None = None, limit: int = MESSAGES_PAGE, archived: bool = False
+) -> tuple[list[Message], str | None]:
+    """The latest messages of a conversation older than `before`, oldest first.
+
+    Keyset-paginated on (sent_at, id); the returned cursor loads the page before this one. With `archived`
+    (conversation.archived_until is set) a page that runs out of rows continues into the archive segments.
+    """
+    q = select(Message).where(Message.conversation_id == conversation_id)
+    edge = None
+    if before:
+        edge = decode_cursor(before)
+        at, row_id = edge
+        q = q.where(or_(Message.sent_at < at, and_(Message.sent_at == at, Message.id < row_id)))
+    q = q.order_by(Message.sent_at.desc(), Message.id.desc()).limit(limit + 1)
+    rows = list((await db.execute(q)).scalars().all())
+    if len(rows) <= limit and archived:
+        if rows:
+            edge = (aware(rows[-1].sent_at), rows[-1].id)
+        rows += await archive.read_conversation(db, conversation_id, edge, limit + 1 - len(rows))
+    older = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        older = encode_cursor(rows[-1].sent_at, rows[-1].id)
+    rows.reverse()
+    return rows, older
+
+async def messages_after(db: AsyncSession, conversation_id: int, after_id: int, limit: int = MAX_PAGE) -> list[Message]:
+    """Messages newer than after_id, for appending live bubbles and catching up after a reconnect."""
+    q = (
+        select(Message)
+        .where(Message.conversation_id == conversation_id, Message.id > after_id)
+        .order_by(Message.id)
+        .limit(limit)
+    )
+    return list((await db.execute(q)).scalars().all())
@@ -1,18 +1,129 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
 import httpx
 from app.core.config import settings
+from app.services.metrics import metrics
 
-GRAPH_BASE = "https://graph.facebook.com"
+GRAPH_BASE = settings.GRAPH_BASE
+
+# 429/503 mean Meta did not act on the request, so even a send can be retried.
+# Other 5xx and read timeouts are only retried for idempotent requests.
+RETRY_ALWAYS = {429, 503}
+RETRY_IDEMPOTENT = {500, 502, 504}
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+def retry_after_seconds(resp: httpx.Response) -> float | None:
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_seconds(attempt: int) -> float:
+    # full jitter
+    return random.uniform(0, min(settings.GRAPH_BACKOFF_MAX_SECONDS, settings.GRAPH_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+class GraphClient:
+    """One keep-alive connection pool to the Graph API for the whole process.
+
+    Opened and closed with the app (see app.main); used lazily by workers and scripts too.
+    """
+
+    def __init__(self):
+        self.client: httpx.AsyncClient | None = None
+
+    async def start(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=GRAPH_BASE,
+                http2=settings.GRAPH_HTTP2,
+                timeout=httpx.Timeout(settings.GRAPH_TIMEOUT_SECONDS, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=settings.GRAPH_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.GRAPH_MAX_CONNECTIONS,
+                    keepalive_expiry=settings.GRAPH_KEEPALIVE_SECONDS,
+                ),
+                headers={"Authorization": f"Bearer {settings.WHATSAPP_ACCESS_TOKEN}"},
+            )
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def request(self, method: str, path: str, idempotent: bool | None = None, op: str = "other", **kwargs) -> httpx.Response:
+        """Send with retries on transient failures; raises httpx.HTTPStatusError on a final error status."""
+        await self.start()
+        if idempotent is None:
+            idempotent = method in ("GET", "HEAD", "PUT", "DELETE")
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                resp = await self.client.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                metrics.observe("graph_request_seconds", time.perf_counter() - started, op=op, status="error")
+                retryable = idempotent or isinstance(e, NOT_SENT_ERRORS)
+                if not retryable or attempt >= settings.GRAPH_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(backoff_seconds(attempt))
+                attempt += 1
+                continue
+
+            metrics.observe("graph_request_seconds", time.perf_counter() - started, op=op, status=resp.status_code)
+            retryable = resp.status_code in RETRY_ALWAYS or (idempotent and resp.status_code in RETRY_IDEMPOTENT)
+            if not retryable or attempt >= settings.GRAPH_MAX_RETRIES:
+                resp.raise_for_status()
+                return resp
+
+            delay = retry_after_seconds(resp)
+            delay = backoff_seconds(attempt) if delay is None else min(delay, settings.GRAPH_BACKOFF_MAX_SECONDS)
+            metrics.inc("graph_retries_total", op=op, status=resp.status_code)
+            await resp.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        """A streamed response (no retries); raises httpx.HTTPStatusError on an error status."""
+        await self.start()
+        started = time.perf_counter()
+        answered = False
+        try:
+            async with self.client.stream(method, url, **kwargs) as resp:
+                # time to the response headers; reading the body is up to the caller
+                metrics.observe("graph_request_seconds", time.perf_counter() - started, op="stream", status=resp.status_code)
+                answered = True
+                resp.raise_for_status()
+                yield resp
+        except httpx.TransportError:
+            if not answered:
+                metrics.observe("graph_request_seconds", time.perf_counter() - started, op="stream", status="error")
+            raise
+
+graph = GraphClient()
 
 async def send_text_message(phone_number_id: str, to_wa_id: str, text: str) -> dict:
-    url = f"{GRAPH_BASE}/{settings.GRAPH_API_VERSION}/{phone_number_id}/messages"
-    headers = {"Authorization": f"Bearer {settings.WHATSAPP_ACCESS_TOKEN}"}
+    url = f"/{settings.GRAPH_API_VERSION}/{phone_number_id}/messages"
     payload = {
         "messaging_product": "whatsapp",
         "to": to_wa_id,
         "type": "text",
         "text": {"body": text},
     }
-    async with httpx.AsyncClient(timeout=20) as client:
-        r = await client.post(url, headers=headers, json=payload)
-        r.raise_for_status()
-        return r.json()
+    r = await graph.request("POST", url, op="send", json=payload)
+    return r.json()
+
+async def get_media_info(media_id: str) -> dict:
+    """Metadata of an uploaded media object: url (short-lived), mime_type, sha256, file_size."""
+    r = await graph.request("GET", f"/{settings.GRAPH_API_VERSION}/{media_id}", op="media_info")
+    return r.json()
@@ -0,0 +1,30 @@
+from app.core.config import settings
+from app.services.stream_queue import StreamWorkerPool
+from app.services.ingest import webhook_queue, process_delivery
+from app.services.outbox import outbox_queue, process_outbound, recover_outbox
+from app.services.delivery_status import status_coalescer
+from app.services.media import media_queue, process_media
+
+pools = [
+    StreamWorkerPool("webhooks", webhook_queue, process_delivery, settings.WEBHOOK_WORKERS),
+    StreamWorkerPool("outbox", outbox_queue, process_outbound, settings.OUTBOX_WORKERS),
+    StreamWorkerPool("media", media_queue, process_media, settings.MEDIA_WORKERS),
+]
+
+async def start_workers():
+    if not settings.RUN_WORKERS:
+        return
+    await recover_outbox()
+    for pool in pools:
+        pool.start()
+    status_coalescer.start()
+
+async def stop_workers():
+    for pool in pools:
+        await pool.stop()
+    await status_coalescer.stop()
+    for pool in pools:
+        await pool.drain()
+
+async def queue_stats() -> dict:
+    return {pool.name: await pool.queue.stats() for pool in pools}
@@ -0,0 +1,72 @@
+"""Conditional GET and rendered-fragment caching for the server-rendered pages.
+
+Pages get a weak ETag computed from the data they are about to render (plus the template sources),
+so a navigation that would produce the same HTML answers 304 without rendering. Fragments that
+repeat across navigations (the numbers panel, conversation rows) are cached rendered, keyed by every
+field they show: an ingest, reply, status or lock change alters the key, so stale HTML is never served
+and there is nothing to invalidate across processes; old entries fall out of the LRU.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+from fastapi import Request
+from fastapi.responses import Response
+from jinja2 import Environment
+from markupsafe import Markup
+
+from app.services.metrics import metrics
+
+TEMPLATES_DIR = "app/web/templates"
+FRAGMENT_CACHE_SIZE = 5000
+
+def _templates_version() -> str:
+    digest = hashlib.blake2b(digest_size=8)
+    for name in sorted(os.listdir(TEMPLATES_DIR)):
+        with open(os.path.join(TEMPLATES_DIR, name), "rb") as f:
+            digest.update(name.encode() + f.read())
+    return digest.hexdigest()
+
+TEMPLATES_VERSION = _templates_version()
+
+def etag(*parts) -> str:
+    return 'W/"' + hashlib.blake2b(repr((TEMPLATES_VERSION, parts)).encode(), digest_size=16).hexdigest() + '"'
+
+def not_modified(request: Request, tag: str) -> Response | None:
+    """A 304 when the client already holds `tag`, else None."""
+    inm = request.headers.get("if-none-match")
+    if inm and tag.removeprefix("W/") in [t.strip().removeprefix("W/") for t in inm.split(",")]:
+        metrics.inc("http_not_modified_total")
+        return Response(status_code=304, headers={"ETag": tag, "Cache-Control": "private, no-cache"})
+    return None
+
+def cache_headers(response: Response, tag: str) -> Response:
+    # private: pages differ per user; no-cache: revalidate on every navigation
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+class FragmentCache:
+    """Per-process LRU of rendered template fragments."""
+
+    def __init__(self, env: Environment, max_entries: int = FRAGMENT_CACHE_SIZE):
+        self.env = env
+        self.max_entries = max_entries
+        self.data: OrderedDict[tuple, Markup] = OrderedDict()
+
+    def render(self, template: str, key: tuple, **context) -> Markup:
+        """`key` must cover everything the fragment shows."""
+        full_key = (template, key)
+        html = self.data.get(full_key)
+        if html is not None:
+            self.data.move_to_end(full_key)
+            metrics.inc("fragment_cache_total", result="hit")
+            return html
+        metrics.inc("fragment_cache_total", result="miss")
+        html = Markup(self.env.get_template(template).render(**context))
+        self.data[full_key] = html
+        if len(self.data) > self.max_entries:
+            self.data.popitem(last=False)
+        return html
+
+    def clear(self):
+        self.data.clear()
@@ -1,21 +1,33 @@
 from fastapi import APIRouter, Request, Depends, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, delete
+from sqlalchemy import select, delete
 from datetime import datetime, timezone, timedelta
 
 from app.db.session import get_db
+from app.core.observability import TimedTemplate
+from app.web.caching import FragmentCache, etag, not_modified, cache_headers
 from app.db.models.user import User, Role
 from app.db.models.assignment import Assignment
 from app.db.models.wa_number import WhatsAppNumber
-from app.db.models.conversation import Conversation
-from app.db.models.message import Message, Direction
-from app.core.security import verify_password, hash_password
-from app.services.locks import acquire_lock, get_lock_owner, refresh_lock
-from app.services.whatsapp_cloud import send_text_message
+from app.db.models.conversation import Conversation, ConversationStatus
+from app.db.models.message import Message
+from app.core.security import verify_password_async, hash_password_async, PasswordHasherBusy
+from app.services import login_throttle
+from app.services.locks import acquire_lock, touch_lock, release_lock, lock_owners, LOCK_TTL
+from app.services.broadcaster import broadcaster
+from app.services.outbox import queue_reply
+from app.services.media import media_response
+from app.services.events import aware, message_json, conversation_json, conversation_status, conversation_lock, search_hit_json
+from app.services.timeline import conversation_page, message_page, messages_after
+from app.services.search import search_messages, search_customers
+from app.services import counters, read_state
+from app.services.refcache import refcache
 
 templates = Jinja2Templates(directory="app/web/templates")
+templates.env.template_class = TimedTemplate
+fragments = FragmentCache(templates.env)
 web_router = APIRouter(include_in_schema=False)
 
 SESSION_COOKIE = "wa_session_user"
@@ -27,8 +39,7 @@ async def get_web_user(request: Request, db: AsyncSession) -> User | None:
     username = request.cookies.get(SESSION_COOKIE)
     if not username:
         return None
-    q = await db.execute(select(User).where(User.username == username))
-    user = q.scalar_one_or_none()
+    user = await refcache.get_user(db, username)
     if not user or not user.is_active:
         return None
     return user
@@ -43,11 +54,7 @@ def is_admin(user: User) -> bool:
     return user.role == Role.admin
 
 async def visible_number_ids(db: AsyncSession, user: User) -> list[int]:
-    if user.role == Role.admin:
-        q = await db.execute(select(WhatsAppNumber.id))
-        return [x[0] for x in q.all()]
-    q = await db.execute(select(Assignment.wa_number_id).where(Assignment.user_id == user.id))
-    return [x[0] for x in q.all()]
+    return await refcache.visible_number_ids(db, user)
 
 @web_router.get("/", response_class=HTMLResponse)
 async def home(request: Request, db: AsyncSession = Depends(get_db)):
@@ -67,10 +74,20 @@ async def login_post(
     password: str = Form(...),
     db: AsyncSession = Depends(get_db),
 ):
+    ip = request.client.host if request.client else "-"
+    if await login_throttle.is_throttled(username, ip):
+        return templates.TemplateResponse("login.html", {"request": request, "error": "محاولات كثيرة، حاول لاحقاً"}, status_code=429)
+
     q = await db.execute(select(User).where(User.username == username))
     user = q.scalar_one_or_none()
-    if not user or not user.is_active or not verify_password(password, user.password_hash):
+    try:
+        ok = bool(user and user.is_active and await verify_password_async(password, user.password_hash))
+    except PasswordHasherBusy:
+        return templates.TemplateResponse("login.html", {"request": request, "error": "الخادم مشغول، حاول مرة أخرى"}, status_code=503)
+    if not ok:
+        await login_throttle.record_failure(username, ip)
         return templates.TemplateResponse("login.html", {"request": request, "error": "بيانات الدخول غير صحيحة"})
+    await login_throttle.record_success(username)
 
     resp = redirect("/dashboard")
     resp.set_cookie(SESSION_COOKIE, user.username, httponly=True, samesite="lax")
@@ -84,54 +101,95 @@ async def logout():
 
 @web_router.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request, user: User = Depends(require_web_user), db: AsyncSession = Depends(get_db)):
-    from sqlalchemy import func
     ids = await visible_number_ids(db, user)
-    conv_count = (await db.execute(select(func.count()).select_from(Conversation).where(Conversation.wa_number_id.in_(ids)))).scalar() or 0
-    open_count = (await db.execute(select(func.count()).select_from(Conversation).where(Conversation.wa_number_id.in_(ids), Conversation.status == "open"))).scalar() or 0
-    in_total = (await db.execute(
-        select(func.count()).select_from(Message)
-        .join(Conversation, Conversation.id == Message.conversation_id)
-        .where(Conversation.wa_number_id.in_(ids), Message.direction == Direction.IN)
-    )).scalar() or 0
-
-    return templates.TemplateResponse("dashboard.html", {
+    stats = await counters.totals(db, ids)
+    tag = etag("dashboard", user.id, user.name, user.role, ids, stats)
+    if (resp := not_modified(request, tag)) is not None:
+        return resp
+
+    return cache_headers(templates.TemplateResponse("dashboard.html", {
         "request": request,
         "user": user,
-        "stats": {"conversations": conv_count, "open": open_count, "in_total": in_total},
+        "stats": {"conversations": stats["conversations"], "open": stats["open_conversations"], "in_total": stats["inbound_messages"]},
         "is_admin": is_admin(user),
-    })
+    }), tag)
 
 @web_router.get("/inbox", response_class=HTMLResponse)
 async def inbox_page(request: Request, user: User = Depends(require_web_user), db: AsyncSession = Depends(get_db)):
     ids = await visible_number_ids(db, user)
-    numbers = (await db.execute(select(WhatsAppNumber).where(WhatsAppNumber.id.in_(ids), WhatsAppNumber.is_active == True).order_by(WhatsAppNumber.id))).scalars().all()
+    visible = set(ids)
+    numbers = [n for n in await refcache.numbers(db) if n.id in visible and n.is_active]
     selected_number_id = int(request.query_params.get("number_id") or (numbers[0].id if numbers else 0)) if numbers else 0
+    if selected_number_id and selected_number_id not in visible:
+        raise HTTPException(403, "Not allowed")
 
-    conversations = []
+    conversations, conversations_cursor = [], None
     if selected_number_id:
-        conversations = (await db.execute(
-            select(Conversation).where(Conversation.wa_number_id == selected_number_id).order_by(desc(Conversation.last_message_at))
-        )).scalars().all()
+        conversations, conversations_cursor = await conversation_page(db, selected_number_id)
 
     selected_conversation_id = int(request.query_params.get("conversation_id") or (conversations[0].id if conversations else 0)) if conversations else 0
 
-    messages = []
+    selected, messages, messages_cursor = None, [], None
     if selected_conversation_id:
-        messages = (await db.execute(select(Message).where(Message.conversation_id == selected_conversation_id).order_by(Message.sent_at))).scalars().all()
+        selected = next((c for c in conversations if c.id == selected_conversation_id), None)
+        if selected is None:
+            # opened from further down the list
+            selected = await db.get(Conversation, selected_conversation_id)
+        if selected is None:
+            raise HTTPException(404, "Not found")
+        if selected.wa_number_id not in visible:
+            raise HTTPException(403, "Not allowed")
+        await read_state.mark_read(user.id, selected)
+        messages, messages_cursor = await message_page(db, selected_conversation_id, archived=selected.archived_until is not None)
+    unread = await read_state.unread_counts(user.id, conversations)
+
+    # lock holders of the listed conversations: one MGET, one query for their names
+    owners = await lock_owners([c.id for c in conversations])
+    holder_ids = {uid for uid in owners.values() if uid is not None}
+    holders = {}
+    if holder_ids:
+        holders = dict((await db.execute(select(User.id, User.name).where(User.id.in_(holder_ids)))).all())
+    locks = {cid: holders.get(uid) or f"#{uid}" for cid, uid in owners.items() if uid is not None}
 
     err = request.query_params.get("err")
 
-    return templates.TemplateResponse("inbox.html", {
+    # every field the page shows, so any ingest, reply, status, lock or assignment change alters the tag
+    numbers_key = (tuple((n.id, n.display_name, n.phone_number_id) for n in numbers), selected_number_id)
+    row_keys = [(
+        c.id, c.customer_wa_id, c.status, unread[c.id], c.message_count, c.last_message_at,
+        c.last_direction, c.last_message_preview, locks.get(c.id), c.id == selected_conversation_id,
+    ) for c in conversations]
+    tag = etag(
+        "inbox", user.id, user.name, user.role, numbers_key, row_keys, conversations_cursor,
+        selected_conversation_id, selected.status if selected else None,
+        [(m.id, m.body, m.status, m.error, m.media_sha256) for m in messages], messages_cursor,
+        owners.get(selected_conversation_id), err,
+    )
+    if (resp := not_modified(request, tag)) is not None:
+        return resp
+
+    numbers_html = fragments.render("_numbers.html", numbers_key, numbers=numbers, selected_number_id=selected_number_id)
+    conversation_rows = [
+        fragments.render("_conversation_row.html", key, c=c, unread=unread[c.id], lock=key[-2], active=key[-1])
+        for c, key in zip(conversations, row_keys)
+    ]
+
+    return cache_headers(templates.TemplateResponse("inbox.html", {
         "request": request,
         "user": user,
         "is_admin": is_admin(user),
-        "numbers": numbers,
+        "numbers_html": numbers_html,
         "selected_number_id": selected_number_id,
         "conversations": conversations,
+        "conversation_rows": conversation_rows,
+        "conversations_cursor": conversations_cursor,
         "selected_conversation_id": selected_conversation_id,
+        "selected": selected,
         "messages": messages,
+        "messages_cursor": messages_cursor,
+        "lock_owner": owners.get(selected_conversation_id),
         "err": err
-    })
+    }), tag)
 
 async def ensure_conv_access(db: AsyncSession, user: User, conv_id: int) -> Conversation:
     conv = (await db.execute(select(Conversation).where(Conversation.id == conv_id))).scalar_one_or_none()
@@ -142,15 +200,94 @@ async def ensure_conv_access(db: AsyncSession, user: User, conv_id: int) -> Conv
         raise HTTPException(403, "Not allowed")
     return conv
 
+@web_router.get("/inbox/search")
+async def inbox_search(q: str, offset: int = 0, user: User = Depends(require_web_user), db: AsyncSession = Depends(get_db)):
+    ids = await visible_number_ids(db, user)
+    rows, next_offset = await search_messages(db, ids, q, max(0, offset))
+    customers = await search_customers(db, ids, q) if offset <= 0 else []
+    return JSONResponse({
+        "customers": [conversation_json(c) for c in customers],
+        "messages": [search_hit_json(*row) for row in rows],
+        "next_offset": next_offset,
+    })
+
+@web_router.get("/inbox/numbers/{number_id}/conversations")
+async def inbox_conversations(number_id: int, cursor: str | None = None, user: User = Depends(require_web_user), db: AsyncSession = Depends(get_db)):
+    if number_id not in await visible_number_ids(db, user):
+        raise HTTPException(403, "Not allowed")
+    try:
+        rows, next_cursor = await conversation_page(db, number_id, cursor)
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+    owners = await lock_owners([c.id for c in rows])
+    unread = await read_state.unread_counts(user.id, rows)
+    return JSONResponse({
+        "conversations": [{**conversation_json(c), "locked_by": owners[c.id], "unread": unread[c.id]} for c in rows],
+        "cursor": next_cursor,
+    })
+
+@web_router.get("/inbox/conversations/{conversation_id}/messages")
+async def inbox_messages(
+    conversation_id: int,
+    after_id: int = 0,
+    before: str | None = None,
+    user: User = Depends(require_web_user),
+    db: AsyncSession = Depends(get_db),
+):
+    conv = await ensure_conv_access(db, user, conversation_id)
+    if before:
+        # "load older" above the first bubble
+        try:
+            rows, older = await message_page(db, conv.id, before, archived=conv.archived_until is not None)
+        except ValueError:
+            raise HTTPException(400, "Invalid cursor")
+        return JSONResponse({"messages": [message_json(m) for m in rows], "older_cursor": older})
+
+    # Lets the page append new bubbles (and catch up after a reconnect) without reloading
+    rows = await messages_after(db, conv.id, after_id)
+    # the thread is on screen: what it shows counts as read
+    await read_state.mark_read(user.id, conv)
+    return JSONResponse({
+        "messages": [message_json(m) for m in rows],
+        "cursor": rows[-1].id if rows else after_id,
+    })
+
 @web_router.post("/inbox/lock")
 async def inbox_lock(conversation_id: int = Form(...), user: User = Depends(require_web_user), db: AsyncSession = Depends(get_db)):
     conv = await ensure_conv_access(db, user, conversation_id)
-    ok = await acquire_lock(conv.id, user.id, ttl_seconds=600)
-    if not ok:
-        owner = await get_lock_owner(conv.id)
+    owner = await acquire_lock(conv.id, user.id, LOCK_TTL)
+    if owner != user.id:
         return redirect(f"/inbox?number_id={conv.wa_number_id}&conversation_id={conv.id}&err=locked_by_{owner}")
+    await broadcaster.broadcast(*conversation_lock(conv.wa_number_id, conv.id, user.id, LOCK_TTL))
+    return redirect(f"/inbox?number_id={conv.wa_number_id}&conversation_id={conv.id}")
+
+@web_router.post("/inbox/unlock")
+async def inbox_unlock(conversation_id: int = Form(...), user: User = Depends(require_web_user), db: AsyncSession = Depends(get_db)):
+    conv = await ensure_conv_access(db, user, conversation_id)
+    if await release_lock(conv.id, user.id):
+        await broadcaster.broadcast(*conversation_lock(conv.wa_number_id, conv.id, None))
+    return redirect(f"/inbox?number_id={conv.wa_number_id}&conversation_id={conv.id}")
+
+@web_router.post("/inbox/status")
+async def inbox_status(conversation_id: int = Form(...), status: str = Form(...), user: User = Depends(require_web_user), db: AsyncSession = Depends(get_db)):
+    conv = await ensure_conv_access(db, user, conversation_id)
+    try:
+        new = ConversationStatus(status)
+    except ValueError:
+        return redirect(f"/inbox?number_id={conv.wa_number_id}&conversation_id={conv.id}&err=bad_status")
+    if await counters.change_status(db, conv, new):
+        await db.commit()
+        await broadcaster.broadcast(*conversation_status(conv))
     return redirect(f"/inbox?number_id={conv.wa_number_id}&conversation_id={conv.id}")
 
+@web_router.get("/inbox/media/{message_id}")
+async def inbox_media(message_id: int, request: Request, user: User = Depends(require_web_user), db: AsyncSession = Depends(get_db)):
+    m = (await db.execute(select(Message).where(Message.id == message_id))).scalar_one_or_none()
+    if not m:
+        raise HTTPException(404, "Not found")
+    await ensure_conv_access(db, user, m.conversation_id)
+    return await media_response(request, m)
+
 @web_router.post("/inbox/reply")
 async def inbox_reply(conversation_id: int = Form(...), text: str = Form(...), user: User = Depends(require_web_user), db: AsyncSession = Depends(get_db)):
     text = (text or "").strip()
@@ -159,28 +296,14 @@ async def inbox_reply(conversation_id: int = Form(...), text: str = Form(...), u
 
     conv = await ensure_conv_access(db, user, conversation_id)
 
-    owner = await get_lock_owner(conv.id)
+    owner = await touch_lock(conv.id, user.id, LOCK_TTL)
     if owner is not None and owner != user.id:
         return redirect(f"/inbox?number_id={conv.wa_number_id}&conversation_id={conv.id}&err=locked")
-    if owner == user.id:
-        await refresh_lock(conv.id, user.id, ttl_seconds=600)
 
-    if conv.last_inbound_at and conv.last_inbound_at < datetime.now(timezone.utc) - timedelta(hours=24):
+    if conv.last_inbound_at and aware(conv.last_inbound_at) < datetime.now(timezone.utc) - timedelta(hours=24):
         return redirect(f"/inbox?number_id={conv.wa_number_id}&conversation_id={conv.id}&err=outside_24h")
 
-    wa_num = (await db.execute(select(WhatsAppNumber).where(WhatsAppNumber.id == conv.wa_number_id))).scalar_one()
-    res = await send_text_message(wa_num.phone_number_id, conv.customer_wa_id, text)
-
-    meta_id = None
-    try:
-        meta_id = res.get("messages", [{}])[0].get("id")
-    except Exception:
-        pass
-
-    msg = Message(conversation_id=conv.id, direction=Direction.OUT, body=text, meta_message_id=meta_id)
-    db.add(msg)
-    conv.last_message_at = datetime.now(timezone.utc)
-    await db.commit()
+    await queue_reply(db, conv, text)
     return redirect(f"/inbox?number_id={conv.wa_number_id}&conversation_id={conv.id}")
 
 # --- Admin pages (server-rendered) ---
@@ -202,9 +325,10 @@ async def admin_users_create(
 ):
     if not is_admin(user):
         return redirect("/dashboard")
-    u = User(username=username.strip(), name=(name.strip() or username.strip()), password_hash=hash_password(password.strip()), role=Role(role))
+    u = User(username=username.strip(), name=(name.strip() or username.strip()), password_hash=await hash_password_async(password.strip()), role=Role(role))
     db.add(u)
     await db.commit()
+    await refcache.invalidate("users")
     return redirect("/admin/users")
 
 @web_router.post("/admin/users/{user_id}/toggle")
@@ -215,13 +339,14 @@ async def admin_users_toggle(user_id: int, user: User = Depends(require_web_user
     if target:
         target.is_active = not target.is_active
         await db.commit()
+        await refcache.invalidate("users")
     return redirect("/admin/users")
 
 @web_router.get("/admin/numbers", response_class=HTMLResponse)
 async def admin_numbers(request: Request, user: User = Depends(require_web_user), db: AsyncSession = Depends(get_db)):
     if not is_admin(user):
         return redirect("/dashboard")
-    numbers = (await db.execute(select(WhatsAppNumber).order_by(WhatsAppNumber.id))).scalars().all()
+    numbers = await refcache.numbers(db)
     return templates.TemplateResponse("admin_numbers.html", {"request": request, "user": user, "is_admin": True, "numbers": numbers})
 
 @web_router.post("/admin/numbers")
@@ -236,6 +361,7 @@ async def admin_numbers_create(
     n = WhatsAppNumber(display_name=display_name.strip(), phone_number_id=phone_number_id.strip(), is_active=True)
     db.add(n)
     await db.commit()
+    await refcache.invalidate("numbers")
     return redirect("/admin/numbers")
 
 @web_router.post("/admin/numbers/{number_id}/toggle")
@@ -246,6 +372,7 @@ async def admin_numbers_toggle(number_id: int, user: User = Depends(require_web_
     if n:
         n.is_active = not n.is_active
         await db.commit()
+        await refcache.invalidate("numbers")
     return redirect("/admin/numbers")
 
 @web_router.get("/admin/assignments", response_class=HTMLResponse)
@@ -254,7 +381,7 @@ async def admin_assignments(request: Request, user: User = Depends(require_web_u
         return redirect("/dashboard")
 
     users = (await db.execute(select(User).order_by(User.id))).scalars().all()
-    numbers = (await db.execute(select(WhatsAppNumber).order_by(WhatsAppNumber.id))).scalars().all()
+    numbers = await refcache.numbers(db)
 
     selected_user_id = int(request.query_params.get("user_id") or (users[0].id if users else 0)) if users else 0
     assigned = set()
@@ -284,4 +411,5 @@ async def admin_assignments_save(
     for nid in ids:
         db.add(Assignment(user_id=user_id, wa_number_id=nid))
     await db.commit()
+    await refcache.invalidate("assignments")
     return redirect(f"/admin/assignments?user_id={user_id}")
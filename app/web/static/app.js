@@ -6,24 +6,281 @@ function filterList(input, cls){
   });
 }
 
+function fmtTime(iso){
+  return (iso || "").replace("T", " ");
+}
+
+function el(tag, cls, text){
+  const node = document.createElement(tag);
+  if(cls) node.className = cls;
+  if(text !== undefined) node.textContent = text;
+  return node;
+}
+
+function renderMedia(id, media){
+  const box = el("div", "media");
+  const src = `/inbox/media/${id}`;
+  let node;
+  if(!media.ready){
+    node = el("span", "muted", `[${media.type}]`);
+  } else if(media.type === "image" || media.type === "sticker"){
+    node = el("img"); node.loading = "lazy"; node.alt = ""; node.src = src;
+  } else if(media.type === "audio" || media.type === "video"){
+    node = el(media.type); node.controls = true; node.preload = media.type === "audio" ? "none" : "metadata"; node.src = src;
+  } else {
+    node = el("a", "", media.filename || media.type); node.href = src; node.target = "_blank";
+  }
+  box.appendChild(node);
+  return box;
+}
+
+function renderBubble(m){
+  const b = el("div", "bubble " + (m.direction === "out" ? "out" : "in"));
+  b.dataset.messageId = m.id;
+  if(m.media){
+    b.dataset.mediaType = m.media.type;
+    b.dataset.mediaFilename = m.media.filename || "";
+    b.appendChild(renderMedia(m.id, m.media));
+  }
+  if(m.text) b.appendChild(el("div", "txt", m.text));
+  const meta = el("div", "meta", fmtTime(m.at));
+  if(m.status){
+    meta.appendChild(document.createTextNode(" · "));
+    meta.appendChild(el("span", "status status-" + m.status, m.status));
+  }
+  b.appendChild(meta);
+  return b;
+}
+
+function setMediaReady(msg){
+  const b = document.querySelector(`#chatBody [data-message-id="${msg.id}"]`);
+  const box = b && b.querySelector(".media");
+  if(!box) return;
+  const type = b.dataset.mediaType || ((msg.mime || "").split("/")[0]) || "document";
+  box.replaceWith(renderMedia(msg.id, {type, filename: b.dataset.mediaFilename, ready: true}));
+}
+
+function setMessageStatus(msg){
+  const span = document.querySelector(`#chatBody [data-message-id="${msg.id}"] .status`);
+  if(!span) return;
+  span.className = "status status-" + msg.status;
+  span.textContent = msg.status;
+  span.title = msg.error || "";
+}
+
+// --- chat thread: append messages newer than the cursor ---
+const chat = {
+  body: document.getElementById("chatBody"),
+  loading: false,
+  again: false,
+
+  conversationId(){
+    return this.body ? parseInt(this.body.dataset.conversationId || "0", 10) : 0;
+  },
+
+  append(messages){
+    if(!messages.length) return;
+    const empty = document.getElementById("chatEmpty");
+    if(empty) empty.remove();
+    const atBottom = this.body.scrollHeight - this.body.scrollTop - this.body.clientHeight < 40;
+    messages.forEach(m => {
+      if(this.body.querySelector(`[data-message-id="${m.id}"]`)) return;
+      this.body.appendChild(renderBubble(m));
+    });
+    if(atBottom) this.body.scrollTop = this.body.scrollHeight;
+  },
+
+  async catchUp(){
+    const id = this.conversationId();
+    if(!id) return;
+    if(this.loading){ this.again = true; return; }
+    this.loading = true;
+    try {
+      const cursor = this.body.dataset.cursor || "0";
+      const res = await fetch(`/inbox/conversations/${id}/messages?after_id=${encodeURIComponent(cursor)}`, {credentials: "same-origin"});
+      if(res.ok){
+        const data = await res.json();
+        this.append(data.messages);
+        this.body.dataset.cursor = data.cursor;
+      }
+    } catch(e){}
+    this.loading = false;
+    if(this.again){ this.again = false; this.catchUp(); }
+  },
+};
+
+// --- conversation list: bump the row of the conversation that just changed ---
+function renderConvItem(c){
+  const item = el("a", "item conv-item");
+  item.dataset.convId = c.id;
+  item.dataset.status = c.status || "open";
+  item.href = `/inbox?number_id=${window.__NUMBER_ID__}&conversation_id=${c.id}`;
+  const title = el("div", "title", c.customer_wa_id || "");
+  const badge = el("span", "badge", String(c.unread || 0));
+  badge.hidden = !c.unread;
+  title.appendChild(badge);
+  const lock = el("span", "lock", "🔒");
+  lock.hidden = !c.locked_by;
+  if(c.locked_by) lock.title = `#${c.locked_by}`;
+  title.appendChild(lock);
+  item.appendChild(title);
+  item.appendChild(el("div", "preview", previewText(c.last_direction, c.last_message_preview)));
+  item.appendChild(el("div", "sub", `${item.dataset.status} • ${fmtTime(c.last_message_at)}`));
+  return item;
+}
+
+function previewText(direction, text){
+  return (direction === "out" ? "↩ " : "") + (text || "").slice(0, 200);
+}
+
+function bumpConversation(msg){
+  const list = document.getElementById("convList");
+  if(!list) return;
+  let item = list.querySelector(`[data-conv-id="${msg.conversation_id}"]`);
+  if(!item){
+    const empty = document.getElementById("convEmpty");
+    if(empty) empty.remove();
+    item = renderConvItem({id: msg.conversation_id, customer_wa_id: msg.customer_wa_id});
+  }
+  item.querySelector(".sub").textContent = `${item.dataset.status || ""} • ${fmtTime(msg.at)}`;
+  item.querySelector(".preview").textContent = previewText(msg.direction, msg.text);
+  const badge = item.querySelector(".badge");
+  const current = parseInt(badge.textContent || "0", 10);
+  // this agent's unread: inbound messages count up, except in the thread on screen (catching up marks it read)
+  const unread = msg.conversation_id === chat.conversationId() ? 0 : current + (msg.direction === "in" ? 1 : 0);
+  badge.textContent = unread;
+  badge.hidden = !unread;
+  if(list.firstElementChild !== item) list.prepend(item);
+}
+
+// --- "load older": keyset pages for the conversation list and the thread ---
+async function loadOlder(btn, url, render){
+  btn.disabled = true;
+  try {
+    const res = await fetch(url + encodeURIComponent(btn.dataset.cursor), {credentials: "same-origin"});
+    if(!res.ok) return;
+    const next = render(await res.json());
+    if(next) btn.dataset.cursor = next;
+    else btn.remove();
+  } catch(e){
+  } finally {
+    btn.disabled = false;
+  }
+}
+
+(function bindLoadOlder(){
+  const convMore = document.getElementById("convMore");
+  if(convMore){
+    const list = document.getElementById("convList");
+    convMore.addEventListener("click", () => loadOlder(convMore, `/inbox/numbers/${list.dataset.numberId}/conversations?cursor=`, data => {
+      data.conversations.forEach(c => {
+        if(!list.querySelector(`[data-conv-id="${c.id}"]`)) list.appendChild(renderConvItem(c));
+      });
+      return data.cursor;
+    }));
+  }
+
+  const chatMore = document.getElementById("chatMore");
+  if(chatMore){
+    chatMore.addEventListener("click", () => loadOlder(chatMore, `/inbox/conversations/${chat.conversationId()}/messages?before=`, data => {
+      const keep = chat.body.scrollHeight - chat.body.scrollTop;
+      const anchor = chatMore.nextSibling;
+      data.messages.forEach(m => chat.body.insertBefore(renderBubble(m), anchor));
+      chat.body.scrollTop = chat.body.scrollHeight - keep;
+      return data.older_cursor;
+    }));
+  }
+})();
+
+// --- server-side search over every visible number (Enter in the conversation filter) ---
+(function bindSearch(){
+  const input = document.getElementById("convSearch");
+  const box = document.getElementById("searchResults");
+  if(!input || !box) return;
+
+  function hit(numberId, convId, title, text){
+    const item = el("a", "item");
+    item.href = `/inbox?number_id=${numberId}&conversation_id=${convId}`;
+    item.appendChild(el("div", "title", title));
+    if(text) item.appendChild(el("div", "preview", text));
+    return item;
+  }
+
+  async function run(q, offset){
+    const res = await fetch(`/inbox/search?q=${encodeURIComponent(q)}&offset=${offset}`, {credentials: "same-origin"});
+    if(!res.ok) return;
+    const data = await res.json();
+    if(!offset) box.replaceChildren();
+    const more = box.querySelector(".load-older");
+    if(more) more.remove();
+    data.customers.forEach(c => box.appendChild(hit(c.wa_number_id, c.id, c.customer_wa_id, previewText(c.last_direction, c.last_message_preview))));
+    data.messages.forEach(m => box.appendChild(hit(m.wa_number_id, m.conversation_id, `${m.customer_wa_id} • ${fmtTime(m.at)}`, m.text)));
+    if(!box.children.length) box.appendChild(el("div", "muted", "لا توجد نتائج"));
+    if(data.next_offset !== null){
+      const btn = el("button", "btn ghost load-older", "تحميل المزيد");
+      btn.type = "button";
+      btn.addEventListener("click", () => run(q, data.next_offset));
+      box.appendChild(btn);
+    }
+    box.hidden = false;
+  }
+
+  input.addEventListener("keydown", ev => {
+    if(ev.key === "Enter" && input.value.trim()) run(input.value.trim(), 0);
+    if(ev.key === "Escape"){ input.value = ""; filterList(input, "conv-item"); box.hidden = true; }
+  });
+  input.addEventListener("input", () => { if(!input.value.trim()) box.hidden = true; });
+})();
+
+// One socket per page, subscribed to the shown number only (plus the user's own events).
 (function connectWS(){
-  if(!window.__ROOM__ || window.__ROOM__ === "number:0") return;
+  if(!document.getElementById("convList") && !document.getElementById("chatBody")) return;
 
   const proto = location.protocol === "https:" ? "wss" : "ws";
-  const ws = new WebSocket(`${proto}://${location.host}/api/ws?room=${encodeURIComponent(window.__ROOM__)}`);
+  const ws = new WebSocket(`${proto}://${location.host}/api/ws?numbers=${window.__NUMBER_ID__ || ""}`);
+  // the server only sends the shown number's events; this guards against a stale subscription
+  const shown = msg => msg.wa_number_id === undefined || msg.wa_number_id === window.__NUMBER_ID__;
 
   ws.onopen = () => {
-    setInterval(() => { try { ws.send("ping"); } catch(e){} }, 25000);
+    // anything that arrived while we were disconnected
+    chat.catchUp();
   };
 
   ws.onmessage = (ev) => {
     try {
       const msg = JSON.parse(ev.data);
-      if(msg.event === "message:new"){
-        location.reload();
+      if(msg.event === "ping"){
+        ws.send("pong");
+      } else if(!shown(msg)){
+        return;
+      } else if(msg.event === "message:new"){
+        bumpConversation(msg);
+        if(msg.conversation_id === chat.conversationId()) chat.catchUp();
+      } else if(msg.event === "message:status"){
+        setMessageStatus(msg);
+      } else if(msg.event === "message:media"){
+        setMediaReady(msg);
+      } else if(msg.event === "conversation:read"){
+        const badge = document.querySelector(`#convList [data-conv-id="${msg.conversation_id}"] .badge`);
+        if(badge){ badge.textContent = msg.unread; badge.hidden = !msg.unread; }
+      } else if(msg.event === "conversation:lock"){
+        const lock = document.querySelector(`#convList [data-conv-id="${msg.conversation_id}"] .lock`);
+        if(lock){
+          lock.hidden = !msg.locked_by;
+          lock.title = msg.locked_by ? `#${msg.locked_by}` : "";
+        }
+      } else if(msg.event === "conversation:status"){
+        const item = document.querySelector(`#convList [data-conv-id="${msg.conversation_id}"]`);
+        if(item){
+          const sub = item.querySelector(".sub");
+          sub.textContent = sub.textContent.replace(item.dataset.status, msg.status);
+          item.dataset.status = msg.status;
+        }
       }
     } catch(e){}
   };
 
-  ws.onclose = () => setTimeout(connectWS, 1500);
+  ws.onclose = () => {
+    setTimeout(connectWS, 1500);
+  };
 })();
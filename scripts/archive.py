@@ -0,0 +1,122 @@
+"""Message history archive (app.services.archive): bulk archive and rehydrate.
+
+    python scripts/archive.py run [--number ID ...]           # move history past retention into segments
+    python scripts/archive.py run --dry-run                    # count what a run would move
+    python scripts/archive.py retention --number ID --days 180 # per-number retention (--days default: use MESSAGE_RETENTION_DAYS)
+    python scripts/archive.py list [--number ID ...]
+    python scripts/archive.py rehydrate --segment ID ...       # copy segments back into the database
+    python scripts/archive.py rehydrate --number ID [--month YYYY-MM]
+    python scripts/archive.py partitions                       # Postgres: create the coming monthly partitions
+
+Run `run` and `partitions` from cron (e.g. nightly). Rehydrated rows are archived again by the next run unless
+the number's retention was raised first.
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime, timezone
+from sqlalchemy import select, func
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal, engine
+from app.db.migrate import migrate
+from app.db.partitions import ensure_partitions
+from app.db.models import WhatsAppNumber, Conversation, Message, ArchiveSegment
+from app.services import archive
+
+async def run(args):
+    now = datetime.now(timezone.utc)
+    async with AsyncSessionLocal() as db:
+        if args.dry_run:
+            q = select(WhatsAppNumber).order_by(WhatsAppNumber.id)
+            if args.number:
+                q = q.where(WhatsAppNumber.id.in_(args.number))
+            for number in (await db.execute(q)).scalars().all():
+                cutoff = archive.retention_cutoff(number, now)
+                if cutoff is None:
+                    print(f"number {number.id}: kept in full")
+                    continue
+                count = (await db.execute(
+                    select(func.count()).select_from(Message)
+                    .join(Conversation, Conversation.id == Message.conversation_id)
+                    .where(Conversation.wa_number_id == number.id, Message.sent_at < cutoff)
+                )).scalar()
+                print(f"number {number.id}: {count} message(s) before {cutoff:%Y-%m-%d}")
+            return
+        segments = await archive.run(db, args.number, now)
+    for s in segments:
+        print(f"segment {s.id}: number {s.wa_number_id} {s.month}, {s.message_count} message(s), {s.size} bytes")
+    print(f"{sum(s.message_count for s in segments)} message(s) archived in {len(segments)} segment(s)")
+
+async def retention(args):
+    days = None if args.days == "default" else int(args.days)
+    async with AsyncSessionLocal() as db:
+        number = await db.get(WhatsAppNumber, args.number)
+        if number is None:
+            sys.exit(f"no number {args.number}")
+        number.retention_days = days
+        await db.commit()
+    print(f"number {args.number}: retention {days if days is not None else f'default ({settings.MESSAGE_RETENTION_DAYS})'} day(s)")
+
+def segment_query(args):
+    q = select(ArchiveSegment).order_by(ArchiveSegment.wa_number_id, ArchiveSegment.month, ArchiveSegment.id)
+    if args.number:
+        q = q.where(ArchiveSegment.wa_number_id.in_(args.number))
+    if getattr(args, "segment", None):
+        q = q.where(ArchiveSegment.id.in_(args.segment))
+    if getattr(args, "month", None):
+        q = q.where(ArchiveSegment.month == args.month)
+    return q
+
+async def list_segments(args):
+    async with AsyncSessionLocal() as db:
+        for s in (await db.execute(segment_query(args))).scalars().all():
+            state = f"rehydrated {s.rehydrated_at:%Y-%m-%d}" if s.rehydrated_at else "archived"
+            print(f"{s.id:>6}  number {s.wa_number_id:<4} {s.month}  {s.message_count:>8} msgs  {s.size:>10} B  {state}  {s.path}")
+
+async def rehydrate(args):
+    if not args.segment and not args.number:
+        sys.exit("give --segment or --number")
+    total = 0
+    async with AsyncSessionLocal() as db:
+        q = segment_query(args).where(ArchiveSegment.rehydrated_at.is_(None))
+        for segment in (await db.execute(q)).scalars().all():
+            n = await archive.rehydrate(db, segment)
+            await db.commit()
+            total += n
+            print(f"segment {segment.id}: {n} message(s) restored")
+    print(f"{total} message(s) restored")
+
+async def partitions(args):
+    async with engine.connect() as conn:
+        created = await conn.run_sync(ensure_partitions, args.ahead)
+        await conn.commit()
+    print("\n".join(f"created {name}" for name in created) if created else "partitions up to date")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("run")
+    p.add_argument("--number", type=int, action="append", help="only this number id (repeatable)")
+    p.add_argument("--dry-run", action="store_true")
+    p = sub.add_parser("retention")
+    p.add_argument("--number", type=int, required=True)
+    p.add_argument("--days", required=True, help="days kept in the database, 0 = everything, default = MESSAGE_RETENTION_DAYS")
+    p = sub.add_parser("list")
+    p.add_argument("--number", type=int, action="append")
+    p = sub.add_parser("rehydrate")
+    p.add_argument("--segment", type=int, action="append")
+    p.add_argument("--number", type=int, action="append")
+    p.add_argument("--month", help="YYYY-MM")
+    p = sub.add_parser("partitions")
+    p.add_argument("--ahead", type=int, default=settings.MESSAGE_PARTITIONS_AHEAD)
+    args = parser.parse_args()
+
+    async with engine.connect() as conn:
+        await conn.run_sync(migrate)
+    commands = {"run": run, "retention": retention, "list": list_segments, "rehydrate": rehydrate, "partitions": partitions}
+    await commands[args.command](args)
+    await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
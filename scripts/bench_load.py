@@ -0,0 +1,467 @@
+"""End-to-end load benchmark: synthetic WhatsApp traffic plus agents working the inbox.
+
+Seeds DATABASE_URL with --numbers numbers and --agents agents (idempotent; use a scratch database), then for
+--duration seconds:
+- posts signed webhook deliveries at --rate per second: text, media, delivery/read statuses for the replies
+  sent so far, and multi-entry batches spanning several numbers
+- runs the agents: dashboard, inbox page, conversation list, timeline, search, lock, reply, unlock
+- keeps each agent's session WebSocket open (all its numbers on one socket) and measures webhook -> message:new and reply -> message:status(sent)
+A mock Graph API answers the outbox and media workers. Prints a summary and writes the JSON result to --out;
+--baseline compares p95s against an earlier result and exits 1 on regressions above --tolerance.
+
+    # in process: the app runs under uvicorn inside this script, Graph is mocked automatically
+    DATABASE_URL=sqlite+aiosqlite:///./load.db QUEUE_BACKEND=memory python scripts/bench_load.py --fake-redis
+    # against a running server sharing DATABASE_URL and META_APP_SECRET, started with
+    # GRAPH_BASE=http://127.0.0.1:8790 so its workers reach this script's mock Graph
+    python scripts/bench_load.py --url http://127.0.0.1:8000 --out results/load.json --baseline results/prev.json
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+
+AGENT_PASSWORD = "load-test-password"
+TOKEN = re.compile(r"\[lt(\d+)\]")
+WORDS = (
+    "order delivery price invoice refund address payment shipping tracking discount size color "
+    "available tomorrow today thanks hello please cancel change return warranty branch hours "
+    "طلب توصيل سعر فاتورة استرجاع عنوان دفع شحن تتبع خصم مقاس لون متاح بكرة اليوم شكرا مرحبا"
+).split()
+MEDIA = (("image", "image/jpeg", None), ("document", "application/pdf", "invoice.pdf"), ("audio", "audio/ogg", None))
+# webhook delivery kinds and their share of the traffic
+MIX = {"text": 0.6, "media": 0.1, "status": 0.2, "batch": 0.1}
+
+def summary(samples: list[float]) -> dict:
+    if not samples:
+        return {"n": 0}
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))]
+    return {
+        "n": len(samples),
+        "p50_ms": round(statistics.median(samples) * 1000, 2),
+        "p95_ms": round(pick(0.95) * 1000, 2),
+        "p99_ms": round(pick(0.99) * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2),
+    }
+
+def assigned(agent: int, agents: int, numbers: int) -> list[int]:
+    """Indexes of the numbers an agent works: every number is covered, agent i takes i, i + agents, ..."""
+    if agents > numbers:
+        return [agent % numbers]
+    return list(range(agent, numbers, agents))
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class Stats:
+    def __init__(self):
+        self.latency: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.counts: dict[str, int] = defaultdict(int)
+        # token -> perf_counter when the request carrying it was sent
+        self.sent: dict[int, float] = {}
+        self.inbound_lag: list[float] = []
+        self.seen: set[int] = set()
+        self.reply_sent: dict[int, float] = {}
+        self.reply_ids: dict[int, int] = {}
+        self.sent_lag: list[float] = []
+
+    async def call(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs) -> httpx.Response | None:
+        started = time.perf_counter()
+        try:
+            resp = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[route] += 1
+            return None
+        self.latency[route].append(time.perf_counter() - started)
+        if resp.status_code >= 400:
+            self.errors[route] += 1
+        return resp
+
+    def on_event(self, event: dict, now: float):
+        kind = event.get("event")
+        if kind == "message:new":
+            m = TOKEN.search(event.get("text") or "")
+            if not m:
+                return
+            token = int(m.group(1))
+            if event.get("direction") == "in":
+                if token in self.sent and token not in self.seen:
+                    self.seen.add(token)
+                    self.inbound_lag.append(now - self.sent[token])
+            elif token in self.reply_sent:
+                self.reply_ids[event["id"]] = token
+        elif kind == "message:status" and event.get("status") == "sent":
+            token = self.reply_ids.pop(event.get("id"), None)
+            if token is not None:
+                self.sent_lag.append(now - self.reply_sent[token])
+
+class Traffic:
+    """Builds signed webhook deliveries shaped like Meta's."""
+
+    def __init__(self, rng: random.Random, numbers: list[str], customers: int, secret: str, stats: Stats):
+        self.rng = rng
+        self.numbers = numbers
+        self.customers = customers
+        self.secret = secret.encode()
+        self.stats = stats
+        self.seq = 0
+        # keeps wamids unique across runs on the same database, which would otherwise be dropped as redeliveries
+        self.run = f"{int(time.time()):x}"
+        # wamids the mock Graph handed out, per phone_number_id, for status callbacks
+        self.outbound: dict[str, list[str]] = defaultdict(list)
+
+    def token(self) -> int:
+        self.seq += 1
+        return self.seq
+
+    def message(self, phone_index: int, token: int) -> dict:
+        rng = self.rng
+        m = {
+            "from": f"201{phone_index:03d}{rng.randrange(self.customers):06d}",
+            "id": f"wamid.load.{self.run}.{token}",
+            "timestamp": str(int(time.time())),
+        }
+        text = f"[lt{token}] " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 12)))
+        return {**m, "type": "text", "text": {"body": text}}
+
+    def media_message(self, phone_index: int, token: int) -> dict:
+        m = self.message(phone_index, token)
+        kind, mime, filename = self.rng.choice(MEDIA)
+        media = {"id": f"media-{self.rng.randrange(64)}", "mime_type": mime, "caption": m.pop("text")["body"]}
+        if filename:
+            media["filename"] = filename
+        return {**m, "type": kind, kind: media}
+
+    def value(self, phone_number_id: str, **fields) -> dict:
+        return {"changes": [{"field": "messages", "value": {
+            "messaging_product": "whatsapp",
+            "metadata": {"display_phone_number": phone_number_id, "phone_number_id": phone_number_id},
+            **fields,
+        }}]}
+
+    def delivery(self, kind: str) -> tuple[str, list[dict], list[int]]:
+        """(kind actually built, entries, tokens of the inbound messages in it)"""
+        rng = self.rng
+        i = rng.randrange(len(self.numbers))
+        pid = self.numbers[i]
+        if kind == "status" and self.outbound[pid]:
+            wamids = rng.sample(self.outbound[pid], min(5, len(self.outbound[pid])))
+            statuses = [{
+                "id": w, "status": rng.choice(("delivered", "read")), "timestamp": str(int(time.time())),
+                "recipient_id": "201000000000",
+            } for w in wamids]
+            return kind, [self.value(pid, statuses=statuses)], []
+        if kind == "batch":
+            entries, tokens = [], []
+            for j in rng.sample(range(len(self.numbers)), min(len(self.numbers), rng.randint(2, 4))):
+                msgs = [self.message(j, self.token()) for _ in range(rng.randint(1, 3))]
+                tokens += [int(TOKEN.search(m["text"]["body"]).group(1)) for m in msgs]
+                entries.append(self.value(self.numbers[j], messages=msgs))
+            return kind, entries, tokens
+        token = self.token()
+        if kind == "media":
+            return kind, [self.value(pid, messages=[self.media_message(i, token)])], [token]
+        return "text", [self.value(pid, messages=[self.message(i, token)])], [token]
+
+    def sign(self, body: bytes) -> str:
+        return "sha256=" + hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+
+    async def post(self, client: httpx.AsyncClient, kind: str):
+        kind, entries, tokens = self.delivery(kind)
+        body = json.dumps({"object": "whatsapp_business_account", "entry": entries}).encode()
+        self.stats.counts[f"webhook_{kind}"] += 1
+        self.stats.counts["inbound_messages"] += len(tokens)
+        now = time.perf_counter()
+        for t in tokens:
+            self.stats.sent[t] = now
+        await self.stats.call(
+            client, "POST /api/webhooks/whatsapp", "POST", "/api/webhooks/whatsapp",
+            content=body, headers={"X-Hub-Signature-256": self.sign(body), "Content-Type": "application/json"},
+        )
+
+def mock_graph(traffic: Traffic, base: str):
+    """Graph API stand-in: accepts sends (remembering the wamids) and serves media."""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import Response
+
+    graph = FastAPI()
+    blobs = [random.Random(i).randbytes(20_000 + 5_000 * i) for i in range(8)]
+
+    @graph.post("/{version}/{phone_number_id}/messages")
+    async def send(phone_number_id: str, request: Request):
+        wamid = f"wamid.out.{traffic.run}.{traffic.token()}"
+        sent = traffic.outbound[phone_number_id]
+        sent.append(wamid)
+        del sent[:-200]
+        return {"messaging_product": "whatsapp", "messages": [{"id": wamid}]}
+
+    @graph.get("/{version}/{media_id}")
+    async def media_info(media_id: str):
+        blob = blobs[hash(media_id) % len(blobs)]
+        return {"url": f"{base}/files/{media_id}", "mime_type": "application/octet-stream", "file_size": len(blob)}
+
+    @graph.get("/files/{media_id}")
+    async def media_file(media_id: str):
+        return Response(blobs[hash(media_id) % len(blobs)], media_type="application/octet-stream")
+
+    return graph
+
+async def serve(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return server, task
+
+async def seed(numbers: int, agents: int) -> tuple[list[tuple[int, str]], list[str]]:
+    """Numbers (id, phone_number_id) and agent usernames, created if missing."""
+    from sqlalchemy import select
+    from app.core.security import hash_password
+    from app.db.migrate import migrate
+    from app.db.session import AsyncSessionLocal, engine
+    from app.db.models import WhatsAppNumber, User, Role, Assignment
+
+    async with engine.connect() as conn:
+        await conn.run_sync(migrate)
+    async with AsyncSessionLocal() as db:
+        wanted = [f"load-{i:03d}" for i in range(numbers)]
+        have = {n.phone_number_id: n for n in (await db.execute(
+            select(WhatsAppNumber).where(WhatsAppNumber.phone_number_id.in_(wanted))
+        )).scalars()}
+        db.add_all([WhatsAppNumber(display_name=f"Load {p}", phone_number_id=p) for p in wanted if p not in have])
+        usernames = [f"load-agent-{i:03d}" for i in range(agents)]
+        users = {u.username: u for u in (await db.execute(select(User).where(User.username.in_(usernames)))).scalars()}
+        password_hash = hash_password(AGENT_PASSWORD)
+        db.add_all([
+            User(username=u, name=f"Agent {u[-3:]}", password_hash=password_hash, role=Role.employee, is_active=True)
+            for u in usernames if u not in users
+        ])
+        await db.commit()
+
+        nums = list((await db.execute(
+            select(WhatsAppNumber.id, WhatsAppNumber.phone_number_id)
+            .where(WhatsAppNumber.phone_number_id.in_(wanted)).order_by(WhatsAppNumber.phone_number_id)
+        )).all())
+        user_ids = dict((await db.execute(select(User.username, User.id).where(User.username.in_(usernames)))).all())
+        existing = set((await db.execute(
+            select(Assignment.user_id, Assignment.wa_number_id).where(Assignment.user_id.in_(user_ids.values()))
+        )).all())
+        for i, username in enumerate(usernames):
+            for j in assigned(i, agents, len(nums)):
+                if (user_ids[username], nums[j][0]) not in existing:
+                    db.add(Assignment(user_id=user_ids[username], wa_number_id=nums[j][0]))
+        await db.commit()
+    await engine.dispose()
+    return [tuple(n) for n in nums], usernames
+
+async def agent(base: str, username: str, number_ids: list[int], stats: Stats, traffic: Traffic, deadline: float, think: float, rng: random.Random):
+    async with httpx.AsyncClient(base_url=base, timeout=30) as client:
+        resp = await stats.call(client, "POST /login", "POST", "/login", data={"username": username, "password": AGENT_PASSWORD})
+        if resp is None or "wa_session_user" not in client.cookies:
+            stats.errors["agent_login"] += 1
+            return
+        while time.perf_counter() < deadline:
+            n = rng.choice(number_ids)
+            roll = rng.random()
+            if roll < 0.1:
+                await stats.call(client, "GET /dashboard", "GET", "/dashboard")
+            elif roll < 0.2:
+                await stats.call(client, "GET /inbox/search", "GET", "/inbox/search", params={"q": rng.choice(WORDS)})
+            await stats.call(client, "GET /inbox", "GET", "/inbox", params={"number_id": n})
+            resp = await stats.call(client, "GET /inbox/numbers/{id}/conversations", "GET", f"/inbox/numbers/{n}/conversations")
+            convs = resp.json()["conversations"] if resp is not None and resp.status_code == 200 else []
+            waiting = [c for c in convs if c.get("last_direction") == "in"] or convs
+            if waiting:
+                cid = rng.choice(waiting[:10])["id"]
+                await stats.call(client, "GET /inbox/conversations/{id}/messages", "GET", f"/inbox/conversations/{cid}/messages")
+                resp = await stats.call(client, "POST /inbox/lock", "POST", "/inbox/lock", data={"conversation_id": cid})
+                if resp is not None and "err=" in resp.headers.get("location", ""):
+                    stats.counts["lock_conflicts"] += 1
+                elif resp is not None and resp.status_code < 400:
+                    token = traffic.token()
+                    stats.reply_sent[token] = time.perf_counter()
+                    stats.counts["replies"] += 1
+                    await stats.call(client, "POST /inbox/reply", "POST", "/inbox/reply", data={
+                        "conversation_id": cid, "text": f"[lt{token}] " + " ".join(rng.choice(WORDS) for _ in range(6)),
+                    })
+                    await stats.call(client, "POST /inbox/unlock", "POST", "/inbox/unlock", data={"conversation_id": cid})
+            await asyncio.sleep(rng.uniform(0, 2 * think))
+
+async def listen(ws_base: str, username: str, stats: Stats, stop: asyncio.Event):
+    """The agent's session socket: every number it can see, as a browser tab gets it."""
+    import websockets
+
+    try:
+        headers = {"Cookie": f"wa_session_user={username}"}
+        async with websockets.connect(f"{ws_base}/api/ws", additional_headers=headers, max_queue=None) as ws:
+            while not stop.is_set():
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), 0.5)
+                except asyncio.TimeoutError:
+                    continue
+                event = json.loads(raw)
+                if event.get("event") == "ping":
+                    await ws.send("pong")
+                stats.on_event(event, time.perf_counter())
+    except Exception:
+        stats.errors["websocket"] += 1
+
+async def webhooks(base: str, traffic: Traffic, rate: float, concurrency: int, deadline: float, rng: random.Random):
+    """Open-loop sender: deliveries are started on schedule; when `concurrency` are in flight new ones are skipped."""
+    kinds, weights = list(MIX), list(MIX.values())
+    in_flight: set[asyncio.Task] = set()
+    async with httpx.AsyncClient(base_url=base, timeout=30, limits=httpx.Limits(max_connections=concurrency)) as client:
+        next_at = time.perf_counter()
+        while next_at < deadline:
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            next_at += rng.expovariate(rate)
+            if len(in_flight) >= concurrency:
+                traffic.stats.counts["webhooks_skipped"] += 1
+                continue
+            task = asyncio.create_task(traffic.post(client, rng.choices(kinds, weights)[0]))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if in_flight:
+            await asyncio.gather(*in_flight)
+
+def report(args, stats: Stats, elapsed: float, dialect: str) -> dict:
+    routes = {}
+    for route, samples in sorted(stats.latency.items()):
+        routes[route] = {**summary(samples), "rps": round(len(samples) / elapsed, 2), "errors": stats.errors.get(route, 0)}
+    inbound = stats.counts["inbound_messages"]
+    replies = stats.counts["replies"]
+    return {
+        "run": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "mode": "http" if args.url else "in-process",
+            "dialect": dialect,
+            "duration_s": round(elapsed, 2),
+            **{k: getattr(args, k) for k in ("numbers", "agents", "rate", "concurrency", "customers", "think", "seed")},
+        },
+        "routes": routes,
+        "counts": dict(sorted(stats.counts.items())),
+        "errors": {k: v for k, v in sorted(stats.errors.items()) if v},
+        "ws_lag": {
+            "webhook_to_message_new": {**summary(stats.inbound_lag), "missed": inbound - len(stats.inbound_lag)},
+            "reply_to_status_sent": {**summary(stats.sent_lag), "missed": replies - len(stats.sent_lag)},
+        },
+    }
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Routes and lags whose p95 grew by more than `tolerance` (a fraction) over the baseline."""
+    pairs = [(f"route {k}", v, baseline.get("routes", {}).get(k)) for k, v in result["routes"].items()]
+    pairs += [(f"lag {k}", v, baseline.get("ws_lag", {}).get(k)) for k, v in result["ws_lag"].items()]
+    worse = []
+    for name, now, before in pairs:
+        if not before or not before.get("p95_ms") or not now.get("p95_ms"):
+            continue
+        change = now["p95_ms"] / before["p95_ms"] - 1
+        print(f"  {name}: p95 {before['p95_ms']} -> {now['p95_ms']} ms ({change:+.0%})")
+        if change > tolerance:
+            worse.append(name)
+    return worse
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base URL of a running server; default: run the app in process")
+    parser.add_argument("--fake-redis", action="store_true", help="in process: use fakeredis instead of REDIS_URL")
+    parser.add_argument("--graph-port", type=int, default=8790, help="port of the mock Graph API")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--rate", type=float, default=50, help="webhook deliveries per second")
+    parser.add_argument("--concurrency", type=int, default=64, help="max webhook deliveries in flight")
+    parser.add_argument("--numbers", type=int, default=50)
+    parser.add_argument("--customers", type=int, default=200, help="customers per number")
+    parser.add_argument("--agents", type=int, default=20)
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds an agent waits between actions")
+    parser.add_argument("--drain", type=float, default=5, help="seconds to wait for outstanding WebSocket events")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="bench_load.json")
+    parser.add_argument("--baseline", help="earlier result file to compare p95s against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth over the baseline")
+    args = parser.parse_args()
+
+    graph_base = f"http://127.0.0.1:{args.graph_port}"
+    if not args.url:
+        os.environ["GRAPH_BASE"] = graph_base
+        if args.fake_redis:
+            import fakeredis  # requirements-dev.txt
+            import app.services.redis_client as redis_client
+            redis_client.r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    from app.core.config import settings
+    from app.db.session import engine
+
+    rng = random.Random(args.seed)
+    nums, usernames = await seed(args.numbers, args.agents)
+    stats = Stats()
+    traffic = Traffic(rng, [p for _, p in nums], args.customers, settings.META_APP_SECRET, stats)
+
+    servers = [await serve(mock_graph(traffic, graph_base), args.graph_port)]
+    base = args.url
+    if not base:
+        from app.main import app
+
+        port = free_port()
+        servers.append(await serve(app, port))
+        base = f"http://127.0.0.1:{port}"
+    base = base.rstrip("/")
+
+    stop = asyncio.Event()
+    listeners = [asyncio.create_task(listen("ws" + base[4:], u, stats, stop)) for u in usernames]
+    await asyncio.sleep(0.5)
+
+    by_agent = {u: [nums[j][0] for j in assigned(i, len(usernames), len(nums))] for i, u in enumerate(usernames)}
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(
+        webhooks(base, traffic, args.rate, args.concurrency, deadline, rng),
+        *[agent(base, u, by_agent[u], stats, traffic, deadline, args.think, random.Random(f"{args.seed}-{u}")) for u in usernames],
+    )
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(args.drain)
+    stop.set()
+    await asyncio.gather(*listeners)
+    for server, task in reversed(servers):
+        server.should_exit = True
+        await task
+    await engine.dispose()
+
+    result = report(args, stats, elapsed, engine.dialect.name)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    print(f"{'route':45} {'n':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>5}")
+    for route, r in result["routes"].items():
+        print(f"{route:45} {r['n']:>7} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['errors']:>5}")
+    for name, lag in result["ws_lag"].items():
+        print(f"ws {name}: p50 {lag.get('p50_ms')} ms, p95 {lag.get('p95_ms')} ms, missed {lag['missed']}")
+    print("wrote", args.out)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            worse = compare(result, json.load(f), args.tolerance)
+        if worse:
+            print("p95 regressions:", ", ".join(worse))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+"""Search latency benchmark.
+
+Fills DATABASE_URL with a synthetic dataset (default 1,000,000 messages) unless it already holds
+that many messages, then times the search service. Point it at a scratch database:
+
+    DATABASE_URL=sqlite+aiosqlite:///./bench.db python scripts/bench_search.py --messages 1000000
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, func, insert
+
+from app.db.session import AsyncSessionLocal, engine
+from app.db.migrate import migrate
+from app.db.models import WhatsAppNumber, Conversation, Message, Direction
+from app.services.search import search_messages, search_customers
+
+WORDS = (
+    "order delivery price invoice refund address payment shipping tracking discount size color "
+    "available tomorrow today thanks hello please cancel change return warranty branch hours "
+    "طلب توصيل سعر فاتورة استرجاع عنوان دفع شحن تتبع خصم مقاس لون متاح بكرة اليوم شكرا مرحبا "
+    "إلغاء تغيير ضمان فرع مواعيد"
+).split()
+
+def sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 14)))
+
+async def seed(total: int, numbers: int, conversations: int, batch: int, rng: random.Random):
+    async with engine.connect() as conn:
+        await conn.run_sync(migrate)
+    async with AsyncSessionLocal() as db:
+        have = (await db.execute(select(func.count()).select_from(Message))).scalar_one()
+        if have >= total:
+            print(f"reusing {have} existing messages")
+            return
+        nums = [WhatsAppNumber(display_name=f"bench {i}", phone_number_id=f"bench-{i}-{rng.randrange(10**9)}") for i in range(numbers)]
+        db.add_all(nums)
+        await db.flush()
+        convs = [
+            Conversation(wa_number_id=nums[i % numbers].id, customer_wa_id=f"2010{i:08d}")
+            for i in range(conversations)
+        ]
+        db.add_all(convs)
+        await db.commit()
+        conv_ids = [c.id for c in convs]
+
+        start = datetime.now(timezone.utc) - timedelta(days=365)
+        todo = total - have
+        started = time.perf_counter()
+        while todo > 0:
+            n = min(batch, todo)
+            rows = [{
+                "conversation_id": rng.choice(conv_ids),
+                "direction": rng.choice((Direction.IN, Direction.OUT)),
+                "body": sentence(rng),
+                "sent_at": start + timedelta(seconds=rng.randrange(365 * 86400)),
+            } for _ in range(n)]
+            await db.execute(insert(Message), rows)
+            await db.commit()
+            todo -= n
+            print(f"\rseeded {total - todo}/{total}", end="", flush=True)
+        print(f"\nseeding took {time.perf_counter() - started:.1f}s")
+
+def summary(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))]
+    return {
+        "n": len(samples),
+        "p50_ms": round(statistics.median(samples) * 1000, 2),
+        "p95_ms": round(pick(0.95) * 1000, 2),
+        "p99_ms": round(pick(0.99) * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2),
+    }
+
+async def bench(queries: int, rng: random.Random) -> dict:
+    async with AsyncSessionLocal() as db:
+        number_ids = list((await db.execute(select(WhatsAppNumber.id))).scalars().all())
+        customers = list((await db.execute(select(Conversation.customer_wa_id).limit(1000))).scalars().all())
+        kinds = {
+            "one_word": lambda: rng.choice(WORDS),
+            "two_words": lambda: f"{rng.choice(WORDS)} {rng.choice(WORDS)}",
+            "prefix": lambda: rng.choice(WORDS)[:3],
+            "customer_digits": lambda: rng.choice(customers)[-6:],
+        }
+        results = {}
+        for kind, make in kinds.items():
+            samples = []
+            for _ in range(queries):
+                q = make()
+                started = time.perf_counter()
+                await search_messages(db, number_ids, q)
+                await search_customers(db, number_ids, q)
+                samples.append(time.perf_counter() - started)
+            results[kind] = summary(samples)
+        # a deep page: ranking cost grows with the number of matches
+        started = time.perf_counter()
+        await search_messages(db, number_ids, WORDS[0], offset=980)
+        results["deep_page_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return results
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--numbers", type=int, default=5)
+    parser.add_argument("--conversations", type=int, default=50_000)
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    await seed(args.messages, args.numbers, args.conversations, args.batch, rng)
+    results = await bench(args.queries, rng)
+    print(json.dumps({"dialect": engine.dialect.name, "messages": args.messages, "results": results}, indent=2))
+    await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""Per-route SQL query budgets.
+
+Seeds a scratch database (DATABASE_URL), drives the hot routes in process and fails (exit status 1)
+when one runs more statements than its budget or repeats a statement like an N+1. Each route is
+called once to warm the per-process caches, then measured. Lower a budget when a change saves
+queries; raising one should come with a reason in the commit.
+
+    DATABASE_URL=sqlite+aiosqlite:///./budgets.db python scripts/check_query_budgets.py --fake-redis
+"""
+import argparse
+import os
+import sys
+import time
+
+# route -> max statements per (warm) request
+BUDGETS = {
+    "GET /dashboard": 1,
+    "GET /inbox": 3,  # + lock holder names when a listed conversation is locked
+    "GET /inbox/numbers/{id}/conversations": 1,
+    "GET /inbox/conversations/{id}/messages": 2,
+    "GET /inbox/search": 2,
+    "POST /inbox/lock": 1,
+    "POST /inbox/reply": 3,
+    "POST /inbox/unlock": 1,
+    "POST /inbox/status": 3,
+    "GET /admin/users": 1,
+    "GET /admin/numbers": 0,
+    "GET /admin/assignments": 2,
+    "webhook ingest (10 messages)": 5,  # + conversation upsert for new customers
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fake-redis", action="store_true", help="use fakeredis instead of REDIS_URL")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print the statements of every route")
+    args = parser.parse_args()
+
+    os.environ["RUN_WORKERS"] = "false"
+    if args.fake_redis:
+        import fakeredis  # requirements-dev.txt
+        import app.services.redis_client as redis_client
+        redis_client.r = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import select
+    from app.main import app
+    from app.core.security import hash_password
+    from app.db.session import AsyncSessionLocal
+    from app.db.models import WhatsAppNumber, User, Role, Assignment, Conversation
+    from app.db.profiling import query_budget, QueryBudgetExceeded
+    from app.services.ingest import ingest_delivery
+
+    phone = f"budget-{int(time.time())}"
+
+    def delivery(start: int, count: int) -> dict:
+        msgs = [{
+            "from": f"2010000000{i % 3}", "id": f"wamid.{phone}.{i}", "timestamp": str(int(time.time())),
+            "type": "text", "text": {"body": f"order {i}"},
+        } for i in range(start, start + count)]
+        return {"entry": [{"changes": [{"value": {"metadata": {"phone_number_id": phone}, "messages": msgs}}]}]}
+
+    async def seed():
+        async with AsyncSessionLocal() as db:
+            number = WhatsAppNumber(display_name="Budget", phone_number_id=phone)
+            admin = User(username=f"{phone}-admin", name="Admin", password_hash=hash_password("pw"), role=Role.admin)
+            agent = User(username=f"{phone}-agent", name="Agent", password_hash=hash_password("pw"), role=Role.employee)
+            db.add_all([number, admin, agent])
+            await db.flush()
+            db.add(Assignment(user_id=agent.id, wa_number_id=number.id))
+            await db.commit()
+        from app.services.refcache import refcache
+        await refcache.invalidate("numbers", "assignments")
+        async with AsyncSessionLocal() as db:
+            await ingest_delivery(db, delivery(0, 30))
+        async with AsyncSessionLocal() as db:
+            conv = (await db.execute(select(Conversation).where(Conversation.wa_number_id == number.id))).scalars().first()
+        return number.id, conv.id
+
+    async def ingest(start: int):
+        async with AsyncSessionLocal() as db:
+            await ingest_delivery(db, delivery(start, 10))
+
+    failed = 0
+    with TestClient(app) as client:
+        number_id, conv_id = client.portal.call(seed)
+        client.post("/login", data={"username": f"{phone}-agent", "password": "pw"}, follow_redirects=False)
+
+        def as_admin(call):
+            def run():
+                client.cookies.set("wa_session_user", f"{phone}-admin")
+                return call()
+            return run
+
+        form = {"conversation_id": conv_id}
+        calls = {
+            "GET /dashboard": lambda: client.get("/dashboard"),
+            "GET /inbox": lambda: client.get(f"/inbox?number_id={number_id}&conversation_id={conv_id}"),
+            "GET /inbox/numbers/{id}/conversations": lambda: client.get(f"/inbox/numbers/{number_id}/conversations"),
+            "GET /inbox/conversations/{id}/messages": lambda: client.get(f"/inbox/conversations/{conv_id}/messages"),
+            "GET /inbox/search": lambda: client.get("/inbox/search", params={"q": "order"}),
+            "POST /inbox/lock": lambda: client.post("/inbox/lock", data=form, follow_redirects=False),
+            "POST /inbox/reply": lambda: client.post("/inbox/reply", data={**form, "text": "on its way"}, follow_redirects=False),
+            "POST /inbox/unlock": lambda: client.post("/inbox/unlock", data=form, follow_redirects=False),
+            "POST /inbox/status": lambda: client.post("/inbox/status", data={**form, "status": next(statuses)}, follow_redirects=False),
+            "GET /admin/users": as_admin(lambda: client.get("/admin/users")),
+            "GET /admin/numbers": as_admin(lambda: client.get("/admin/numbers")),
+            "GET /admin/assignments": as_admin(lambda: client.get("/admin/assignments")),
+            "webhook ingest (10 messages)": lambda: client.portal.call(ingest, next(batches)),
+        }
+        statuses = iter(["pending", "open", "pending"])
+        batches = iter([100, 200])
+
+        for route, call in calls.items():
+            call()
+            budget = BUDGETS[route]
+            try:
+                with query_budget(budget, route=route) as profile:
+                    resp = call()
+                if resp is not None and resp.status_code >= 400:
+                    raise QueryBudgetExceeded(f"{route} answered {resp.status_code}")
+                print(f"ok   {route}: {len(profile)}/{budget}")
+                if args.verbose:
+                    print(profile.report())
+            except QueryBudgetExceeded as e:
+                failed += 1
+                print(f"FAIL {e}")
+
+    print(f"{failed} route(s) over budget" if failed else "all routes within budget")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Query-plan regression check for the hot paths.
+
+Runs the inbox list, timeline, dashboard and webhook lookups against DATABASE_URL, captures the SQL
+they send and EXPLAINs it. Exits with status 1 when a statement reads a whole table instead of an
+index, or sorts rows that a paginated query should read in index order. An empty database is enough:
+SQLite picks indexes from the schema alone, and on Postgres sequential scans and sorts are switched
+off for the EXPLAIN so any that remain have no index to replace them.
+
+    DATABASE_URL=sqlite+aiosqlite:///./plans.db python scripts/check_query_plans.py
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime, timezone
+from sqlalchemy import event
+
+from app.db.session import AsyncSessionLocal, engine
+from app.db.migrate import migrate
+from app.db.models.message import MessageStatus
+from app.services import archive, counters
+from app.services.delivery_status import apply_statuses, RANK
+from app.services.ingest import conversation_ids
+from app.services.timeline import conversation_page, message_page, messages_after, encode_cursor
+
+NOW = datetime.now(timezone.utc)
+
+# name -> (coroutine taking a session, must the rows come out in index order)
+CHECKS = {
+    "inbox list": (lambda db: conversation_page(db, 1), True),
+    "inbox list, next page": (lambda db: conversation_page(db, 1, encode_cursor(NOW, 10**9)), True),
+    "timeline": (lambda db: message_page(db, 1), True),
+    "timeline, older page": (lambda db: message_page(db, 1, encode_cursor(NOW, 10**9)), True),
+    "timeline catch-up": (lambda db: messages_after(db, 1, 0), False),
+    "dashboard counters": (lambda db: counters.totals(db, [1, 2]), False),
+    "webhook conversation lookup": (lambda db: conversation_ids(db, {(1, "201000000000"), (2, "201000000001")}), False),
+    "webhook archived redelivery check": (lambda db: archive.archived_meta_ids(db, {1: [("wamid.plan-check", NOW)]}), False),
+    "webhook status update": (lambda db: apply_statuses(db, [{
+        "mid": "wamid.plan-check", "st": MessageStatus.read, "rank": RANK[MessageStatus.read], "at": NOW, "err": None,
+    }]), False),
+}
+
+def sqlite_problems(plan: list[str], ordered: bool) -> list[str]:
+    found = []
+    for line in plan:
+        # "SEARCH t USING INDEX" seeks; "SCAN t [USING INDEX]" reads the whole table or index
+        if line.startswith("SCAN ") and "CONSTANT ROW" not in line:
+            found.append(line)
+        if ordered and "TEMP B-TREE" in line:
+            found.append(line)
+    return found
+
+def postgres_problems(plan: list[str], ordered: bool) -> list[str]:
+    found = []
+    for line in plan:
+        node = line.strip().removeprefix("->").strip()
+        if node.startswith("Seq Scan") or (ordered and node.startswith("Sort")):
+            found.append(node)
+    return found
+
+async def explain(statement: str, params, ordered: bool) -> tuple[list[str], list[str]]:
+    async with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            await conn.exec_driver_sql("SET enable_seqscan = off")
+            await conn.exec_driver_sql("SET enable_sort = off")
+            plan = [r[0] for r in await conn.exec_driver_sql("EXPLAIN " + statement, params)]
+            return plan, postgres_problems(plan, ordered)
+        plan = [r[-1] for r in await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, params)]
+        return plan, sqlite_problems(plan, ordered)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every plan, not only failing ones")
+    args = parser.parse_args()
+
+    async with engine.connect() as conn:
+        await conn.run_sync(migrate)
+
+    captured: list[tuple[str, object]] = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, params, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "INSERT", "DELETE")):
+            captured.append((statement, params[0] if executemany else params))
+
+    failed = 0
+    for name, (run, ordered) in CHECKS.items():
+        captured.clear()
+        async with AsyncSessionLocal() as db:
+            await run(db)
+            await db.rollback()
+        for statement, params in list(captured):
+            plan, problems = await explain(statement, params, ordered)
+            print(f"{'FAIL' if problems else 'ok  '} {name}")
+            failed += bool(problems)
+            if problems or args.verbose:
+                print("     " + " ".join(statement.split()))
+                for line in plan:
+                    print("     | " + line)
+        captured.clear()
+
+    event.remove(engine.sync_engine, "before_cursor_execute", capture)
+    await engine.dispose()
+    print(f"{failed} statement(s) without an index plan" if failed else "all hot queries use indexes")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
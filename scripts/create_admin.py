@@ -4,13 +4,13 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from app.db.session import AsyncSessionLocal, engine
-from app.db.base import Base
+from app.db.migrate import migrate
 from app.db.models.user import User, Role
 from app.core.security import hash_password
 
 async def main():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    async with engine.connect() as conn:
+        await conn.run_sync(migrate)
 
     username = input("Admin username: ").strip()
     name = input("Admin name (optional): ").strip() or username
@@ -0,0 +1,31 @@
+"""Apply pending schema migrations (app/db/migrations) to DATABASE_URL.
+
+    python scripts/migrate.py           # apply
+    python scripts/migrate.py --status  # list pending migrations only
+"""
+import argparse
+import asyncio
+
+from app.db.session import engine
+from app.db.migrate import migrate, pending
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true")
+    args = parser.parse_args()
+
+    async with engine.connect() as conn:
+        if args.status:
+            names = await conn.run_sync(pending)
+            print("\n".join(names) if names else "Schema is up to date")
+        else:
+            names = await conn.run_sync(migrate)
+            for name in names:
+                print("applied", name)
+            print("Schema is up to date")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,14 @@
+import asyncio
+
+from app.db.session import AsyncSessionLocal
+from app.services.summaries import rebuild_summaries
+
+
+async def main():
+    async with AsyncSessionLocal() as db:
+        total = await rebuild_summaries(db)
+    print("Rebuilt summaries for", total, "conversations")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,16 @@
+import asyncio
+
+from app.db.session import AsyncSessionLocal
+from app.services.counters import reconcile
+
+
+async def main():
+    async with AsyncSessionLocal() as db:
+        drift = await reconcile(db)
+    for nid, diff in sorted(drift.items()):
+        print(f"number {nid}: corrected {diff}")
+    print("Counters reconciled;", len(drift), "numbers had drift")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,15 +3,15 @@ from getpass import getpass
 from sqlalchemy import select
 
 from app.db.session import AsyncSessionLocal, engine
-from app.db.base import Base
+from app.db.migrate import migrate
 from app.db.models.user import User
 from app.core.security import hash_password
 
 
 async def main():
-    # ensure tables exist
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # bring the schema up to date
+    async with engine.connect() as conn:
+        await conn.run_sync(migrate)
 
     username = input("Username to reset: ").strip()
     new_pass = getpass("New password: ").strip()
@@ -0,0 +1,112 @@
+"""Test setup: a scratch SQLite database, fakeredis and in-memory queues, so no services are needed.
+
+Async code runs on the app's event loop through the `run` fixture (the TestClient portal), the loop
+the engine's pooled connections and the fake Redis belong to. Every test starts from empty tables.
+"""
+import os
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="wa_inbox_tests_")
+os.environ.update({
+    "DATABASE_URL": f"sqlite+aiosqlite:///{_scratch}/test.db",
+    "SECRET_KEY": "test-secret",
+    "REDIS_URL": "redis://localhost:6379/15",
+    "META_APP_SECRET": "test-app-secret",
+    "WHATSAPP_VERIFY_TOKEN": "test-verify-token",
+    "WHATSAPP_ACCESS_TOKEN": "test-access-token",
+    "QUEUE_BACKEND": "memory",
+    "BROADCAST_BACKEND": "memory",
+    "DEDUPE_BACKEND": "memory",
+    "METRICS_BACKEND": "memory",
+    "RUN_WORKERS": "false",
+    "MEDIA_ROOT": os.path.join(_scratch, "media"),
+    "ARCHIVE_ROOT": os.path.join(_scratch, "archive"),
+})
+
+import fakeredis  # noqa: E402
+import pytest  # noqa: E402
+
+import app.services.redis_client as redis_client  # noqa: E402
+
+# before anything imports `r` from it
+redis_client.r = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.core.security import hash_password  # noqa: E402
+from app.db.base import Base  # noqa: E402
+from app.db.session import AsyncSessionLocal  # noqa: E402
+from app.db.models import WhatsAppNumber, User, Role, Assignment  # noqa: E402
+from app.db.profiling import query_budget  # noqa: E402
+from app.services.dedupe import recent_message_ids  # noqa: E402
+from app.services.refcache import refcache, SCOPES  # noqa: E402
+
+PASSWORD = "pw"
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as c:
+        yield c
+
+@pytest.fixture
+def run(client):
+    """run(async_fn, *args): call it on the app's event loop and return the result."""
+    return client.portal.call
+
+async def _reset():
+    async with AsyncSessionLocal() as db:
+        for table in reversed(Base.metadata.sorted_tables):
+            await db.execute(delete(table))
+        await db.commit()
+    await redis_client.r.flushall()
+    refcache.clear(SCOPES)
+    recent_message_ids.ids.clear()
+
+@pytest.fixture(autouse=True)
+def clean(client):
+    client.portal.call(_reset)
+    client.cookies.clear()
+    yield
+
+@pytest.fixture
+def seed(run):
+    """seed(numbers=2, users={"agent": [1]}) -> (numbers, users): active numbers P1..Pn and users
+    (password PASSWORD) assigned to the given number positions; "admin" is always an admin."""
+    def seed(numbers: int = 1, users: dict[str, list[int]] | None = None):
+        async def go():
+            async with AsyncSessionLocal() as db:
+                nums = [WhatsAppNumber(display_name=f"Number {i}", phone_number_id=f"P{i}") for i in range(1, numbers + 1)]
+                people = {"admin": User(username="admin", name="Admin", password_hash=hash_password(PASSWORD), role=Role.admin)}
+                for name in users or {}:
+                    people[name] = User(username=name, name=name.title(), password_hash=hash_password(PASSWORD), role=Role.employee)
+                db.add_all([*nums, *people.values()])
+                await db.flush()
+                for name, positions in (users or {}).items():
+                    db.add_all(Assignment(user_id=people[name].id, wa_number_id=nums[p - 1].id) for p in positions)
+                await db.commit()
+            refcache.clear(SCOPES)
+            return nums, people
+        return run(go)
+    return seed
+
+@pytest.fixture
+def login(client):
+    def login(username: str):
+        resp = client.post("/login", data={"username": username, "password": PASSWORD}, follow_redirects=False)
+        assert resp.status_code in (302, 303), resp.text
+    return login
+
+@pytest.fixture
+def within_budget():
+    """within_budget(n, call, route=...): call once to warm the per-process caches, then fail the test
+    (QueryBudgetExceeded) when a second call runs more than n statements or repeats one like an N+1."""
+    def within_budget(max_queries: int, call, route: str = "call"):
+        call()
+        with query_budget(max_queries, route=route) as profile:
+            result = call()
+        if result is not None and hasattr(result, "status_code"):
+            assert result.status_code < 400, f"{route} answered {result.status_code}"
+        return profile
+    return within_budget
@@ -0,0 +1,124 @@
+import time
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select, update
+
+from app.db.models import Conversation, Message, Direction, MessageStatus, NumberStats, WhatsAppNumber, ArchiveConversation
+from app.core.security import create_access_token
+from app.db.session import AsyncSessionLocal, engine
+from app.db.migrations import v0007_archive_member_stats
+from app.services import archive, counters
+from app.services.dedupe import recent_message_ids
+from app.services.ingest import ingest_delivery
+from app.services.summaries import rebuild_summaries
+from app.services.timeline import message_page
+
+DAY = 86400
+
+def delivery(msgs: list[dict]) -> dict:
+    return {"entry": [{"changes": [{"value": {"metadata": {"phone_number_id": "P1"}, "messages": msgs}}]}]}
+
+def text(i: int, age_days: float) -> dict:
+    return {"from": "201000000000", "id": f"wamid.{i}", "timestamp": str(int(time.time() - age_days * DAY)), "type": "text", "text": {"body": f"m{i}"}}
+
+# 100 inbound messages one a day, the oldest 99.5 days ago; 30 days of retention archives 70 of them
+HISTORY = [text(i, 99.5 - i) for i in range(100)]
+
+async def summary() -> tuple:
+    async with AsyncSessionLocal() as db:
+        c = (await db.execute(select(Conversation))).scalar_one()
+        stats = (await db.execute(select(NumberStats))).scalar_one()
+        live = len((await db.execute(select(Message.id))).all())
+        return c.message_count, c.inbound_count, c.unread_count, stats.inbound_messages, live
+
+async def ingest_and_archive(extra=()):
+    async with AsyncSessionLocal() as db:
+        await ingest_delivery(db, delivery(HISTORY))
+        for row in extra:
+            db.add(row(await db.scalar(select(Conversation.id))))
+        await db.commit()
+        await db.execute(update(WhatsAppNumber).values(retention_days=30))
+        await db.commit()
+        segments = await archive.run(db)
+    return sum(s.message_count for s in segments)
+
+@pytest.fixture
+def archived(run, seed):
+    seed(1)
+    assert run(ingest_and_archive) == 70
+    assert run(summary) == (100, 100, 100, 100, 30)
+
+def test_repair_tools_count_archived_history(run, archived):
+    async def go():
+        async with AsyncSessionLocal() as db:
+            assert await counters.reconcile(db) == {}
+            # force drift, then repair it
+            await db.execute(update(Conversation).values(message_count=0, inbound_count=0, unread_count=0))
+            await db.execute(update(NumberStats).values(inbound_messages=0))
+            await db.commit()
+            number_id = await db.scalar(select(WhatsAppNumber.id))
+            assert await counters.reconcile(db) == {number_id: {"inbound_messages": 100}}
+            await rebuild_summaries(db)
+        return await summary()
+    assert run(go) == (100, 100, 100, 100, 30)
+
+def test_unread_after_an_archived_reply(run, seed):
+    seed(1)
+    reply = lambda cid: Message(  # noqa: E731
+        conversation_id=cid, direction=Direction.OUT, body="ok", status=MessageStatus.read,
+        sent_at=datetime.fromtimestamp(time.time() - 60 * DAY, tz=timezone.utc),
+    )
+    run(ingest_and_archive, [reply])
+
+    async def go():
+        async with AsyncSessionLocal() as db:
+            await rebuild_summaries(db)
+        return await summary()
+    # 101 messages; the 60 inbound after the reply (30 of them archived) are unanswered
+    assert run(go)[:3] == (101, 100, 60)
+
+def test_redelivered_archived_messages_are_not_stored_again(run, archived):
+    async def go():
+        recent_message_ids.ids.clear()
+        async with AsyncSessionLocal() as db:
+            events = await ingest_delivery(db, delivery(HISTORY[:3] + [text(200, 0)]))
+        assert len(events) == 1
+        async with AsyncSessionLocal() as db:
+            conv = (await db.execute(select(Conversation))).scalar_one()
+            page, _ = await message_page(db, conv.id, limit=200, archived=True)
+        ids = [m.meta_message_id for m in page]
+        assert len(ids) == len(set(ids)) == 101
+        return await summary()
+    assert run(go) == (101, 101, 101, 101, 31)
+
+def test_ingest_stats_count_archived_redeliveries(client, run, archived):
+    def dropped() -> dict:
+        resp = client.get("/api/admin/ingest", headers={"Authorization": f"Bearer {create_access_token('admin')}"})
+        assert resp.status_code == 200
+        return resp.json()["duplicates_dropped"]
+    before = dropped()
+
+    async def go():
+        recent_message_ids.ids.clear()
+        async with AsyncSessionLocal() as db:
+            await ingest_delivery(db, delivery(HISTORY[:3]))
+    run(go)
+    after = dropped()
+    assert after["archive"] - before["archive"] == 3
+    assert all(after[stage] == before[stage] for stage in ("batch", "cache", "db"))
+
+def test_migration_backfills_member_stats_from_the_files(run, archived):
+    async def go():
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(ArchiveConversation).values(inbound_count=None, unanswered_count=None, last_inbound_at=None))
+            await db.execute(update(Conversation).values(inbound_count=30))
+            await db.commit()
+        async with engine.begin() as conn:
+            await conn.run_sync(v0007_archive_member_stats.upgrade)
+        async with AsyncSessionLocal() as db:
+            members = (await db.execute(select(ArchiveConversation))).scalars().all()
+            assert sum(m.inbound_count for m in members) == sum(m.unanswered_count for m in members) == 70
+            assert all(m.last_inbound_at is not None and m.last_outbound_at is None for m in members)
+        return await summary()
+    assert run(go)[1] == 100
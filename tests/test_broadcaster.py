@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+import fakeredis
+
+from app.services.broadcaster import Broadcaster
+from app.services.pubsub import RedisPubSub
+
+class FakeSocket:
+    def __init__(self):
+        self.sent: list[dict] = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        self.sent.append(json.loads(data))
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+async def settle(condition, timeout: float = 3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition() and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.02)
+
+def test_two_workers_share_rooms_over_redis(run):
+    async def go():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        a, b = Broadcaster(RedisPubSub(redis)), Broadcaster(RedisPubSub(redis))
+        on_a, on_b, elsewhere = FakeSocket(), FakeSocket(), FakeSocket()
+        try:
+            for broadcaster, ws, room in ((a, on_a, "number:1"), (b, on_b, "number:1"), (b, elsewhere, "number:2")):
+                await broadcaster.connect(ws)
+                await broadcaster.join(room, ws)
+            await asyncio.sleep(0.2)  # let both listeners subscribe
+
+            await a.broadcast("number:1", {"event": "message:new", "id": 1})
+            await settle(lambda: on_a.sent and on_b.sent)
+            assert on_a.sent == on_b.sent == [{"event": "message:new", "id": 1}]
+            assert elsewhere.sent == []
+
+            # the last local socket leaving a room drops the worker's subscription
+            await b.disconnect(on_b)
+            await b.broadcast("number:1", {"event": "message:new", "id": 2})
+            await settle(lambda: len(on_a.sent) == 2)
+            assert [m["id"] for m in on_a.sent] == [1, 2]
+            assert on_b.sent == [{"event": "message:new", "id": 1}]
+            assert "number:1" not in b.rooms
+        finally:
+            await a.close()
+            await b.close()
+    run(go)
+
+def test_without_pubsub_rooms_are_local(run):
+    async def go():
+        a, b = Broadcaster(), Broadcaster()
+        on_a, on_b = FakeSocket(), FakeSocket()
+        try:
+            await a.connect(on_a)
+            await a.join("number:1", on_a)
+            await b.connect(on_b)
+            await b.join("number:1", on_b)
+            await a.broadcast("number:1", {"event": "ping"})
+            await settle(lambda: on_a.sent)
+            await asyncio.sleep(0.1)
+            assert on_a.sent == [{"event": "ping"}]
+            assert on_b.sent == []
+        finally:
+            await a.close()
+            await b.close()
+    run(go)
@@ -0,0 +1,49 @@
+import time
+
+from sqlalchemy import select, update
+
+from app.db.models import NumberStats
+from app.db.session import AsyncSessionLocal
+from app.services import counters
+from app.services.ingest import ingest_delivery
+
+def delivery(n: int) -> dict:
+    msgs = [{"from": "201000000000", "id": f"wamid.{i}", "timestamp": str(int(time.time())), "type": "text", "text": {"body": "hi"}} for i in range(n)]
+    return {"entry": [{"changes": [{"value": {"metadata": {"phone_number_id": "P1"}, "messages": msgs}}]}]}
+
+async def stats() -> tuple:
+    async with AsyncSessionLocal() as db:
+        s = (await db.execute(select(NumberStats))).scalar_one()
+        return s.conversations, s.open_conversations, s.inbound_messages
+
+def test_reconcile_corrects_drift(run, seed):
+    nums, _ = seed(1)
+
+    async def go():
+        async with AsyncSessionLocal() as db:
+            await ingest_delivery(db, delivery(3))
+            assert await counters.reconcile(db) == {}
+            await db.execute(update(NumberStats).values(conversations=5, inbound_messages=0))
+            await db.commit()
+            assert await counters.reconcile(db) == {nums[0].id: {"conversations": -4, "inbound_messages": 3}}
+        return await stats()
+    assert run(go) == (1, 1, 3)
+
+def test_reconcile_keeps_increments_made_while_it_counts(run, seed, monkeypatch):
+    nums, _ = seed(1)
+    real_bump = counters.bump
+
+    async def bump_after_an_ingest(db, deltas):
+        # an ingest worker's increment lands between reconcile's read and its correction
+        await real_bump(db, {nums[0].id: {"inbound_messages": 1}})
+        await real_bump(db, deltas)
+
+    async def go():
+        async with AsyncSessionLocal() as db:
+            await ingest_delivery(db, delivery(3))
+            await db.execute(update(NumberStats).values(inbound_messages=0))
+            await db.commit()
+            monkeypatch.setattr(counters, "bump", bump_after_an_ingest)
+            await counters.reconcile(db)
+        return await stats()
+    assert run(go) == (1, 1, 4)
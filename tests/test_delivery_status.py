@@ -0,0 +1,83 @@
+import asyncio
+import json
+import time
+
+from sqlalchemy import select, update
+
+from app.db.models import Conversation, Message, Direction, MessageStatus
+from app.db.session import AsyncSessionLocal
+from app.services.delivery_status import StatusCoalescer, parse_status, status_coalescer
+from app.services.ingest import ingest_delivery, process_delivery
+from app.services.stream_queue import MemoryStreamQueue, StreamWorkerPool
+
+def status(mid: str, state: str) -> dict:
+    return {"id": mid, "status": state, "timestamp": str(int(time.time())), "recipient_id": "201000000000"}
+
+async def reply(meta_message_id: str | None) -> int:
+    """An outbound message in a fresh conversation on P1, as the outbox leaves it."""
+    msg = {"from": "201000000000", "id": "wamid.in", "timestamp": str(int(time.time())), "type": "text", "text": {"body": "hi"}}
+    async with AsyncSessionLocal() as db:
+        await ingest_delivery(db, {"entry": [{"changes": [{"value": {"metadata": {"phone_number_id": "P1"}, "messages": [msg]}}]}]})
+        conv = (await db.execute(select(Conversation))).scalar_one()
+        out = Message(conversation_id=conv.id, direction=Direction.OUT, body="ok", sent_at=conv.last_message_at,
+                      status=MessageStatus.sending, meta_message_id=meta_message_id)
+        db.add(out)
+        await db.commit()
+        return out.id
+
+async def state(message_id: int) -> MessageStatus:
+    async with AsyncSessionLocal() as db:
+        return (await db.get(Message, message_id)).status
+
+def test_status_before_its_message_is_retried(run, seed):
+    seed(1)
+
+    async def go():
+        message_id = await reply(None)
+        coalescer = StatusCoalescer(window=1, max_pending=100, retry_seconds=30)
+        written = coalescer.add([parse_status(status("wamid.out", "delivered"))])
+        await coalescer.flush()
+        await asyncio.sleep(0)
+        assert not written.done() and "wamid.out" in coalescer.unmatched
+
+        # the outbox records the Meta id; the next flush applies the held status
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(Message).where(Message.id == message_id).values(meta_message_id="wamid.out", status=MessageStatus.sent))
+            await db.commit()
+        await coalescer.flush()
+        await asyncio.sleep(0)
+        assert written.done() and not coalescer.unmatched
+        assert await state(message_id) == MessageStatus.delivered
+    run(go)
+
+def test_unmatched_status_is_given_up_after_the_retry_window(run, seed):
+    seed(1)
+
+    async def go():
+        coalescer = StatusCoalescer(window=1, max_pending=100, retry_seconds=0)
+        written = coalescer.add([parse_status(status("wamid.nowhere", "read"))])
+        await coalescer.flush()
+        await asyncio.sleep(0)
+        assert written.done() and not coalescer.unmatched and not coalescer.waiters
+    run(go)
+
+def test_webhook_entry_is_acked_only_after_the_flush(run, seed):
+    seed(1)
+
+    async def go():
+        message_id = await reply("wamid.out")
+        queue = MemoryStreamQueue("test:webhooks")
+        pool = StreamWorkerPool("webhooks", queue, process_delivery, workers=1)
+        body = {"entry": [{"changes": [{"value": {"metadata": {"phone_number_id": "P1"}, "statuses": [status("wamid.out", "read")]}}]}]}
+        entry_id = await queue.add({"body": json.dumps(body)})
+        [(entry_id, fields, deliveries)] = await queue.read("c1", 10, 0)
+
+        await pool.process(entry_id, fields, deliveries)
+        await asyncio.sleep(0.05)
+        assert entry_id in queue.pending  # a crash now redelivers it
+
+        await status_coalescer.flush()
+        await asyncio.sleep(0.05)
+        assert entry_id not in queue.pending and not queue.entries
+        assert await state(message_id) == MessageStatus.read
+    run(go)
@@ -0,0 +1,42 @@
+import time
+
+from sqlalchemy import select
+
+from app.db.models import Conversation
+from app.db.session import AsyncSessionLocal
+from app.services.ingest import ingest_delivery
+
+def delivery(phone_number_id: str, msg_id: str, body: str) -> dict:
+    msg = {"from": "201000000000", "id": msg_id, "timestamp": str(int(time.time())), "type": "text", "text": {"body": body}}
+    return {"entry": [{"changes": [{"value": {"metadata": {"phone_number_id": phone_number_id}, "messages": [msg]}}]}]}
+
+def conversations(run) -> dict[int, int]:
+    """wa_number_id -> conversation id, after one inbound message on each of P1 and P2."""
+    async def go():
+        async with AsyncSessionLocal() as db:
+            await ingest_delivery(db, delivery("P1", "wamid.a", "for number one"))
+            await ingest_delivery(db, delivery("P2", "wamid.b", "secret of number two"))
+        async with AsyncSessionLocal() as db:
+            return dict((await db.execute(select(Conversation.wa_number_id, Conversation.id))).all())
+    return run(go)
+
+def test_inbox_only_shows_assigned_numbers(client, run, seed, login):
+    nums, _ = seed(2, {"agent": [1]})
+    convs = conversations(run)
+    login("agent")
+    one, two = nums[0].id, nums[1].id
+
+    resp = client.get(f"/inbox?number_id={one}&conversation_id={convs[one]}")
+    assert resp.status_code == 200 and "for number one" in resp.text
+
+    assert client.get(f"/inbox?number_id={two}").status_code == 403
+    resp = client.get(f"/inbox?number_id={one}&conversation_id={convs[two]}")
+    assert resp.status_code == 403 and "secret of number two" not in resp.text
+    assert client.get(f"/inbox?number_id={one}&conversation_id=999999").status_code == 404
+
+def test_admin_sees_every_number(client, run, seed, login):
+    nums, _ = seed(2)
+    convs = conversations(run)
+    login("admin")
+    resp = client.get(f"/inbox?number_id={nums[1].id}&conversation_id={convs[nums[1].id]}")
+    assert resp.status_code == 200 and "secret of number two" in resp.text
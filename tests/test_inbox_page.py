@@ -0,0 +1,39 @@
+import re
+import time
+
+from sqlalchemy import select
+
+from app.db.models import Conversation
+from app.db.session import AsyncSessionLocal
+from app.services.ingest import ingest_delivery
+from app.services.timeline import CONVERSATIONS_PAGE
+
+def selected_status(html: str) -> list[str]:
+    return re.findall(r'<option value="(\w+)" selected>', html)
+
+def test_status_of_a_conversation_beyond_the_first_page(client, run, seed, login):
+    nums, _ = seed(1, {"agent": [1]})
+    now = int(time.time())
+    msgs = [{
+        "from": f"20100000{i:04d}", "id": f"wamid.page.{i}", "timestamp": str(now - 1000 + i), "type": "text", "text": {"body": "hi"},
+    } for i in range(CONVERSATIONS_PAGE + 1)]
+
+    async def go():
+        async with AsyncSessionLocal() as db:
+            await ingest_delivery(db, {"entry": [{"changes": [{"value": {"metadata": {"phone_number_id": "P1"}, "messages": msgs}}]}]})
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(select(Conversation.id).where(Conversation.customer_wa_id == "201000000000"))).scalar_one()
+    oldest = run(go)
+    login("agent")
+    url = f"/inbox?number_id={nums[0].id}&conversation_id={oldest}"
+
+    client.post("/inbox/status", data={"conversation_id": oldest, "status": "done"}, follow_redirects=False)
+    resp = client.get(url)
+    assert f'data-conv-id="{oldest}"' not in resp.text  # not on the first page of the list
+    assert selected_status(resp.text) == ["done"]
+
+    # the page's ETag follows the selected conversation's status too
+    client.post("/inbox/status", data={"conversation_id": oldest, "status": "pending"}, follow_redirects=False)
+    again = client.get(url, headers={"If-None-Match": resp.headers["etag"]})
+    assert again.status_code == 200
+    assert selected_status(again.text) == ["pending"]
@@ -0,0 +1,50 @@
+import time
+
+import pytest
+from sqlalchemy import select
+
+from app.db.models import Conversation, Message, Direction
+from app.db.session import AsyncSessionLocal
+from app.services.ingest import ingest_delivery
+from app.services.media import media_store
+
+async def chunks(data: bytes):
+    yield data
+
+def stored_media(run, mime: str, filename: str, data: bytes) -> int:
+    """An inbound message whose media file is already in the store."""
+    msg = {"from": "201000000000", "id": "wamid.in", "timestamp": str(int(time.time())), "type": "text", "text": {"body": "hi"}}
+
+    async def go():
+        async with AsyncSessionLocal() as db:
+            await ingest_delivery(db, {"entry": [{"changes": [{"value": {"metadata": {"phone_number_id": "P1"}, "messages": [msg]}}]}]})
+            conv = (await db.execute(select(Conversation))).scalar_one()
+            sha256, size = await media_store.save(chunks(data))
+            m = Message(conversation_id=conv.id, direction=Direction.IN, sent_at=conv.last_message_at, media_type="document",
+                        media_mime=mime, media_filename=filename, media_sha256=sha256, media_size=size)
+            db.add(m)
+            await db.commit()
+            return m.id
+    return run(go)
+
+@pytest.mark.parametrize("mime, filename", [
+    ("text/html", "invoice.html"),
+    ("image/svg+xml", "logo.svg"),
+])
+def test_scriptable_documents_are_downloaded(client, run, seed, login, mime, filename):
+    seed(1, {"agent": [1]})
+    message_id = stored_media(run, mime, filename, b"<svg xmlns='http://www.w3.org/2000/svg'><script>alert(1)</script></svg>")
+    login("agent")
+    resp = client.get(f"/inbox/media/{message_id}")
+    assert resp.status_code == 200
+    assert resp.headers["content-disposition"] == f"attachment; filename*=UTF-8''{filename}"
+    assert resp.headers["x-content-type-options"] == "nosniff"
+    assert resp.headers["content-security-policy"] == "sandbox"
+
+def test_images_are_shown_inline(client, run, seed, login):
+    seed(1, {"agent": [1]})
+    message_id = stored_media(run, "image/jpeg", "photo.jpg", b"\xff\xd8\xff\xe0 not really a jpeg")
+    login("agent")
+    resp = client.get(f"/inbox/media/{message_id}")
+    assert resp.status_code == 200 and resp.headers["content-disposition"].startswith("inline;")
+    assert resp.headers["x-content-type-options"] == "nosniff"
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+from sqlalchemy import select
+
+from app.db.models import Conversation, Message, MessageStatus
+from app.db.session import AsyncSessionLocal
+from app.services import outbox
+from app.services.ingest import ingest_delivery
+
+def inbound(n: int = 1) -> dict:
+    msgs = [{"from": "201000000000", "id": f"wamid.in.{i}", "timestamp": str(int(time.time())), "type": "text", "text": {"body": "hi"}} for i in range(n)]
+    return {"entry": [{"changes": [{"value": {"metadata": {"phone_number_id": "P1"}, "messages": msgs}}]}]}
+
+def send_reply(run) -> Message:
+    async def go():
+        async with AsyncSessionLocal() as db:
+            await ingest_delivery(db, inbound())
+        async with AsyncSessionLocal() as db:
+            conv = (await db.execute(select(Conversation))).scalar_one()
+            msg = await outbox.queue_reply(db, conv, "on its way")
+        async with AsyncSessionLocal() as db:
+            await outbox.send_queued(db, msg.id)
+        async with AsyncSessionLocal() as db:
+            return await db.get(Message, msg.id)
+    return run(go)
+
+def test_sent_reply_records_meta_id(run, seed, monkeypatch):
+    seed(1)
+
+    async def send(phone_number_id, to, text):
+        return {"messages": [{"id": "wamid.out.1"}]}
+    monkeypatch.setattr(outbox, "send_text_message", send)
+    msg = send_reply(run)
+    assert (msg.status, msg.meta_message_id) == (MessageStatus.sent, "wamid.out.1")
+
+@pytest.mark.parametrize("error", [ValueError("Expecting value: line 1 column 1 (char 0)"), TimeoutError()])
+def test_unexpected_send_error_fails_the_row(run, seed, monkeypatch, error):
+    seed(1)
+
+    async def send(phone_number_id, to, text):
+        raise error
+    monkeypatch.setattr(outbox, "send_text_message", send)
+    msg = send_reply(run)
+    assert msg.status == MessageStatus.failed
+    assert msg.error.startswith(type(error).__name__)
+
+def test_limiter_error_fails_the_row(run, seed, monkeypatch):
+    seed(1)
+
+    async def acquire(key):
+        raise RuntimeError("limiter down")
+    monkeypatch.setattr(outbox.limiter, "acquire", acquire)
+    msg = send_reply(run)
+    assert (msg.status, msg.error) == (MessageStatus.failed, "RuntimeError: limiter down")
@@ -0,0 +1,61 @@
+import time
+from itertools import count
+
+import pytest
+from sqlalchemy import select
+
+from app.db.models import Conversation
+from app.db.session import AsyncSessionLocal
+from app.services.ingest import ingest_delivery
+from scripts.check_query_budgets import BUDGETS
+
+def delivery(start: int, n: int) -> dict:
+    msgs = [{
+        "from": f"2010000000{i % 3}", "id": f"wamid.budget.{i}", "timestamp": str(int(time.time())),
+        "type": "text", "text": {"body": f"order {i}"},
+    } for i in range(start, start + n)]
+    return {"entry": [{"changes": [{"value": {"metadata": {"phone_number_id": "P1"}, "messages": msgs}}]}]}
+
+@pytest.fixture
+def inbox(run, seed, login, client):
+    """A number with 30 messages over 3 conversations, an agent assigned to it and logged in."""
+    nums, _ = seed(1, {"agent": [1]})
+
+    async def go():
+        async with AsyncSessionLocal() as db:
+            await ingest_delivery(db, delivery(0, 30))
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(select(Conversation.id).order_by(Conversation.id))).scalars().first()
+    conv_id = run(go)
+    login("agent")
+    return nums[0].id, conv_id
+
+@pytest.mark.parametrize("route", list(BUDGETS))
+def test_route_within_query_budget(route, inbox, client, run, login, within_budget):
+    number_id, conv_id = inbox
+    form = {"conversation_id": conv_id}
+    statuses = iter(["pending", "open"])
+    batches = count(100, 100)
+
+    async def ingest():
+        async with AsyncSessionLocal() as db:
+            await ingest_delivery(db, delivery(next(batches), 10))
+
+    if route.startswith(("GET /admin", "POST /admin")):
+        login("admin")
+    calls = {
+        "GET /dashboard": lambda: client.get("/dashboard"),
+        "GET /inbox": lambda: client.get(f"/inbox?number_id={number_id}&conversation_id={conv_id}"),
+        "GET /inbox/numbers/{id}/conversations": lambda: client.get(f"/inbox/numbers/{number_id}/conversations"),
+        "GET /inbox/conversations/{id}/messages": lambda: client.get(f"/inbox/conversations/{conv_id}/messages"),
+        "GET /inbox/search": lambda: client.get("/inbox/search", params={"q": "order"}),
+        "POST /inbox/lock": lambda: client.post("/inbox/lock", data=form, follow_redirects=False),
+        "POST /inbox/reply": lambda: client.post("/inbox/reply", data={**form, "text": "on its way"}, follow_redirects=False),
+        "POST /inbox/unlock": lambda: client.post("/inbox/unlock", data=form, follow_redirects=False),
+        "POST /inbox/status": lambda: client.post("/inbox/status", data={**form, "status": next(statuses)}, follow_redirects=False),
+        "GET /admin/users": lambda: client.get("/admin/users"),
+        "GET /admin/numbers": lambda: client.get("/admin/numbers"),
+        "GET /admin/assignments": lambda: client.get("/admin/assignments"),
+        "webhook ingest (10 messages)": lambda: run(ingest),
+    }
+    within_budget(BUDGETS[route], calls[route], route=route)
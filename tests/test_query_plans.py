@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy import event
+
+from app.db.session import AsyncSessionLocal, engine
+from scripts.check_query_plans import CHECKS, explain
+
+@pytest.mark.parametrize("name", list(CHECKS))
+def test_hot_query_uses_an_index(run, name):
+    check, ordered = CHECKS[name]
+    captured: list[tuple[str, object]] = []
+
+    def capture(conn, cursor, statement, params, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "INSERT", "DELETE")):
+            captured.append((statement, params[0] if executemany else params))
+
+    async def go():
+        event.listen(engine.sync_engine, "before_cursor_execute", capture)
+        try:
+            async with AsyncSessionLocal() as db:
+                await check(db)
+                await db.rollback()
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", capture)
+        assert captured
+        for statement, params in captured:
+            plan, problems = await explain(statement, params, ordered)
+            assert not problems, " ".join(statement.split()) + "\n" + "\n".join(plan)
+    run(go)
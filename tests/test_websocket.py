@@ -0,0 +1,16 @@
+def ready(client, url: str) -> list[int]:
+    with client.websocket_connect(url) as ws:
+        msg = ws.receive_json()
+        assert msg["event"] == "ws:ready"
+        return msg["numbers"]
+
+def test_socket_follows_only_the_requested_numbers(client, seed, login):
+    nums, _ = seed(3, {"agent": [1, 2]})
+    one, two, three = (n.id for n in nums)
+    login("agent")
+
+    assert ready(client, "/api/ws") == sorted([one, two])
+    assert ready(client, f"/api/ws?numbers={one}") == [one]
+    # numbers the agent cannot see are ignored; the page without a number follows none
+    assert ready(client, f"/api/ws?numbers={two},{three}") == [two]
+    assert ready(client, "/api/ws?numbers=") == []
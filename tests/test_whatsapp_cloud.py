@@ -0,0 +1,103 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from app.services import whatsapp_cloud
+from app.services.whatsapp_cloud import GraphClient, send_text_message
+
+class MockGraph:
+    """A keep-alive HTTP/1.1 server standing in for GRAPH_BASE; answers with `responses` in order
+    (the last one repeats) and records the connection and time of every request."""
+
+    def __init__(self, *responses: tuple[int, dict, dict]):
+        self.responses = list(responses)
+        self.requests: list[tuple[int, str, float]] = []
+        self.connections = 0
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.base = "http://127.0.0.1:%d" % self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        conn = self.connections
+        try:
+            while line := await reader.readline():
+                headers = {}
+                while (header := await reader.readline()) not in (b"\r\n", b""):
+                    name, value = header.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests.append((conn, line.decode().split()[1], time.monotonic()))
+                status, extra, payload = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+                body = json.dumps(payload).encode()
+                head = f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                head += "".join(f"{k}: {v}\r\n" for k, v in extra.items())
+                writer.write(head.encode() + b"\r\n" + body)
+                await writer.drain()
+        finally:
+            writer.close()
+
+SENT = (200, {}, {"messages": [{"id": "wamid.sent"}]})
+
+@pytest.fixture
+def graph_at(monkeypatch):
+    """Point the module's shared client at a MockGraph."""
+    def graph_at(mock: MockGraph) -> GraphClient:
+        monkeypatch.setattr(whatsapp_cloud, "GRAPH_BASE", mock.base)
+        client = GraphClient()
+        monkeypatch.setattr(whatsapp_cloud, "graph", client)
+        return client
+    return graph_at
+
+def test_sends_reuse_one_connection(run, graph_at):
+    async def go():
+        async with MockGraph(SENT) as mock:
+            client = graph_at(mock)
+            try:
+                for i in range(5):
+                    assert (await send_text_message("P1", f"2010000000{i}", "hi"))["messages"][0]["id"] == "wamid.sent"
+            finally:
+                await client.aclose()
+        assert len(mock.requests) == 5
+        assert mock.connections == 1
+        assert {path for _, path, _ in mock.requests} == {"/v21.0/P1/messages"}
+    run(go)
+
+def test_retry_after_is_honoured(run, graph_at):
+    async def go():
+        async with MockGraph((429, {"Retry-After": "0.3"}, {"error": {}}), (503, {"Retry-After": "0.2"}, {"error": {}}), SENT) as mock:
+            client = graph_at(mock)
+            try:
+                res = await send_text_message("P1", "201000000000", "hi")
+            finally:
+                await client.aclose()
+        assert res["messages"][0]["id"] == "wamid.sent"
+        (_, _, first), (_, _, second), (_, _, third) = mock.requests
+        assert second - first >= 0.3
+        assert third - second >= 0.2
+        assert mock.connections == 1
+    run(go)
+
+def test_unsafe_errors_are_not_retried_for_sends(run, graph_at):
+    async def go():
+        async with MockGraph((500, {}, {"error": {}}), SENT) as mock:
+            client = graph_at(mock)
+            try:
+                with pytest.raises(httpx.HTTPStatusError):
+                    await send_text_message("P1", "201000000000", "hi")
+                # a GET is idempotent: the same answer is retried
+                mock.responses = [(500, {}, {"error": {}}), (200, {}, {"id": "media"})]
+                resp = await client.request("GET", "/v21.0/media", op="media_info")
+            finally:
+                await client.aclose()
+        assert resp.json() == {"id": "media"}
+        assert len(mock.requests) == 3
+    run(go)